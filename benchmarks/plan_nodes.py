@@ -0,0 +1,184 @@
+# ruff: noqa: INP001, T201
+"""
+Memory and time per node of mutation plans, `PlanNode` against the dicts plans used to be.
+
+Run from the repository root:
+
+    python benchmarks/plan_nodes.py [nodes]
+
+The first part builds and reads flat nodes shaped like the ones `rabbit_hole` plans for a
+nested create, once as dicts with the keys the planner used to set and once as `PlanNode`.
+The second part plans and schedules an actual input of that size with `rabbit_hole` and
+`plan_waves`.
+"""
+
+from __future__ import annotations
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.django_settings")
+
+import django
+
+django.setup()
+
+from strawberry_django_extras.functions import plan_waves, rabbit_hole  # noqa: E402
+from strawberry_django_extras.inputs import CRUDManyToOneCreateInput  # noqa: E402
+from strawberry_django_extras.plans import InstanceCache, PlanNode  # noqa: E402
+from tests.models import Author, Chapter  # noqa: E402
+from tests.schema import AuthorInput, BookInput, ChapterInput  # noqa: E402
+
+
+def dict_node(index):
+    node = {"data_id": "chapters", "rel_data_id": "book", "operation": "create"}
+    node.update({
+        "model": Chapter,
+        "before": [],
+        "after": [],
+        "data": {"title": f"Chapter {index}", "number": index},
+        "assignments": [],
+        "removals": [],
+        "deletions": [],
+        "set_manager": False,
+        "through_defaults": None,
+    })
+    return node
+
+
+def slot_node(index):
+    node = PlanNode("create", data_id="chapters", rel_data_id="book")
+    node.model = Chapter
+    node.data = {"title": f"Chapter {index}", "number": index}
+    return node
+
+
+def read_dict(node):
+    # What scheduling, batching and completing a leaf node used to look up
+    return (
+        node.get("before") or [],
+        node.get("after") or [],
+        node.get("operation"),
+        node.get("manager"),
+        node.get("m2m", False) is True,
+        node.get("model"),
+        any(node.get(key) for key in ("before", "after", "assignments", "removals", "deletions")),
+        node.get("is_generic_fk_target"),
+        node.get("set_manager", False),
+        node.get("data_id"),
+        node.get("assignments"),
+        node.get("generic_assignments"),
+        node.get("deletions"),
+        node.get("removals"),
+    )
+
+
+def read_slots(node):
+    return (
+        node.before,
+        node.after,
+        node.operation,
+        node.manager,
+        node.m2m,
+        node.model,
+        node.is_leaf,
+        node.target_ct,
+        node.set_manager,
+        node.data_id,
+        node.assignments,
+        node.generic_assignments,
+        node.deletions,
+        node.removals,
+    )
+
+
+def measure(build, count):
+    gc.collect()
+    start = time.perf_counter()
+    nodes = [build(index) for index in range(count)]
+    elapsed = time.perf_counter() - start
+    del nodes
+
+    gc.collect()
+    tracemalloc.start()
+    nodes = [build(index) for index in range(count)]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return nodes, elapsed, memory
+
+
+def time_reads(read, nodes):
+    start = time.perf_counter()
+    for node in nodes:
+        read(node)
+    return time.perf_counter() - start
+
+
+def author_input(count):
+    per_book = 10
+    return AuthorInput(
+        name="Author",
+        books=CRUDManyToOneCreateInput(
+            create=[
+                BookInput(
+                    title=f"Book {book}",
+                    chapters=CRUDManyToOneCreateInput(
+                        create=[
+                            ChapterInput(title=f"Chapter {number}", number=number)
+                            for number in range(per_book)
+                        ]
+                    ),
+                )
+                for book in range(max(count // (per_book + 1), 1))
+            ]
+        ),
+    )
+
+
+def main(count):
+    print(f"{count} nodes, per node:")
+    results = {}
+    for name, build, read in (("dict", dict_node, read_dict), ("PlanNode", slot_node, read_slots)):
+        nodes, build_time, memory = measure(build, count)
+        read_time = time_reads(read, nodes)
+        results[name] = memory
+        print(
+            f"  {name:<9} {memory / count:7.1f} B"
+            f"  build {build_time / count * 1e9:6.0f} ns"
+            f"  read {read_time / count * 1e9:6.0f} ns"
+        )
+        del nodes
+    print(f"  memory saved: {1 - results['PlanNode'] / results['dict']:.0%}")
+
+    _input = author_input(count)
+    gc.collect()
+    start = time.perf_counter()
+    rel = PlanNode()
+    rabbit_hole(Author, _input, rel, instances=InstanceCache())
+    planned = time.perf_counter() - start
+    waves = plan_waves(rel)
+    scheduled = time.perf_counter() - start - planned
+    del rel, waves
+
+    gc.collect()
+    tracemalloc.start()
+    rel = PlanNode()
+    rabbit_hole(Author, _input, rel, instances=InstanceCache())
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    nodes = sum(len(wave) for wave in plan_waves(rel))
+    print(f"rabbit_hole + plan_waves, {nodes} nodes, per node:")
+    print(
+        f"  {memory / nodes:7.1f} B"
+        f"  plan {planned / nodes * 1e6:5.1f} us"
+        f"  schedule {scheduled / nodes * 1e6:5.1f} us"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -16,3 +16,14 @@ class SDJExtrasError(Exception):
             message = self.default_message
 
         super().__init__(message)
+
+
+class MutationLimitError(SDJExtrasError):
+    """Raised when a mutation input exceeds the limits configured on its field."""
+
+    default_message = "Mutation input exceeds the allowed size"
+
+    def __init__(self, message=None, extensions=None):
+        super().__init__(message)
+        # Picked up by GraphQL as the extensions of the error
+        self.extensions = extensions or {}
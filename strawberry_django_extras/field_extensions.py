@@ -1,15 +1,35 @@
 from __future__ import annotations
 
+import inspect
+from contextvars import ContextVar, Token
 from typing import TYPE_CHECKING, Any
 
 import strawberry_django
-from asgiref.sync import sync_to_async
+from asgiref.sync import async_to_sync, sync_to_async
 from strawberry.extensions import FieldExtension
-from strawberry_django.optimizer import DjangoOptimizerExtension
+from strawberry_django.mutations.fields import DjangoCreateMutation
+from strawberry_django.optimizer import DjangoOptimizerExtension, optimize
 
 from .decorators import is_async, sync_or_async
-from .functions import check_permissions, kill_a_rabbit, perform_validation, rabbit_hole
-from .inputs import CRUDInput
+from .functions import (
+    aprefetch_assign_targets,
+    arun_hook_steps,
+    arun_input_hooks,
+    bulk_mode,
+    check_bulk_mode,
+    check_mutation_limits,
+    execute_mutation,
+    has_input_hooks,
+    input_hook_steps,
+    measure_input,
+    prefetch_assign_targets,
+    prefetch_missing,
+    raise_missing_targets,
+    run_hook_steps,
+    run_input_hooks,
+)
+from .instrumentation import aphase, phase, profiling
+from .plans import InstanceCache
 from .types import PaginatedList
 
 if TYPE_CHECKING:
@@ -19,10 +39,70 @@ if TYPE_CHECKING:
     from strawberry_django.fields.base import StrawberryDjangoFieldBase
     from strawberry_django.fields.field import StrawberryDjangoField
 
+    from .plans import MutationCost
+
+# The input of the mutation being resolved, see `mutation_cost`
+_measured: ContextVar[_Measurement | None] = ContextVar("measured", default=None)
+# The input whose checks an `InputChecks` of the field being resolved claimed
+_checked: ContextVar[Any] = ContextVar("checked", default=None)
+# The identity map of the mutation input being checked or written
+_instances: ContextVar[InstanceCache | None] = ContextVar("instances", default=None)
+
+
+class _Measurement:
+    """The input of the mutation being resolved, measured on first use."""
+
+    __slots__ = ("_cost", "model", "mutation_input")
+
+    def __init__(self, model, mutation_input):
+        self.model = model
+        self.mutation_input = mutation_input
+        self._cost: MutationCost | None = None
+
+    @property
+    def cost(self) -> MutationCost:
+        if self._cost is None:
+            self._cost = measure_input(self.model, self.mutation_input)
+        return self._cost
+
+
+def _measuring(model, mutation_input) -> Token[_Measurement | None]:
+    """Make `mutation_input` the one `mutation_cost()` measures, until the token is reset."""
+    measured = _measured.get()
+    if measured is None or measured.mutation_input is not mutation_input:
+        # Extensions of the same field share the measurement
+        measured = _Measurement(model, mutation_input)
+    return _measured.set(measured)
+
+
+def mutation_cost() -> MutationCost | None:
+    """
+    Return the cost of the mutation input being resolved, see `measure_input`.
+
+    Available to the hooks of `mutation_hooks()` on Django mutations and to anything running
+    inside of `with_cud_relationships()`. The input is measured on the first call.
+    """
+    measured = _measured.get()
+    return measured.cost if measured is not None else None
+
+
+def mutation_instances() -> InstanceCache | None:
+    """
+    Return the identity map of the mutation input being checked or written.
+
+    When the input has validation or permission hooks, every object it updates, removes or
+    assigns is loaded up front with one query per model, so hooks get them from `peek()` or
+    `get()` without a query of their own and planning reuses them. Available to the hooks
+    of `with_validation()` and `with_permissions()` and to anything running inside of
+    `with_cud_relationships()`.
+    """
+    return _instances.get()
+
 
 # noinspection PyUnresolvedReferences,PyPropertyAccess
 class MutationHooks(FieldExtension):
     argument_name: str
+    django_model = None
 
     # noinspection PyUnresolvedReferences
     def __init__(
@@ -41,17 +121,31 @@ class MutationHooks(FieldExtension):
         if is_async():
             field.is_async = True
         self.argument_name = field.argument_name  # pyright: ignore[reportAttributeAccessIssue]
+        self.django_model = getattr(field, "django_model", None)
+
+    def measure(self, mutation_input) -> Token[_Measurement | None] | None:
+        # Lets the hooks read `mutation_cost()`
+        if self.django_model is not None and mutation_input is not None:
+            return _measuring(self.django_model, mutation_input)
+        return None
 
     if not is_async():
 
         def resolve(self, next_, source, info, **kwargs):
-            if self.pre:
-                self.pre(info, kwargs.get(self.argument_name))
-
-            result = next_(source, info, **kwargs)
-
-            if self.post:
-                self.post(info, kwargs.get(self.argument_name), result)
+            token = self.measure(kwargs.get(self.argument_name))
+            try:
+                if self.pre:
+                    with phase(info, "hooks"):
+                        self.pre(info, kwargs.get(self.argument_name))
+
+                result = next_(source, info, **kwargs)
+
+                if self.post:
+                    with phase(info, "hooks"):
+                        self.post(info, kwargs.get(self.argument_name), result)
+            finally:
+                if token is not None:
+                    _measured.reset(token)
             return result
 
     else:
@@ -63,42 +157,105 @@ class MutationHooks(FieldExtension):
             info: Info,
             **kwargs: Any,
         ) -> Any:
-            if self.pre_async:
-                await self.pre_async(info, kwargs.get(self.argument_name))
-            elif self.pre:
-                await sync_or_async(self.pre)(info, kwargs.get(self.argument_name))  # pyright: ignore[reportCallIssue]
-
-            result = await next_(source, info, **kwargs)
-
-            if self.post_async:
-                await self.post_async(info, kwargs.get(self.argument_name), result)
-            elif self.post:
-                await sync_or_async(self.post)(info, kwargs.get(self.argument_name), result)  # pyright: ignore[reportCallIssue]
-
+            token = self.measure(kwargs.get(self.argument_name))
+            try:
+                if self.pre_async:
+                    async with aphase(info, "hooks"):
+                        await self.pre_async(info, kwargs.get(self.argument_name))
+                elif self.pre:
+                    async with aphase(info, "hooks"):
+                        await sync_or_async(self.pre)(info, kwargs.get(self.argument_name))  # pyright: ignore[reportCallIssue]
+
+                result = await next_(source, info, **kwargs)
+
+                if self.post_async:
+                    async with aphase(info, "hooks"):
+                        await self.post_async(info, kwargs.get(self.argument_name), result)
+                elif self.post:
+                    async with aphase(info, "hooks"):
+                        await sync_or_async(self.post)(  # pyright: ignore[reportCallIssue]
+                            info, kwargs.get(self.argument_name), result
+                        )
+            finally:
+                if token is not None:
+                    _measured.reset(token)
             return result
 
 
 # noinspection PyPropertyAccess
-class Validators(FieldExtension):
+class InputChecks(FieldExtension):
+    """
+    Base of the extensions calling hooks of the mutation input, see `run_input_hooks`.
+
+    However they are stacked, the checks of all the extensions of a field are collected in a
+    single walk of the input and every permission check runs before any validator: right
+    before planning when the
+    field has `with_cud_relationships()`, in the same thread hop as its writes, otherwise
+    when the first of them resolves. In async mode coroutine hooks are awaited concurrently
+    with the others of the same depth, see `arun_hook_steps`.
+    """
+
     argument_name: str
+    kind: str
+    checks: tuple[str, ...] = ()
+    deferred = False
+    django_model = None
 
     def __init__(
         self,
+        concurrency: int | None = None,
         **kwargs,
     ):
         super().__init__(**kwargs)
+        self.concurrency = concurrency
 
     def apply(self, field: StrawberryDjangoField) -> None:  # pyright: ignore[reportIncompatibleMethodOverride]
         if is_async():
             field.is_async = True
         self.argument_name = field.argument_name  # pyright: ignore[reportAttributeAccessIssue]
+        self.django_model = getattr(field, "django_model", None)
+        self.checks, self.concurrency = _input_checks(field)
+        self.deferred = any(isinstance(e, Relationships) for e in field.extensions)
+
+    def claim(self, mutation_input) -> Token[Any] | None:
+        """
+        Claim the checks of `mutation_input` when they are left to this extension.
+
+        Return the token to reset once the field is resolved, `None` when the checks are left
+        to another extension.
+        """
+        if self.deferred or _checked.get() is mutation_input:
+            return None
+        return _checked.set(mutation_input)
 
     if not is_async():
 
         def resolve(self, next_, source, info, **kwargs):
             mutation_input = kwargs.get(self.argument_name)
-            perform_validation(mutation_input, info)
-            return next_(source, info, **kwargs)
+            claimed = self.claim(mutation_input)
+            if claimed is None:
+                return next_(source, info, **kwargs)
+
+            instances = InstanceCache()
+            token = _instances.set(instances)
+            try:
+                if self.django_model is not None and _has_hooks(mutation_input, self.checks):
+                    with phase(info, "planning"):
+                        prefetch_assign_targets(
+                            self.django_model,
+                            mutation_input,
+                            instances,
+                            referenced=True,
+                            strict=False,
+                        )
+                _run_checks(mutation_input, info, self.checks)
+            finally:
+                _instances.reset(token)
+            # The extensions stacked inside of this one leave the checks to it
+            try:
+                return next_(source, info, **kwargs)
+            finally:
+                _checked.reset(claimed)
 
     else:
 
@@ -110,86 +267,196 @@ class Validators(FieldExtension):
             **kwargs: Any,
         ) -> Any:
             mutation_input = kwargs.get(self.argument_name)
-            await sync_to_async(perform_validation)(mutation_input, info)
-            return await next_(source, info, **kwargs)
+            claimed = self.claim(mutation_input)
+            if claimed is None:
+                return await next_(source, info, **kwargs)
+
+            instances = InstanceCache()
+            token = _instances.set(instances)
+            try:
+                if self.django_model is not None and _has_hooks(mutation_input, self.checks):
+                    async with aphase(info, "planning"):
+                        await aprefetch_assign_targets(
+                            self.django_model,
+                            mutation_input,
+                            instances,
+                            referenced=True,
+                            strict=False,
+                        )
+                await arun_input_hooks(
+                    mutation_input,
+                    info,
+                    *self.checks,
+                    timed=profiling(),
+                    concurrency=self.concurrency,
+                )
+            finally:
+                _instances.reset(token)
+            # The extensions stacked inside of this one leave the checks to it
+            try:
+                return await next_(source, info, **kwargs)
+            finally:
+                _checked.reset(claimed)
 
 
 # noinspection PyPropertyAccess
-class Permissions(FieldExtension):
-    argument_name: str
+class Validators(InputChecks):
+    kind = "validate"
 
-    def __init__(
-        self,
-        **kwargs,
-    ):
-        super().__init__(**kwargs)
 
-    def apply(self, field: StrawberryDjangoField) -> None:  # pyright: ignore[reportIncompatibleMethodOverride]
-        if is_async():
-            field.is_async = True
-        self.argument_name = field.argument_name  # pyright: ignore[reportAttributeAccessIssue]
+# noinspection PyPropertyAccess
+class Permissions(InputChecks):
+    kind = "check_permissions"
 
-    if not is_async():
 
-        def resolve(self, next_, source, info, **kwargs):
-            mutation_input = kwargs.get(self.argument_name)
-            check_permissions(mutation_input, info)
-            return next_(source, info, **kwargs)
+def _input_checks(field) -> tuple[tuple[str, ...], int | None]:
+    """Return the kinds of hooks the field's `InputChecks` call and their concurrency cap."""
+    extensions = [e for e in field.extensions if isinstance(e, InputChecks)]
+    kinds = {e.kind for e in extensions}
+    caps = [e.concurrency for e in extensions if e.concurrency]
+    return (
+        tuple(kind for kind in ("check_permissions", "validate") if kind in kinds),
+        min(caps, default=None),
+    )
 
-    else:
 
-        async def resolve_async(
-            self,
-            next_: Callable[..., Awaitable[Any]],
-            source: Any,
-            info: Info,
-            **kwargs: Any,
-        ) -> Any:
-            mutation_input = kwargs.get(self.argument_name)
-            await sync_to_async(check_permissions)(mutation_input, info)
-            return await next_(source, info, **kwargs)
+def _run_checks(mutation_input, info, checks) -> None:
+    run_input_hooks(mutation_input, info, *checks, timed=profiling())
+
+
+def _has_hooks(mutation_input, checks) -> bool:
+    # Objects referenced by the input are only preloaded for hooks that may look them up
+    return bool(checks) and has_input_hooks(mutation_input, *checks)
+
+
+async def _await(awaitable):
+    return await awaitable
+
+
+def _in_thread(next_):
+    """
+    Wrap the `next_` of an async field to be called from a worker thread.
+
+    The extensions stacked inside of `with_cud_relationships()` resolve asynchronously,
+    their result is awaited on the event loop while the thread waits for it.
+    """
+
+    def resolve(*args, **kwargs):
+        resolved = next_(*args, **kwargs)
+        if inspect.isawaitable(resolved):
+            return async_to_sync(_await)(resolved)
+        return resolved
+
+    return resolve
 
 
 # noinspection PyPropertyAccess
 class Relationships(FieldExtension):
     root_field: StrawberryDjangoFieldBase | None = None
     argument_name: str
+    checks: tuple[str, ...] = ()
+    concurrency: int | None = None
 
-    def __init__(
+    def __init__(  # noqa: PLR0913, PLR0917
         self,
+        savepoints: bool = True,
+        max_nodes: int | None = None,
+        max_depth: int | None = None,
+        max_statements: int | None = None,
+        batch_size: int | None = None,
+        bulk: str = "auto",
         **kwargs,
     ):
         super().__init__(**kwargs)
+        check_bulk_mode(bulk)
+        self.savepoints = savepoints
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.max_statements = max_statements
+        self.batch_size = batch_size
+        self.bulk = bulk
 
     def apply(self, field: StrawberryDjangoField) -> None:  # pyright: ignore[reportIncompatibleMethodOverride]
         self.root_field = field
         if is_async():
             field.is_async = True
         self.argument_name = field.argument_name  # pyright: ignore[reportAttributeAccessIssue]
+        # Run here on behalf of the field's `InputChecks`
+        self.checks, self.concurrency = _input_checks(field)
+
+    @property
+    def creates(self) -> bool:
+        return isinstance(self.root_field, DjangoCreateMutation)
+
+    def check_limits(self, model, mutation_input) -> None:
+        """Reject inputs exceeding the configured limits, before any query is made."""
+        if self.max_nodes is None and self.max_depth is None and self.max_statements is None:
+            return
+        measured = _measured.get()
+        if measured is None or measured.mutation_input is not mutation_input:
+            measured = _Measurement(model, mutation_input)
+        check_mutation_limits(
+            measured.cost,
+            max_nodes=self.max_nodes,
+            max_depth=self.max_depth,
+            max_statements=self.max_statements,
+        )
+
+    def refetch(self, resolved, info):
+        """
+        Load the written objects again through the optimizer, once all writes are done.
+
+        The writes run with the optimizer disabled, so the mutation's own refetch is skipped
+        and the response would otherwise be resolved with one query per nested relation.
+        Created objects are kept as they are, their relations primed while executing the plan
+        are not fetched again and only the rest of the selection is prefetched.
+        """
+        if resolved is None or not DjangoOptimizerExtension.enabled.get():
+            return resolved
+
+        with phase(info, "response"):
+            if self.creates:
+                objs = resolved if isinstance(resolved, list) else [resolved]
+                if objs:
+                    queryset = optimize(type(objs[0])._default_manager.all(), info=info)  # noqa: SLF001
+                    prefetch_missing(objs, queryset._prefetch_related_lookups)  # noqa: SLF001
+                return resolved
+
+            refetch = getattr(self.root_field, "refetch", None)
+            if refetch is None:
+                return resolved
+            return refetch(resolved, info=info)
 
     if not is_async():
 
         def resolve(self, next_, source, info, **kwargs):
             mutation_input = kwargs.get(self.argument_name)
             model = self.root_field.django_model  # pyright: ignore[reportOptionalMemberAccess]
-            rel = {}
-            rabbit_hole(model, mutation_input, rel)
-            for k, v in mutation_input.__dict__.copy().items():
-                if isinstance(v, CRUDInput):
-                    delattr(mutation_input, k)
-
-            with DjangoOptimizerExtension.disabled():
-                return kill_a_rabbit(
-                    rel,
-                    None,
-                    False,
-                    is_root=True,
-                    next_=next_,
-                    source=source,
-                    info=info,
-                    ni=mutation_input,
-                    argument_name=self.argument_name,
-                )
+            measured = _measuring(model, mutation_input)
+            instances = InstanceCache(self.batch_size)
+            token = _instances.set(instances)
+            try:
+                self.check_limits(model, mutation_input)
+                with phase(info, "planning"):
+                    missing = prefetch_assign_targets(
+                        model,
+                        mutation_input,
+                        instances,
+                        referenced=_has_hooks(mutation_input, self.checks),
+                        strict=False,
+                    )
+                if self.checks:
+                    _run_checks(mutation_input, info, self.checks)
+                # Unauthorized inputs are rejected before telling which objects exist
+                raise_missing_targets(missing)
+                with bulk_mode(self.bulk), DjangoOptimizerExtension.disabled():
+                    resolved = self.execute(
+                        model, mutation_input, next_, source, info, instances, prefetched=True
+                    )
+            finally:
+                _instances.reset(token)
+                _measured.reset(measured)
+            return self.refetch(resolved, info)
 
     else:
         # noinspection PyArgumentList
@@ -202,24 +469,79 @@ class Relationships(FieldExtension):
         ) -> Any:
             mutation_input = kwargs.get(self.argument_name)
             model = self.root_field.django_model  # pyright: ignore[reportOptionalMemberAccess]
-            rel = {}
-            await sync_to_async(rabbit_hole)(model, mutation_input, rel, None)
-            for k, v in mutation_input.__dict__.copy().items():
-                if isinstance(v, CRUDInput):
-                    delattr(mutation_input, k)
-
-            with await sync_to_async(DjangoOptimizerExtension.disabled)():
-                return await sync_to_async(kill_a_rabbit, thread_sensitive=False)(
-                    rel,
-                    None,
-                    False,
-                    is_root=True,
-                    next_=next_,
-                    source=source,
-                    info=info,
-                    ni=mutation_input,
-                    argument_name=self.argument_name,
+            measured = _measuring(model, mutation_input)
+            instances = InstanceCache(self.batch_size)
+            token = _instances.set(instances)
+            try:
+                self.check_limits(model, mutation_input)
+                steps = input_hook_steps(mutation_input, *self.checks) if self.checks else []
+                awaitable = any(call.awaitable for _, calls in steps for call in calls)
+                prefetched = awaitable or not steps
+                if prefetched:
+                    # Reads happen outside of the transaction and don't need to hold a worker
+                    # thread, unless the input has to be checked in one first
+                    async with aphase(info, "planning"):
+                        missing = await aprefetch_assign_targets(
+                            model, mutation_input, instances, referenced=bool(steps), strict=False
+                        )
+                    if awaitable:
+                        # Coroutine hooks are awaited here, concurrently
+                        await arun_hook_steps(
+                            steps, info, timed=profiling(), concurrency=self.concurrency
+                        )
+                        steps = []
+                    raise_missing_targets(missing)
+
+                # Sync checks, planning and the transactional writes share one thread hop
+                with (
+                    bulk_mode(self.bulk),
+                    await sync_to_async(DjangoOptimizerExtension.disabled)(),
+                ):
+                    resolved = await sync_to_async(self.execute, thread_sensitive=False)(
+                        model,
+                        mutation_input,
+                        _in_thread(next_),
+                        source,
+                        info,
+                        instances,
+                        steps=steps,
+                        prefetched=prefetched,
+                    )
+            finally:
+                _instances.reset(token)
+                _measured.reset(measured)
+            return await sync_to_async(self.refetch)(resolved, info)
+
+    def execute(  # noqa: PLR0913, PLR0917
+        self, model, mutation_input, next_, source, info, instances, steps=(), prefetched=False
+    ):
+        """
+        Load the objects the input refers to unless `prefetched`, run the hook steps left to
+        check it, see `input_hook_steps`, then plan and execute its writes, see
+        `execute_mutation`.
+        """
+        missing = {}
+        if not prefetched:
+            with phase(info, "planning"):
+                missing = prefetch_assign_targets(
+                    model, mutation_input, instances, referenced=bool(steps), strict=False
                 )
+        if steps:
+            run_hook_steps(steps, info, timed=profiling())
+        raise_missing_targets(missing)
+
+        return execute_mutation(
+            model,
+            mutation_input,
+            next_,
+            source,
+            info,
+            argument_name=self.argument_name,
+            instances=instances,
+            savepoints=self.savepoints,
+            created=self.creates,
+            batch_size=self.batch_size,
+        )
 
 
 # noinspection PyPropertyAccess
@@ -292,19 +614,58 @@ def mutation_hooks(
     return MutationHooks(pre, post, pre_async, post_async)
 
 
-def with_validation():
-    """Create a Validators extension."""
-    return Validators()
+def with_validation(concurrency: int | None = None):
+    """
+    Create a Validators extension.
+
+    In async mode coroutine validators of inputs at the same depth are awaited concurrently,
+    at most `concurrency` at a time when it is set.
+    """
+    return Validators(concurrency=concurrency)
 
 
-def with_permissions():
-    """Create a Permissions extension."""
-    return Permissions()
+def with_permissions(concurrency: int | None = None):
+    """
+    Create a Permissions extension.
 
+    In async mode coroutine permission checks of inputs at the same depth are awaited
+    concurrently, at most `concurrency` at a time when it is set.
+    """
+    return Permissions(concurrency=concurrency)
 
-def with_cud_relationships():
-    """Create a Relationships extension."""
-    return Relationships()
+
+def with_cud_relationships(  # noqa: PLR0913, PLR0917
+    savepoints: bool = True,
+    max_nodes: int | None = None,
+    max_depth: int | None = None,
+    max_statements: int | None = None,
+    batch_size: int | None = None,
+    bulk: str = "auto",
+):
+    """
+    Create a Relationships extension.
+
+    Pass `savepoints=False` to execute the nested writes in a single transaction
+    without a savepoint per nested object.
+
+    `max_nodes`, `max_depth` and `max_statements` reject inputs whose cost, as measured
+    by `measure_input`, exceeds them with a `MutationLimitError`.
+
+    `batch_size` bounds the number of rows a single statement writes or loads, large
+    relation lists being executed in chunks of that size.
+
+    `bulk` picks how rows are written, see `bulk_mode`: "auto" uses bulk statements only for
+    models without `save()`/`delete()` overrides or receivers of the signals they would skip,
+    "always" uses them regardless and "never" writes every row with its own `save()`.
+    """
+    return Relationships(
+        savepoints=savepoints,
+        max_nodes=max_nodes,
+        max_depth=max_depth,
+        max_statements=max_statements,
+        batch_size=batch_size,
+        bulk=bulk,
+    )
 
 
 def with_total_count():
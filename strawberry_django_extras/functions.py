@@ -1,22 +1,25 @@
 from __future__ import annotations
 
-from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
+import asyncio
+import inspect
+import json
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import cache
+
+import django
+from asgiref.sync import async_to_sync, sync_to_async
 from django.contrib.contenttypes.models import ContentType
-from django.db import models, transaction
-from django.db.models.fields.related import (
-    ForeignKey,
-    ManyToManyField,
-    ManyToManyRel,
-    ManyToOneRel,
-    OneToOneField,
-    OneToOneRel,
-)
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, models, router, transaction
+from django.db.models import Prefetch, Q, prefetch_related_objects
+from django.db.models.fields.related_descriptors import ReverseOneToOneDescriptor
 from strawberry import UNSET
-from strawberry.utils.str_converters import to_camel_case
-from strawberry_django.utils.inspect import get_model_fields
+from strawberry_django.queryset import get_queryset_config
 
-from .exceptions import SDJExtrasError
+from .exceptions import MutationLimitError, SDJExtrasError
 from .inputs import (
+    CRUDInput,
     CRUDManyToManyCreateInput,
     CRUDManyToManyUpdateInput,
     CRUDManyToOneCreateInput,
@@ -26,240 +29,1165 @@ from .inputs import (
     CRUDOneToOneCreateInput,
     CRUDOneToOneUpdateInput,
 )
+from .instrumentation import aphase, phase
+from .plans import (
+    FOREIGN_KEY,
+    GENERIC_FK,
+    GENERIC_RELATION,
+    MANY_TO_MANY,
+    MANY_TO_ONE,
+    ONE_TO_ONE,
+    ONE_TO_ONE_REL,
+    HookCall,
+    InstanceCache,
+    MutationCost,
+    PlanNode,
+    get_input_hooks,
+    get_plan_template,
+    input_hook,
+)
 
+BULK_MODES = ("auto", "always", "never")
+
+# How the writes of the mutation being executed choose between bulk and per row statements
+_bulk_mode: ContextVar[str] = ContextVar("bulk_mode", default="auto")
+
+
+def check_bulk_mode(mode: str) -> None:
+    if mode not in BULK_MODES:
+        raise SDJExtrasError(f"Unknown bulk mode {mode!r}, expected one of {', '.join(BULK_MODES)}")
+
+
+@contextmanager
+def bulk_mode(mode: str):
+    """
+    Choose how the writes executed inside the block pick bulk statements.
+
+    "auto" uses them only where they preserve what per row writes do, "always" wherever the
+    backend and the relation allow it and "never" writes row by row.
+    """
+    check_bulk_mode(mode)
+    token = _bulk_mode.set(mode)
+    try:
+        yield
+    finally:
+        _bulk_mode.reset(token)
+
+
+def _has_save_receivers(model) -> bool:
+    return models.signals.pre_save.has_listeners(model) or models.signals.post_save.has_listeners(
+        model
+    )
+
+
+@cache
+def _overrides(model, name) -> bool:
+    # Whether the model or one of its bases replaces `Model.<name>`, fixed once classes exist
+    return getattr(model, name) is not getattr(models.Model, name)
+
+
+def can_bulk_save(model) -> bool:
+    """
+    Whether rows of `model` may be updated with `bulk_update` or `QuerySet.update()`.
+
+    Both skip `save()` as well as `pre_save`/`post_save`, so in "auto" mode models overriding
+    the former or having receivers for the latter are saved one by one. Overrides are looked
+    up once per model and Django caches the receivers of model signals per sender.
+    """
+    mode = _bulk_mode.get()
+    if mode != "auto":
+        return mode == "always"
+    return not (_overrides(model, "save") or _has_save_receivers(model))
+
+
+def can_bulk_create(model) -> bool:
+    """
+    Whether rows of `model` may be inserted with `bulk_create`.
+
+    On top of what `can_bulk_save` requires, `bulk_create` does not support multi-table
+    inheritance, whatever the mode.
+    """
+    return not model._meta.parents and can_bulk_save(model)  # noqa: SLF001
 
-@transaction.atomic
-def kill_a_rabbit(  # noqa: PLR0912, PLR0913, PLR0915, PLR0917
-    data,
-    caller_data,
-    is_before=True,
-    is_root: bool = False,
-    next_=None,
-    source=None,
-    info=None,
-    ni=None,
-    argument_name="data",
-):
-    if data.get("before"):
-        for item in data.get("before"):
-            kill_a_rabbit(item, data)
 
+def can_bulk_delete(model) -> bool:
+    """
+    Whether rows of `model` may be deleted with `QuerySet.delete()`.
+
+    The delete collector sends the delete signals and cascades, but never calls `delete()`
+    on the objects, so in "auto" mode models overriding it are deleted one by one.
+    """
+    mode = _bulk_mode.get()
+    if mode != "auto":
+        return mode == "always"
+    return not _overrides(model, "delete")
+
+
+def _update_rows(model, q, values) -> int:
+    """Set `values` on the rows matching `q` and return how many there were."""
+    if can_bulk_save(model):
+        return model.objects.filter(q).update(**values)
+
+    objs = list(model.objects.filter(q))
+    for obj in objs:
+        for name, value in values.items():
+            setattr(obj, name, value)
+        obj.save(update_fields=list(values))
+    return len(objs)
+
+
+def _delete_rows(model, q) -> None:
+    if can_bulk_delete(model):
+        model.objects.filter(q).delete()
+        return
+
+    for obj in model.objects.filter(q):
+        obj.delete()
+
+
+def _can_bulk_create_node(node, *, needs_pk: bool) -> bool:
+    model = node.model
+    if not can_bulk_create(model):
+        return False
+
+    return (
+        not needs_pk
+        or connections[router.db_for_write(model)].features.can_return_rows_from_bulk_insert
+    )
+
+
+def _batch_key(node, *, is_before: bool = False):  # noqa: PLR0911
+    """Return the key grouping `node` with the other nodes of its wave, None if it runs alone."""
+    operation = node.operation
+    manager = node.manager
+    if operation == "update":
+        return "update", node.model, id(manager), node.m2m
+
+    if operation == "upsert":
+        return "upsert", node.model, upsert_fields(node), tuple(sorted(node.data))
+
+    if node.m2m:
+        if operation == "assign":
+            return "m2m_assign", id(manager)
+        # Created objects can only be linked once their primary key is known
+        if operation == "create" and _can_bulk_create_node(node, needs_pk=True):
+            return "m2m_create", node.model
+        return None
+
+    # The parent needs the primary key of a "before" node, and so do the children of any node
+    needs_pk = is_before or not node.is_leaf
+    if operation == "create" and _can_bulk_create_node(node, needs_pk=needs_pk):
+        return "create", node.model
+    return None
+
+
+def bulk_create_nodes(nodes, instances) -> None:
+    """Insert the rows of sibling create nodes of a single model with one `bulk_create`."""
+    model = nodes[0].model
+    objs = model.objects.bulk_create([model(**node.data) for node in nodes])
+    for node, obj in zip(nodes, objs, strict=True):
+        node.instance = obj
+        if obj.pk is not None:
+            instances.add(obj)
+
+
+def _unique_field_sets(model):
+    meta = model._meta  # noqa: SLF001
+    for field in meta.concrete_fields:
+        if field.unique and not field.primary_key:
+            yield (field.name,)
+    for fields in meta.unique_together:
+        yield tuple(fields)
+    for constraint in meta.total_unique_constraints:
+        yield tuple(constraint.fields)
+
+
+def upsert_fields(node) -> tuple[str, ...]:
+    """
+    Return the fields identifying the row an upsert node writes to.
+
+    These are the `upsert_fields` declared on its input class, or else the first unique
+    field set of the model the input provides values for.
+    """
+    declared = node.upsert_fields
+    if declared:
+        return tuple(declared)
+
+    model = node.model
+    data = node.data
+    for fields in _unique_field_sets(model):
+        if all(name in data for name in fields):
+            return fields
+
+    raise SDJExtrasError(
+        f"Cannot upsert {model.__name__}: the input provides no unique field set, declare"
+        " `upsert_fields` on the input class"
+    )
+
+
+def _can_bulk_upsert(model, unique_fields) -> bool:
+    features = connections[router.db_for_write(model)].features
+    return (
+        can_bulk_create(model)
+        and features.supports_update_conflicts_with_target
+        # Without returned rows the primary keys of updated rows would be unknown, Django
+        # only sets them on the objects of an `update_conflicts` bulk create since 5.0
+        and features.can_return_rows_from_bulk_insert
+        and django.VERSION >= (5, 0)
+        # ON CONFLICT needs an actual constraint on these fields
+        and set(unique_fields) in (set(fields) for fields in _unique_field_sets(model))
+    )
+
+
+def upsert_nodes(nodes, instances) -> None:
+    """
+    Create or update the rows of sibling upsert nodes of a single model, matched on their
+    `upsert_fields`.
+
+    Where the backend supports it this is a single `bulk_create(update_conflicts=True)`,
+    elsewhere the existing rows are selected with one query and the rest created.
+    """
+    node = nodes[0]
+    model = node.model
+    meta = model._meta  # noqa: SLF001
+    unique_fields = upsert_fields(node)
+    attnames = [meta.get_field(name).attname for name in unique_fields]
+
+    # Nodes upserting the same row share it, the last one wins
+    rows = {}
+    for item in nodes:
+        obj = model(**item.data)
+        key = tuple(getattr(obj, attname) for attname in attnames)
+        rows[key] = (obj, [*rows.get(key, (None, []))[1], item])
+
+    if _can_bulk_upsert(model, unique_fields):
+        update_fields = [
+            name
+            for name in node.data
+            if name not in unique_fields and meta.get_field(name).concrete
+        ]
+        objs = model.objects.bulk_create(
+            [obj for obj, _ in rows.values()],
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=update_fields or unique_fields,
+        )
+    else:
+        existing = {}
+        ops = connections[router.db_for_write(model)].ops
+        for chunk in _chunks(rows, max(ops.bulk_batch_size(attnames, list(rows)), 1)):
+            query = Q()
+            for key in chunk:
+                query |= Q(**dict(zip(attnames, key, strict=True)))
+            for obj in model.objects.filter(query):
+                existing[tuple(getattr(obj, attname) for attname in attnames)] = obj
+
+        save_changes(
+            model,
+            [
+                (existing[key], items[-1].data)
+                for key, (_, items) in rows.items()
+                if key in existing
+            ],
+        )
+        missing = [obj for key, (obj, _) in rows.items() if key not in existing]
+        if missing and _can_bulk_create_node(node, needs_pk=True):
+            model.objects.bulk_create(missing)
+        else:
+            for obj in missing:
+                obj.save(force_insert=True)
+        objs = [existing.get(key, obj) for key, (obj, _) in rows.items()]
+
+    for obj, (_, items) in zip(objs, rows.values(), strict=True):
+        instances.add(obj)
+        for item in items:
+            item.instance = obj
+
+
+def _through_defaults_key(through_defaults):
+    if not through_defaults:
+        return None
+    return json.dumps(through_defaults, sort_keys=True, default=str)
+
+
+def _can_bulk_link(manager) -> bool:
+    # `add()` mirrors symmetrical relations and sends `m2m_changed`, raw through rows do neither
+    if getattr(manager, "symmetrical", False):
+        return False
+    mode = _bulk_mode.get()
+    if mode != "auto":
+        return mode == "always"
+    return not models.signals.m2m_changed.has_listeners(manager.through)
+
+
+def _bulk_link(manager, links) -> None:
+    through = manager.through
+    db = router.db_for_write(through, instance=manager.instance)
+    source_id = manager.related_val[0]
+    target_attname = manager.target_field.attname
+    existing = set(
+        through._default_manager.using(db)  # noqa: SLF001
+        .filter(**{
+            manager.source_field_name: source_id,
+            f"{manager.target_field_name}__in": [pk for pk, _ in links],
+        })
+        .values_list(target_attname, flat=True)
+    )
+    through._default_manager.using(db).bulk_create([  # noqa: SLF001
+        through(**(through_defaults or {}), **{
+            manager.source_field.attname: source_id,
+            target_attname: pk,
+        })
+        for pk, through_defaults in links
+        if pk not in existing
+    ])
+
+
+def link_m2m(manager, links, batch_size=None) -> None:
+    """
+    Link `(pk, through_defaults)` pairs to the owner of a many to many manager.
+
+    Links sharing the same through defaults are added with a single `add(*pks)`. When the
+    defaults differ between rows the through rows are bulk inserted at once instead, as long
+    as the relation does not depend on what `add()` does on top of that. With a `batch_size`
+    at most that many links are written at a time.
+    """
+    pk_field = manager.model._meta.pk  # noqa: SLF001
+    groups = {}
+    seen = set()
+    for pk, through_defaults in links:
+        pk = pk_field.to_python(pk)  # noqa: PLW2901
+        if pk in seen:
+            continue
+        seen.add(pk)
+        key = _through_defaults_key(through_defaults)
+        groups.setdefault(key, (through_defaults, []))[1].append(pk)
+
+    if len(groups) > 1 and _can_bulk_link(manager):
+        pairs = [(pk, defaults) for defaults, pks in groups.values() for pk in pks]
+        for chunk in _chunks(pairs, batch_size):
+            _bulk_link(manager, chunk)
+        return
+
+    for through_defaults, pks in groups.values():
+        for chunk in _chunks(pks, batch_size):
+            manager.add(*chunk, through_defaults=through_defaults)
+
+
+def apply_changes(obj, data) -> list[str] | None:
+    """
+    Set `data` on `obj` and return the names of the fields whose value actually changed.
+
+    Returns None when some key is not a concrete field, in which case nothing short of a full
+    `save()` is known to persist it.
+    """
+    meta = obj._meta  # noqa: SLF001
+    changed = []
+    full_save = False
+    for key, value in data.items():
+        try:
+            field = meta.get_field(key)
+        except FieldDoesNotExist:
+            field = None
+
+        if field is None or not field.concrete:
+            setattr(obj, key, value)
+            full_save = True
+            continue
+
+        # The instance was loaded by its primary key
+        if field.primary_key:
+            continue
+
+        previous = field.value_from_object(obj)
+        setattr(obj, key, value)
+        if field.value_from_object(obj) != previous and field.name not in changed:
+            changed.append(field.name)
+
+    if full_save:
+        return None
+
+    if changed:
+        # A plain save() would have refreshed these as well
+        for field in meta.concrete_fields:
+            if getattr(field, "auto_now", False) and field.name not in changed:
+                field.pre_save(obj, add=False)
+                changed.append(field.name)
+
+    return changed
+
+
+def save_changes(model, rows) -> None:
+    """
+    Apply `(obj, data)` rows to their loaded instances and write only what changed.
+
+    Rows without any effective change are skipped. Models with `pre_save`/`post_save`
+    receivers are saved one by one with `update_fields`, other rows are grouped by their
+    changed fields and written with a single `UPDATE` or `bulk_update` per group.
+    """
+    bulk = can_bulk_save(model)
+    meta = model._meta  # noqa: SLF001
+    by_fields = {}
+    for obj, data in rows:
+        changed = apply_changes(obj, data)
+        if changed is None:
+            obj.save()
+        elif not changed:
+            continue
+        elif not bulk:
+            obj.save(update_fields=changed)
+        else:
+            by_fields.setdefault(tuple(changed), []).append(obj)
+
+    for fields, objs in by_fields.items():
+        if len(objs) == 1:
+            attnames = [meta.get_field(name).attname for name in fields]
+            model.objects.filter(pk=objs[0].pk).update(**{
+                attname: getattr(objs[0], attname) for attname in attnames
+            })
+        else:
+            model.objects.bulk_update(objs, fields)
+
+
+def _update_through_rows(manager, owner, rows) -> None:
+    # TODO: Check if this works for SYMMETRICAL m2m
+    rows = [(obj, through_defaults) for obj, through_defaults in rows if through_defaults]
+    if not rows or not hasattr(manager, "through"):
+        return
+
+    through = manager.through
+    target_attname = manager.target_field.attname
+    links = {
+        getattr(link, target_attname): link
+        for link in through.objects.filter(**{
+            manager.source_field_name: owner,
+            f"{manager.target_field_name}__in": [obj.pk for obj, _ in rows],
+        })
+    }
+    if any(obj.pk not in links for obj, _ in rows):
+        raise through.DoesNotExist(f"{through.__name__} matching query does not exist.")
+
+    save_changes(through, [(links[obj.pk], through_defaults) for obj, through_defaults in rows])
+
+
+def membership_diff(manager, pks):
+    """
+    Compare the objects related through `manager` to the wanted `pks` with one query.
+
+    Returns the pks to add and the pks to remove, in this order.
+    """
+    pk_field = manager.model._meta.pk  # noqa: SLF001
+    wanted = list(dict.fromkeys(pk_field.to_python(pk) for pk in pks))
+    current = set(manager.values_list("pk", flat=True))
+    return (
+        [pk for pk in wanted if pk not in current],
+        sorted(current.difference(wanted)),
+    )
+
+
+def update_nodes(nodes, instances) -> None:
+    """Load and update the targets of sibling update nodes sharing a batch key together."""
+    node = nodes[0]
+    manager = node.manager
+    if node.m2m:
+        objs = instances.get_many_related(manager, [item.data.get("id") for item in nodes])
+    elif manager is not None:
+        objs = instances.get_many_related(manager, [item.pk for item in nodes])
+    else:
+        objs = instances.get_existing(node.model, [item.pk for item in nodes])
+
+    save_changes(
+        type(objs[0]),
+        [(obj, item.data) for obj, item in zip(objs, nodes, strict=True)],
+    )
+    for obj, item in zip(objs, nodes, strict=True):
+        item.instance = obj
+
+    if node.m2m:
+        _update_through_rows(
+            manager,
+            node.owner,
+            [(obj, item.through_defaults) for obj, item in zip(objs, nodes, strict=True)],
+        )
+
+
+def execute_batch(kind, nodes, instances) -> None:
+    """Execute a group of nodes sharing a batch key with as few queries as possible."""
+    if kind == "update":
+        update_nodes(nodes, instances)
+        return
+
+    if kind == "m2m_assign":
+        link_m2m(
+            nodes[0].manager,
+            [(node.data.id, node.data.through_defaults) for node in nodes],
+        )
+        return
+
+    if kind == "upsert":
+        upsert_nodes(nodes, instances)
+    else:
+        bulk_create_nodes(nodes, instances)
+
+    if nodes[0].m2m:
+        by_manager = {}
+        for node in nodes:
+            manager = node.manager
+            links = by_manager.setdefault(id(manager), (manager, []))[1]
+            links.append((node.instance.pk, node.through_defaults))
+        for manager, links in by_manager.values():
+            link_m2m(manager, links)
+
+
+def _chunks(values, size):
+    values = list(values)
+    # No size means a single chunk
+    size = size or len(values) or 1
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def _batched_q(model, terms, batch_size=None):
+    """
+    OR together `(filters, lookup, values)` terms into `Q` objects that each stay within the
+    query parameter limit of the backend, e.g. SQLite's, and within `batch_size` if given.
+    """
+    terms = [(filters, lookup, list(values)) for filters, lookup, values in terms]
+    ops = connections[router.db_for_write(model)].ops
+    size = max(ops.bulk_batch_size(["pk"], [v for _, _, values in terms for v in values]), 1)
+    if batch_size:
+        size = min(size, batch_size)
+
+    q = Q()
+    used = 0
+    for filters, lookup, values in terms:
+        for chunk in _chunks(values, size):
+            cost = len(chunk) + len(filters)
+            if used and used + cost > size:
+                yield q
+                q = Q()
+                used = 0
+            q |= Q(**filters, **{lookup: chunk})
+            used += cost
+    if used:
+        yield q
+
+
+def _add_term(terms, filters, pks) -> None:
+    entry = terms.setdefault(tuple(sorted(filters.items())), (filters, {}))
+    entry[1].update(dict.fromkeys(pks))
+
+
+def _term_list(terms, lookup="pk__in"):
+    return [(filters, lookup, pks) for filters, pks in terms.values()]
+
+
+def _deletion_order(models_):
+    """Order models so that each one comes after every model in the set referencing it."""
+    models_ = list(models_)
+    order = []
+    visiting = set()
+
+    def visit(model):
+        if model in visiting:
+            return
+        visiting.add(model)
+        for other in models_:
+            if other is not model and any(
+                field.is_relation
+                and field.related_model is not None
+                and issubclass(model, field.related_model)
+                for field in other._meta.concrete_fields  # noqa: SLF001
+            ):
+                visit(other)
+        order.append(model)
+
+    for model in models_:
+        visit(model)
+    return order
+
+
+class PendingWrites:
+    """
+    Deletions and removals collected while executing a plan.
+
+    Instead of running them node by node they are merged per model and flushed with as few
+    statements as the backend allows, at the end of the mutation or earlier when a node
+    needs them to have happened. No statement covers more than `batch_size` rows.
+    """
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size
+        self._deletions = {}
+        self._required_deletions = {}
+        self._removals = {}
+        self._generic_removals = {}
+        self._unlinks = {}
+        self._manager_unlinks = {}
+
+    @staticmethod
+    def _pks(model, pks) -> list:
+        pk_field = model._meta.pk  # noqa: SLF001
+        return [pk_field.to_python(pk) for pk in pks]
+
+    def delete(self, model, pks, manager=None) -> None:
+        """Delete `pks`, restricted to the members of `manager` when given."""
+        filters = manager.core_filters if manager is not None else {}
+        _add_term(self._deletions.setdefault(model, {}), filters, self._pks(model, pks))
+
+    def delete_members(self, manager, pks) -> None:
+        """Delete `pks`, raising `DoesNotExist` unless every one of them belongs to `manager`."""
+        model = manager.model
+        terms = self._required_deletions.setdefault(model, {})
+        _add_term(terms, manager.core_filters, self._pks(model, pks))
+
+    def remove(self, model, field_name, pks, manager=None) -> None:
+        """Unset the `field_name` foreign key of `pks`, restricted to `manager` when given."""
+        filters = manager.core_filters if manager is not None else {}
+        terms = self._removals.setdefault((model, field_name), {})
+        _add_term(terms, filters, self._pks(model, pks))
+
+    def remove_generic(  # noqa: PLR0913, PLR0917
+        self, model, ct_field_name, fk_field_name, parent_ct, parent_pk, pks
+    ) -> None:
+        """Unset the generic foreign key of `pks`, all of which must point to the parent."""
+        filters = {ct_field_name: parent_ct, fk_field_name: parent_pk}
+        terms = self._generic_removals.setdefault((model, ct_field_name, fk_field_name), {})
+        _add_term(terms, filters, self._pks(model, pks))
+
+    def unlink(self, manager, pks) -> None:
+        """Remove `pks` from a many to many relation."""
+        pks = self._pks(manager.model, pks)
+        if _can_bulk_link(manager):
+            filters = {manager.source_field_name: manager.related_val[0]}
+            key = manager.through, f"{manager.target_field_name}__in"
+            _add_term(self._unlinks.setdefault(key, {}), filters, pks)
+        else:
+            entry = self._manager_unlinks.setdefault(id(manager), (manager, {}))
+            entry[1].update(dict.fromkeys(pks))
+
+    def flush(self, instances) -> None:
+        self._flush_unlinks()
+        self._flush_removals()
+        self._flush_required_deletions()
+        self._flush_deletions(instances)
+
+    def _flush_unlinks(self) -> None:
+        for manager, pks in self._manager_unlinks.values():
+            manager.remove(*pks)
+        self._manager_unlinks.clear()
+
+        for (through, lookup), terms in self._unlinks.items():
+            for q in _batched_q(through, _term_list(terms, lookup), self.batch_size):
+                _delete_rows(through, q)
+        self._unlinks.clear()
+
+    def _flush_removals(self) -> None:
+        for (model, field_name), terms in self._removals.items():
+            for q in _batched_q(model, _term_list(terms), self.batch_size):
+                _update_rows(model, q, {field_name: None})
+        self._removals.clear()
+
+        for (model, ct_field_name, fk_field_name), terms in self._generic_removals.items():
+            expected = sum(len(pks) for _, pks in terms.values())
+            updated = 0
+            for q in _batched_q(model, _term_list(terms), self.batch_size):
+                updated += _update_rows(model, q, {ct_field_name: None, fk_field_name: None})
+            if updated != expected:
+                raise SDJExtrasError("Some targets were not attached to this parent")
+        self._generic_removals.clear()
+
+    def _flush_required_deletions(self) -> None:
+        for model, terms in self._required_deletions.items():
+            found = set()
+            for q in _batched_q(model, _term_list(terms), self.batch_size):
+                found.update(model.objects.filter(q).values_list("pk", flat=True))
+            if any(pk not in found for _, pks in terms.values() for pk in pks):
+                raise model.DoesNotExist(f"{model.__name__} matching query does not exist.")
+            _add_term(self._deletions.setdefault(model, {}), {}, found)
+        self._required_deletions.clear()
+
+    def _flush_deletions(self, instances) -> None:
+        for model in _deletion_order(self._deletions):
+            terms = self._deletions[model]
+            for q in _batched_q(model, _term_list(terms), self.batch_size):
+                _delete_rows(model, q)
+            instances.discard(model, [pk for _, pks in terms.values() for pk in pks])
+        self._deletions.clear()
+
+
+def plan_waves(data, caller_data=None, is_before=False):
+    """
+    Schedule the nodes of a plan into waves of `(node, parent_data, is_before)` entries.
+
+    "before" nodes have to exist before their parent is written and "after" nodes need the
+    primary key of their parent. Every node lands in the first wave following all of its
+    dependencies, nodes of a wave keep the depth first order of the plan.
+
+    `data` may also be a list of root plans. The roots are written together, so they all
+    wait for the "before" nodes of every one of them and land in the same wave.
+    """
+    roots = data if isinstance(data, list) else [data]
+    entries = []
+    remaining = []
+    successors = []
+    root_indexes = []
+    root_befores = []
+
+    stack = [(root, caller_data, is_before, None) for root in reversed(roots)]
+    while stack:
+        node, parent, node_is_before, parent_index = stack.pop()
+        index = len(entries)
+        entries.append((node, parent, node_is_before))
+        before = node.before
+        after = node.after
+
+        remaining.append(len(before))
+        successors.append([])
+        if parent_index is None:
+            root_indexes.append(index)
+        elif node_is_before:
+            successors[index].append(parent_index)
+            if parent_index in root_indexes:
+                root_befores.append((index, parent_index))
+        else:
+            remaining[index] += 1
+            successors[parent_index].append(index)
+
+        stack.extend((item, node, False, index) for item in reversed(after))
+        stack.extend((item, node, True, index) for item in reversed(before))
+
+    for index, parent_index in root_befores:
+        for root_index in root_indexes:
+            if root_index != parent_index:
+                successors[index].append(root_index)
+                remaining[root_index] += 1
+
+    waves = []
+    wave = [index for index, count in enumerate(remaining) if count == 0]
+    while wave:
+        waves.append([entries[index] for index in wave])
+        ready = []
+        for index in wave:
+            for successor in successors[index]:
+                remaining[successor] -= 1
+                if remaining[successor] == 0:
+                    ready.append(successor)
+        wave = sorted(ready)
+    return waves
+
+
+def _wave_groups(wave, root_ids=frozenset(), batch_size=None):
+    groups = {}
+    for entry in wave:
+        node, _, is_before = entry
+        key = ("root",) if id(node) in root_ids else _batch_key(node, is_before=is_before)
+        if key is None:
+            groups[None, len(groups)] = [entry]
+        else:
+            groups.setdefault(key, []).append(entry)
+    # The roots are written by a single call to the mutation
+    return [
+        (key[0], chunk)
+        for key, group in groups.items()
+        for chunk in _chunks(group, None if key[0] == "root" else batch_size)
+    ]
+
+
+def _release(node) -> None:
+    """
+    Drop what a completed node no longer needs.
+
+    Its values were written and handed to the nodes depending on it, and its relation writes
+    were executed or scheduled. Only the written object and the keys of the relations it
+    assigned are used afterwards, when priming the relation caches.
+    """
+    if node.operation not in {"assign", "remove"}:
+        node.data = None
+    node.removals = node.deletions = node.links = node.unlinks = node.generic_removals = ()
+    for assignment in (*node.assignments, *node.generic_assignments):
+        assignment.pop("pks", None)
+
+
+def _execute_node(node, pending, instances):  # noqa: PLR0912
     obj = None
-    if is_root:
-        obj = next_(source, info, **{argument_name: ni})  # pyright: ignore[reportOptionalCall]
-        # this is necessary because when I have a nested update input with a OneToOneField down the chain
-        # strawberry_django will not update parent object correctly and will have a Traceback in the place
-        # of the related One2One object
-        for k, v in data.get("data").items():
-            setattr(obj, k, v)
-        obj.save()
-
-    else:  # noqa: PLR5501
-        if data.get("operation") == "create":
-            if data.get("is_generic_fk_target"):
-                obj = data.get("model").objects.create(**data.get("data"))
-
-                parent_data = caller_data.get("data")
-                parent_data.update({
-                    data.get("parent_ct_field"): data.get("target_ct"),
-                    data.get("parent_fk_field"): obj.pk,
-                })
-
-            elif data.get("m2m", False) is True:
-                manager = data.get("manager")
-                obj = (
-                    manager.create(
-                        **data.get("data"),
-                        through_defaults=data.get("through_defaults"),
-                    )
-                    if data.get("through_defaults", None) is not None
-                    else manager.create(**data.get("data"))
+    if node.operation == "create":
+        if node.m2m:
+            manager = node.manager
+            obj = (
+                manager.create(
+                    **node.data,
+                    through_defaults=node.through_defaults,
+                )
+                if node.through_defaults is not None
+                else manager.create(**node.data)
+            )
+        else:
+            obj = node.model.objects.create(**node.data)
+
+    elif node.operation == "assign":
+        if node.m2m:
+            manager = node.manager
+            if node.data.through_defaults is not None:
+                manager.add(
+                    node.data.id,
+                    through_defaults=node.data.through_defaults,
                 )
             else:
-                obj = data.get("model").objects.create(**data.get("data"))
-
-        elif data.get("operation") == "assign":
-            if data.get("m2m", False) is True:
-                manager = data.get("manager")
-                if data.get("data").through_defaults is not None:
-                    manager.add(
-                        data.get("data").id,
-                        through_defaults=data.get("data").through_defaults,
-                    )
-                else:
-                    manager.add(data.get("data").id)
-                obj = manager.get(pk=data.get("data").id)
-
-        elif data.get("operation") == "update":
-            if data.get("m2m", False) is True:
-                manager = data.get("manager")
-                obj = manager.get(pk=data.get("data").get("id"))
-                for k, v in data.get("data").items():
-                    setattr(obj, k, v)
-                obj.save()
-                if hasattr(manager, "through"):
-                    # TODO: Check if this works for SYMMETRICAL m2m
-                    im = manager.through.objects.get(
-                        **{
-                            manager.source_field_name: data.get("p_obj"),
-                            manager.target_field_name: obj,
-                        },
-                    )
-                    for k, v in data.get("through_defaults", {}).items():
-                        setattr(im, k, v)
-                    im.save()
-
-            else:  # noqa: PLR5501
-                if data.get("manager", None) is not None:
-                    obj = data.get("manager").get(pk=data.get("pk"))
-                    for k, v in data.get("data").items():
-                        setattr(obj, k, v)
-                    obj.save()
-                else:
-                    obj = data.get("model").objects.get(pk=data.get("pk"))
-                    for k, v in data.get("data").items():
-                        setattr(obj, k, v)
-                    obj.save()
-
-        elif data.get("operation") == "remove":
-            if data.get("m2m", False) is True:
-                manager = data.get("manager")
-                if data.get("data").get("delete") is True:
-                    manager.get(pk=int(data.get("data").get("id"))).delete()
-                else:
-                    manager.remove(data.get("data").get("id"))
+                manager.add(node.data.id)
 
-        elif data.get("operation") == "skip":
-            pass
+    elif node.operation == "update":
+        update_nodes([node], instances)
+        obj = node.instance
 
-        else:
-            raise SDJExtrasError("Unknown operation")
+    elif node.operation == "remove":
+        if node.m2m:
+            manager = node.manager
+            if node.data.get("delete") is True:
+                pending.delete_members(manager, [node.data.get("id")])
+            else:
+                pending.unlink(manager, [node.data.get("id")])
 
-    if data.get("set_manager", False) is True and obj is not None:
-        for item in data.get("after"):
-            if item.get("m2m", False) is True and item.get("manager", None) is None:
-                item.update({"manager": getattr(obj, item.get("accessor"))})
+    elif node.operation == "skip":
+        pass
 
-    if is_before:  # noqa: SIM102
-        # Only necessary for create operations
-        if data.get("operation") in ["create", "update"]:
-            data_id = data.get("data_id")
-            if data_id is not None and data_id is not UNSET:
-                caller_data.get("data").update({data_id: obj})
-
-    if data.get("after"):
-        for item in data.get("after"):
-            if item.get("m2m", False) is False and item.get("operation", None) == "create":
-                if item.get("is_generic_relation"):
-                    fk_field_name = item.get("fk_field_name")
-                    if fk_field_name not in item.get("data"):
-                        item.get("data").update({fk_field_name: obj.pk})  # pyright: ignore[reportOptionalMemberAccess]
-                else:
-                    item.get("data").update({item.get("rel_data_id"): obj})
-            kill_a_rabbit(item, data, False)
+    else:
+        raise SDJExtrasError("Unknown operation")
 
-    if data.get("assignments"):
-        for assignment in data.get("assignments"):
-            assignment.get("objs").update(**{assignment.get("assignment_id"): obj})
+    return obj
 
-    if data.get("generic_assignments"):
-        parent_obj = data.get("obj") or obj
 
-        for assignment in data.get("generic_assignments"):
-            parent_ct = assignment["parent_ct"]
-            qs = assignment["model"].objects.filter(
-                pk__in=assignment.get("pks") or [assignment["pk"]]
-            )
+def _complete_node(node, parent, is_before, obj, pending):  # noqa: PLR0912
+    if node.target_ct is not None:
+        parent.data.update({
+            node.parent_ct_field: node.target_ct,
+            node.parent_fk_field: obj.pk,
+        })
 
-            updated = qs.update(**{
-                assignment["ct_field_name"]: parent_ct,
-                assignment["fk_field_name"]: parent_obj.pk,  # pyright: ignore[reportOptionalMemberAccess]
-            })
+    if node.set_manager is True and obj is not None:
+        # One manager per relation, so that sibling nodes share their batches
+        managers = {}
+        for item in node.after:
+            if item.m2m and item.manager is None:
+                accessor = item.accessor
+                if accessor not in managers:
+                    managers[accessor] = getattr(obj, accessor)
+                item.manager = managers[accessor]
 
-            if updated == 0:
-                raise SDJExtrasError("No targets available for assignment")
+    if is_before:  # noqa: SIM102
+        # Only necessary for create operations
+        if node.operation in {"create", "update", "upsert"}:
+            data_id = node.data_id
+            if data_id is not None and data_id is not UNSET:
+                parent.data.update({data_id: obj})
 
-    if data.get("deletions"):
-        for deletion in data.get("deletions"):
-            if data.get("manager", None) is not None:
-                deletion.get("manager").filter(pk__in=deletion.get("pks")).delete()
+    for item in node.after:
+        if not item.m2m and item.operation in {"create", "upsert"}:
+            if item.is_generic_relation:
+                if item.rel_data_id not in item.data:
+                    item.data.update({item.rel_data_id: obj.pk})  # pyright: ignore[reportOptionalMemberAccess]
             else:
-                deletion.get("model").objects.filter(
-                    pk__in=deletion.get("pks"),
-                ).delete()
-
-    if data.get("generic_removals"):
-        parent_obj = data.get("obj") or obj
-
-        for removal in data.get("generic_removals"):
-            parent_ct = removal["parent_ct"]
-            updated = (
-                removal["model"]
-                .objects.filter(
-                    pk__in=removal["pks"],
-                    **{
-                        removal["ct_field_name"]: parent_ct,
-                        removal["fk_field_name"]: parent_obj.pk,  # pyright: ignore[reportOptionalMemberAccess]
-                    },
-                )
-                .update(
-                    **{
-                        removal["ct_field_name"]: None,
-                        removal["fk_field_name"]: None,
+                item.data.update({item.rel_data_id: obj})
+
+    for assignment in node.assignments:
+        model = assignment["model"]
+        for q in _batched_q(model, [({}, "pk__in", assignment["pks"])], pending.batch_size):
+            _update_rows(model, q, {assignment["assignment_id"]: obj})
+
+    if node.generic_assignments:
+        parent_obj = node.owner or obj
+
+        for assignment in node.generic_assignments:
+            model = assignment["model"]
+            pks = assignment.get("pks") or [assignment["pk"]]
+            updated = 0
+            for q in _batched_q(model, [({}, "pk__in", pks)], pending.batch_size):
+                updated += _update_rows(
+                    model,
+                    q,
+                    {
+                        assignment["ct_field_name"]: assignment["parent_ct"],
+                        assignment["fk_field_name"]: parent_obj.pk,  # pyright: ignore[reportOptionalMemberAccess]
                     },
                 )
+
+            if updated == 0:
+                raise SDJExtrasError("No targets available for assignment")
+
+    for link in node.links:
+        link_m2m(link["manager"], [(pk, None) for pk in link["pks"]], pending.batch_size)
+
+    for unlink in node.unlinks:
+        pending.unlink(unlink["manager"], unlink["pks"])
+
+    for deletion in node.deletions:
+        pks = deletion.get("pks")
+        kept = deletion.get("kept")
+        if kept is not None:
+            pks = [pk for pk in pks if pk != kept.instance.pk]
+        if pks:
+            pending.delete(deletion.get("model"), pks, deletion.get("manager"))
+
+    if node.generic_removals:
+        parent_obj = node.owner or obj
+
+        for removal in node.generic_removals:
+            pending.remove_generic(
+                removal["model"],
+                removal["ct_field_name"],
+                removal["fk_field_name"],
+                removal["parent_ct"],
+                parent_obj.pk,  # pyright: ignore[reportOptionalMemberAccess]
+                removal["pks"],
             )
-            if updated != len(removal["pks"]):
-                raise SDJExtrasError("Some targets were not attached to this parent")
 
-    if data.get("removals"):
-        for removal in data.get("removals"):
-            if data.get("manager", None) is not None:
-                removal.get("manager").filter(pk__in=removal.get("pks")).update(
-                    **{removal.get("rel_data_id"): None},
-                )
-            else:
-                removal.get("model").objects.filter(pk__in=removal.get("pks")).update(
-                    **{removal.get("rel_data_id"): None},
-                )
+    for removal in node.removals:
+        pending.remove(
+            removal.get("model"),
+            removal.get("rel_data_id"),
+            removal.get("pks"),
+            removal.get("manager"),
+        )
+
+
+def kill_a_rabbit(  # noqa: PLR0913, PLR0917
+    data,
+    caller_data,
+    is_before=True,
+    is_root: bool = False,
+    next_=None,
+    source=None,
+    info=None,
+    ni=None,
+    argument_name="data",
+    instances=None,
+    savepoints=True,
+    batch_size=None,
+):
+    """
+    Execute a plan wave by wave, see `plan_waves`.
+
+    Nodes of a wave sharing a batch key, i.e. the same kind of operation on the same model,
+    are executed together. With a `batch_size` they are executed in chunks of at most that
+    many nodes, and no statement covers more rows than that. The whole plan runs in one
+    atomic block. With `savepoints` each group of nodes gets a savepoint of its own as well,
+    without them no SAVEPOINT/RELEASE pair is issued per group and a failure anywhere rolls
+    back the plan as a whole.
+
+    The values of a node are released once it is written, see `_release`.
+
+    When `data` is a list of root plans, `ni` is the matching list of inputs and `next_`
+    writes all the roots with a single call.
+    """
+    if instances is None:
+        instances = InstanceCache(batch_size)
+    pending = PendingWrites(batch_size)
+
+    root_ids = frozenset(id(root) for root in data) if isinstance(data, list) else {id(data)}
+    root_obj = None
+    with transaction.atomic():
+        for wave in plan_waves(data, caller_data, is_before):
+            roots = root_ids if is_root else frozenset()
+            for kind, group in _wave_groups(wave, roots, batch_size):
+                with transaction.atomic(savepoint=savepoints):
+                    nodes = [node for node, _, _ in group]
+                    if kind == "root":
+                        root_obj = next_(source, info, **{argument_name: ni})  # pyright: ignore[reportOptionalCall]
+                        objs = root_obj if isinstance(root_obj, list) else [root_obj]
+                        for obj in objs:
+                            instances.add(obj)
+                        # this is necessary because when I have a nested update input with a
+                        # OneToOneField down the chain strawberry_django will not update parent
+                        # object correctly and will have a Traceback in the place of the related
+                        # One2One object
+                        save_changes(
+                            type(objs[0]),
+                            [(obj, node.data) for obj, node in zip(objs, nodes, strict=True)],
+                        )
+                    elif kind is not None:
+                        execute_batch(kind, nodes, instances)
+                        objs = [node.instance for node in nodes]
+                    else:
+                        objs = [_execute_node(nodes[0], pending, instances)]
+
+                    for (node, parent, node_is_before), obj in zip(group, objs, strict=True):
+                        node.instance = obj
+                        _complete_node(node, parent, node_is_before, obj, pending)
+                        _release(node)
+
+            # Removals and deletions scheduled before a node make room for what it writes
+            if any(node_is_before and node.operation == "skip" for node, _, node_is_before in wave):
+                pending.flush(instances)
+
+        pending.flush(instances)
 
     if is_root:
-        return obj
+        return root_obj
     return None
 
 
+def _prefetch_cache_name(manager):
+    name = getattr(manager, "prefetch_cache_name", None)
+    if name is not None:
+        return name
+    remote_field = manager.field.remote_field
+    # Django < 5.1
+    return getattr(remote_field, "cache_name", None) or remote_field.get_cache_name()
+
+
+def _prime_relation(parent, key, objs) -> None:
+    descriptor = getattr(type(parent), key, None)
+    if isinstance(descriptor, ReverseOneToOneDescriptor):
+        descriptor.related.set_cached_value(parent, objs[-1])
+        return
+
+    manager = getattr(parent, key, None)
+    if not isinstance(manager, models.Manager):
+        return
+    # A query could return these in a different order
+    if manager.model._meta.ordering:  # noqa: SLF001
+        return
+
+    qs = manager.get_queryset()
+    # In the order of the optimizer's prefetch querysets
+    qs._result_cache = sorted({obj.pk: obj for obj in objs}.values(), key=lambda obj: obj.pk)  # noqa: SLF001
+    qs._prefetch_done = True  # noqa: SLF001
+    # Resolvers use it as is, like a queryset prefetched by the optimizer
+    get_queryset_config(qs).optimized_by_prefetching = True
+    if not hasattr(parent, "_prefetched_objects_cache"):
+        parent._prefetched_objects_cache = {}  # noqa: SLF001
+    parent._prefetched_objects_cache[_prefetch_cache_name(manager)] = qs  # noqa: SLF001
+
+
+def prime_relation_caches(roots, instances) -> None:
+    """
+    Fill the relation caches of the objects created by an executed plan with what it wrote.
+
+    The relations of an object created by the plan contain nothing but the objects the input
+    put there, so resolving them in the response needs no query. `roots` are the root plans
+    of a create mutation. Relations also written some other way, e.g. assigned with a single
+    `UPDATE`, are left alone.
+    """
+    root_ids = {id(root) for root in roots}
+    stack = list(roots)
+    while stack:
+        node = stack.pop()
+        stack.extend(node.before)
+        stack.extend(node.after)
+
+        parent = node.instance
+        if parent is None or (id(node) not in root_ids and node.operation != "create"):
+            continue
+
+        incomplete = {
+            item.get("data_id") for item in (*node.assignments, *node.generic_assignments)
+        }
+        related = {}
+        for item in node.after:
+            key = item.data_id
+            obj = item.instance
+            if obj is None and item.operation == "assign" and item.m2m:
+                obj = instances.peek(item.manager.model, item.data.id)
+            if obj is None or item.operation not in {"create", "upsert", "assign"}:
+                incomplete.add(key)
+            else:
+                related.setdefault(key, []).append(obj)
+
+        for key, objs in related.items():
+            if key is not None and key not in incomplete:
+                _prime_relation(parent, key, objs)
+
+
+def _narrows(queryset) -> bool:
+    # Whether a prefetch queryset may select or order its rows otherwise than the primed ones
+    query = queryset.query
+    return bool(
+        query.where
+        or query.is_sliced
+        or query.extra_order_by
+        or any(order not in {"pk", query.model._meta.pk.name} for order in query.order_by)  # noqa: SLF001
+    )
+
+
+def prefetch_missing(objs, lookups) -> None:
+    """
+    Apply prefetch `lookups` to `objs`, skipping the relations whose cache is already primed.
+
+    Lookups nested in the queryset of a skipped `Prefetch` are applied to the primed objects.
+    A `Prefetch` whose queryset filters, orders or slices the relation, e.g. for the field's
+    filters, ordering, pagination or its type's `get_queryset`, is never skipped: the primed
+    cache is dropped and the relation fetched. So are the primed caches of relations without
+    a lookup, e.g. selected under aliases, which their fields then resolve with their own
+    queryset.
+    """
+    covered = {
+        (lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup).split("__", 1)[0]
+        for lookup in lookups
+    }
+    for obj in objs:
+        cache = getattr(obj, "_prefetched_objects_cache", None)
+        if cache:
+            keep = {
+                _prefetch_cache_name(manager)
+                for name in covered
+                if isinstance(manager := getattr(obj, name, None), models.Manager)
+            }
+            for name in [name for name in cache if name not in keep]:
+                del cache[name]
+
+    for lookup in lookups:
+        through = lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup
+        queryset = getattr(lookup, "queryset", None)
+        narrowed = queryset is not None and _narrows(queryset)
+        primed = []
+        if "__" not in through:
+            for obj in objs:
+                cache = getattr(obj, "_prefetched_objects_cache", {})
+                manager = getattr(obj, through, None)
+                if isinstance(manager, models.Manager) and _prefetch_cache_name(manager) in cache:
+                    if narrowed:
+                        del cache[_prefetch_cache_name(manager)]
+                    else:
+                        primed.extend(manager.all())
+
+        prefetch_related_objects(list(objs), lookup)
+        if primed and queryset is not None and queryset._prefetch_related_lookups:  # noqa: SLF001
+            prefetch_missing(primed, queryset._prefetch_related_lookups)  # noqa: SLF001
+
+
 # noinspection DuplicatedCode
-def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PLR0914, PLR0915
+def rabbit_hole(  # noqa: PLR0912, PLR0914, PLR0915
+    model,
+    _input,
+    rel,
+    through_defaults=None,
+    instances=None,
+):
+    if instances is None:
+        instances = InstanceCache()
+
     if (  # noqa: PLR1702
         hasattr(_input, "__strawberry_definition__")
         and _input.__strawberry_definition__.is_input is True
     ):
-        field_items = get_model_fields(model).items()
-
-        fields = {
-            k: v
-            for k, v in field_items
-            if hasattr(_input, k) and _input.__dict__.get(k) is not UNSET
-        }
-
-        rel.update(
-            {
-                "model": model,
-                "before": [],
-                "after": [],
-                "data": {},
-                "assignments": [],
-                "removals": [],
-                "deletions": [],
-                "set_manager": False,
-                "through_defaults": through_defaults,
-            },
-        )
-        for key, val in fields.items():
-            if isinstance(val, GenericForeignKey):
-                _rel_input = _input.__dict__.get(key)  # noqa: RUF052
-                ct_field = val.ct_field
-                fk_field = val.fk_field
+        values = _input.__dict__
+        template = get_plan_template(model, type(_input))
+
+        rel.model = model
+        rel.data = {}
+        rel.through_defaults = through_defaults
+        for slot in template.slots_for(values):
+            key = slot.key
+            if values.get(key, UNSET) is UNSET:
+                continue
+
+            val = slot.field
+            if slot.kind == GENERIC_FK:
+                _rel_input = values[key]  # noqa: RUF052
+                if getattr(_rel_input, "upsert", UNSET) is not UNSET:
+                    raise SDJExtrasError("Upsert is not supported for generic relations")
+                ct_field = slot.ct_field
+                fk_field = slot.fk_field
 
                 if isinstance(_rel_input, CRUDOneToManyCreateInput):
                     if _rel_input.create is not UNSET and _rel_input.assign is not UNSET:
@@ -281,7 +1209,7 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                             raise SDJExtrasError("oneOf input has no field set")
 
                         content_type = ContentType.objects.get_for_model(target_model)
-                        rel.get("data").update({
+                        rel.data.update({
                             ct_field: content_type,
                             fk_field: target_pk,
                         })
@@ -299,18 +1227,19 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                         if target_model is None:
                             raise SDJExtrasError("oneOf input has no field set")
 
-                        target_ct = ContentType.objects.get_for_model(target_model)
-                        rel["before"].append({
-                            "operation": "create",
-                            "is_generic_fk_target": True,
-                            "target_ct": target_ct,
-                            "parent_ct_field": ct_field,
-                            "parent_fk_field": fk_field,
-                        })
-                        rabbit_hole(target_model, target_data, rel["before"][-1])
+                        child = rel.push(
+                            "before",
+                            PlanNode(
+                                "create",
+                                target_ct=ContentType.objects.get_for_model(target_model),
+                                parent_ct_field=ct_field,
+                                parent_fk_field=fk_field,
+                            ),
+                        )
+                        rabbit_hole(target_model, target_data, child, instances=instances)
 
                 elif isinstance(_rel_input, CRUDOneToManyUpdateInput):
-                    parent_instance = model.objects.get(pk=int(_input.id))
+                    parent_instance = instances.get(model, _input.id)
                     current_content_type = getattr(parent_instance, ct_field)
                     current_object_id = getattr(parent_instance, fk_field)
 
@@ -320,7 +1249,7 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                             fk_model_field = model._meta.get_field(fk_field)  # noqa: SLF001
                             if ct_model_field.null is False or fk_model_field.null is False:
                                 raise SDJExtrasError("Cannot assign null to non nullable field")
-                            rel.get("data").update({ct_field: None, fk_field: None})
+                            rel.data.update({ct_field: None, fk_field: None})
                         else:
                             target_model = None
                             target_pk = None
@@ -335,7 +1264,7 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                                 raise SDJExtrasError("oneOf input has no field set")
 
                             content_type = ContentType.objects.get_for_model(target_model)
-                            rel.get("data").update({
+                            rel.data.update({
                                 ct_field: content_type,
                                 fk_field: target_pk,
                             })
@@ -353,15 +1282,16 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                         if target_model is None:
                             raise SDJExtrasError("oneOf input has no field set")
 
-                        target_ct = ContentType.objects.get_for_model(target_model)
-                        rel["before"].append({
-                            "operation": "create",
-                            "is_generic_fk_target": True,
-                            "target_ct": target_ct,
-                            "parent_ct_field": ct_field,
-                            "parent_fk_field": fk_field,
-                        })
-                        rabbit_hole(target_model, target_data, rel["before"][-1])
+                        child = rel.push(
+                            "before",
+                            PlanNode(
+                                "create",
+                                target_ct=ContentType.objects.get_for_model(target_model),
+                                parent_ct_field=ct_field,
+                                parent_fk_field=fk_field,
+                            ),
+                        )
+                        rabbit_hole(target_model, target_data, child, instances=instances)
 
                     if _rel_input.update is not UNSET and _rel_input.update is not None:
                         if current_content_type is None:
@@ -387,12 +1317,10 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                             )
 
                         target_data.id = current_object_id  # pyright: ignore[reportOptionalMemberAccess]
-                        rel["before"].append({
-                            "operation": "update",
-                            "pk": current_object_id,
-                            "data_id": key,
-                        })
-                        rabbit_hole(target_model, target_data, rel["before"][-1])
+                        child = rel.push(
+                            "before", PlanNode("update", pk=current_object_id, data_id=key)
+                        )
+                        rabbit_hole(target_model, target_data, child, instances=instances)
 
                     if _rel_input.delete is True:
                         if _rel_input.assign is UNSET and _rel_input.create is UNSET:
@@ -407,10 +1335,9 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                                 raise SDJExtrasError(
                                     "Cannot resolve model class for current content type"
                                 )
-                            rel["deletions"].append({
-                                "model": target_model,
-                                "pks": [current_object_id],
-                            })
+                            rel.push(
+                                "deletions", {"model": target_model, "pks": [current_object_id]}
+                            )
 
                 else:
                     raise SDJExtrasError(
@@ -418,26 +1345,17 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                         f"CRUDOneToManyCreateInput or CRUDOneToManyUpdateInput"
                     )
 
-            elif isinstance(val, GenericRelation):
-                _rel_input = _input.__dict__.get(key)  # noqa: RUF052
-                ct_field_name = val.content_type_field_name
-                fk_field_name = val.object_id_field_name
-                related_model = val.related_model
-
-                is_one_to_one = False
-                for constraint in related_model._meta.unique_together:  # noqa: SLF001
-                    if set(constraint) == {ct_field_name, fk_field_name}:
-                        is_one_to_one = True
-                        break
-
-                if not is_one_to_one:
-                    for constraint in related_model._meta.constraints:  # noqa: SLF001
-                        if isinstance(constraint, models.UniqueConstraint):  # noqa: SIM102
-                            if set(constraint.fields) == {ct_field_name, fk_field_name}:
-                                is_one_to_one = True
-                                break
-
-                if is_one_to_one:
+            elif slot.kind == GENERIC_RELATION:
+                _rel_input = values[key]  # noqa: RUF052
+                if getattr(_rel_input, "upsert", UNSET) is not UNSET:
+                    raise SDJExtrasError("Upsert is not supported for generic relations")
+                if getattr(_rel_input, "set", UNSET) is not UNSET:
+                    raise SDJExtrasError("Set is not supported for generic relations")
+                ct_field_name = slot.ct_field
+                fk_field_name = slot.fk_field
+                related_model = slot.related_model
+
+                if slot.is_one_to_one:
                     if isinstance(_rel_input, CRUDOneToOneCreateInput):
                         if _rel_input.create is UNSET and _rel_input.assign is UNSET:
                             raise SDJExtrasError("Must create or assign")
@@ -445,31 +1363,41 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                             raise SDJExtrasError("Cannot create and assign at the same time")
 
                         if _rel_input.create is not UNSET:
-                            rel["after"].append({
-                                "operation": "create",
-                                "is_generic_relation": True,
-                                "fk_field_name": fk_field_name,
-                                "data_id": key,
-                                "rel_data_id": fk_field_name,
-                            })
-                            rabbit_hole(related_model, _rel_input.create, rel["after"][-1])
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "create",
+                                    is_generic_relation=True,
+                                    data_id=key,
+                                    rel_data_id=fk_field_name,
+                                ),
+                            )
+                            rabbit_hole(
+                                related_model,
+                                _rel_input.create,
+                                child,
+                                instances=instances,
+                            )
 
                             content_type = ContentType.objects.get_for_model(model)
-                            rel["after"][-1].get("data").update({ct_field_name: content_type})
+                            child.data.update({ct_field_name: content_type})
 
                         if _rel_input.assign is not UNSET:
                             if _rel_input.assign is None:
                                 raise SDJExtrasError("assign cannot be null")
-                            rel["generic_assignments"] = rel.get("generic_assignments", [])
-                            rel["generic_assignments"].append({
-                                "model": related_model,
-                                "pk": int(_rel_input.assign),
-                                "ct_field_name": ct_field_name,
-                                "fk_field_name": fk_field_name,
-                            })
+                            rel.push(
+                                "generic_assignments",
+                                {
+                                    "data_id": key,
+                                    "model": related_model,
+                                    "pk": int(_rel_input.assign),
+                                    "ct_field_name": ct_field_name,
+                                    "fk_field_name": fk_field_name,
+                                },
+                            )
 
                     elif isinstance(_rel_input, CRUDOneToOneUpdateInput):
-                        parent_instance = model.objects.get(pk=int(_input.id))
+                        parent_instance = instances.get(model, _input.id)
                         parent_ct = ContentType.objects.get_for_model(model)
                         existing_instance = None
                         existing_instances = list(
@@ -485,7 +1413,7 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                                 f"Multiple related {related_model.__name__} instances found for {key}"
                             )
                         if existing_instances:
-                            existing_instance = existing_instances[0]
+                            existing_instance = instances.add(existing_instances[0])
 
                         if _rel_input.create is not UNSET and _rel_input.assign is not UNSET:
                             raise SDJExtrasError("Cannot create and assign at the same time")
@@ -503,19 +1431,22 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                             fk_model_field = related_model._meta.get_field(fk_field_name)  # noqa: SLF001
                             if ct_model_field.null is False or fk_model_field.null is False:
                                 raise SDJExtrasError("Cannot assign null to non nullable field")
-                            rel["before"].append({
-                                "operation": "skip",
-                                "obj": parent_instance,
-                                "generic_removals": [
-                                    {
-                                        "model": related_model,
-                                        "pks": [existing_instance.pk],  # pyright: ignore[reportOptionalMemberAccess]
-                                        "parent_ct": parent_ct,
-                                        "ct_field_name": ct_field_name,
-                                        "fk_field_name": fk_field_name,
-                                    }
-                                ],
-                            })
+                            rel.push(
+                                "before",
+                                PlanNode(
+                                    "skip",
+                                    owner=parent_instance,
+                                    generic_removals=[
+                                        {
+                                            "model": related_model,
+                                            "pks": [existing_instance.pk],  # pyright: ignore[reportOptionalMemberAccess]
+                                            "parent_ct": parent_ct,
+                                            "ct_field_name": ct_field_name,
+                                            "fk_field_name": fk_field_name,
+                                        }
+                                    ],
+                                ),
+                            )
 
                         if _rel_input.assign is not UNSET:
                             if _rel_input.assign is None:
@@ -524,47 +1455,63 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                                 if ct_model_field.null is False or fk_model_field.null is False:
                                     raise SDJExtrasError("Cannot assign null to non nullable field")
                                 if existing_instance is not None:
-                                    rel["before"].append({
-                                        "operation": "skip",
-                                        "obj": parent_instance,
-                                        "generic_removals": [
-                                            {
-                                                "model": related_model,
-                                                "pks": [existing_instance.pk],
-                                                "parent_ct": parent_ct,
-                                                "ct_field_name": ct_field_name,
-                                                "fk_field_name": fk_field_name,
-                                            }
-                                        ],
-                                    })
+                                    rel.push(
+                                        "before",
+                                        PlanNode(
+                                            "skip",
+                                            owner=parent_instance,
+                                            generic_removals=[
+                                                {
+                                                    "model": related_model,
+                                                    "pks": [existing_instance.pk],
+                                                    "parent_ct": parent_ct,
+                                                    "ct_field_name": ct_field_name,
+                                                    "fk_field_name": fk_field_name,
+                                                }
+                                            ],
+                                        ),
+                                    )
                             else:
-                                rel["generic_assignments"] = rel.get("generic_assignments", [])
-                                rel["generic_assignments"].append({
-                                    "model": related_model,
-                                    "pk": int(_rel_input.assign),
-                                    "parent_ct": parent_ct,
-                                    "ct_field_name": ct_field_name,
-                                    "fk_field_name": fk_field_name,
-                                })
+                                rel.push(
+                                    "generic_assignments",
+                                    {
+                                        "data_id": key,
+                                        "model": related_model,
+                                        "pk": int(_rel_input.assign),
+                                        "parent_ct": parent_ct,
+                                        "ct_field_name": ct_field_name,
+                                        "fk_field_name": fk_field_name,
+                                    },
+                                )
 
                         if _rel_input.create is not UNSET:
                             if existing_instance is not None and _rel_input.delete is True:
-                                rel["deletions"].append({
-                                    "model": related_model,
-                                    "pks": [existing_instance.pk],
-                                })
+                                rel.push(
+                                    "deletions",
+                                    {
+                                        "model": related_model,
+                                        "pks": [existing_instance.pk],
+                                    },
+                                )
 
-                            rel["after"].append({
-                                "operation": "create",
-                                "is_generic_relation": True,
-                                "fk_field_name": fk_field_name,
-                                "data_id": key,
-                                "rel_data_id": fk_field_name,
-                            })
-                            rabbit_hole(related_model, _rel_input.create, rel["after"][-1])
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "create",
+                                    is_generic_relation=True,
+                                    data_id=key,
+                                    rel_data_id=fk_field_name,
+                                ),
+                            )
+                            rabbit_hole(
+                                related_model,
+                                _rel_input.create,
+                                child,
+                                instances=instances,
+                            )
 
                             content_type = ContentType.objects.get_for_model(model)
-                            rel["after"][-1].get("data").update({
+                            child.data.update({
                                 ct_field_name: content_type,
                                 fk_field_name: int(_input.id),
                             })
@@ -574,19 +1521,30 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                                 raise SDJExtrasError("Cannot update non-existing object")
 
                             _rel_input.update.id = existing_instance.pk  # pyright: ignore[reportOptionalMemberAccess]
-                            rel["after"].append({
-                                "operation": "update",
-                                "pk": existing_instance.pk,
-                                "data_id": key,
-                                "rel_data_id": fk_field_name,
-                            })
-                            rabbit_hole(related_model, _rel_input.update, rel["after"][-1])
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "update",
+                                    pk=existing_instance.pk,
+                                    data_id=key,
+                                    rel_data_id=fk_field_name,
+                                ),
+                            )
+                            rabbit_hole(
+                                related_model,
+                                _rel_input.update,
+                                child,
+                                instances=instances,
+                            )
 
                         if _rel_input.delete is True and existing_instance is not None:
-                            rel["deletions"].append({
-                                "model": related_model,
-                                "pks": [existing_instance.pk],
-                            })
+                            rel.push(
+                                "deletions",
+                                {
+                                    "model": related_model,
+                                    "pks": [existing_instance.pk],
+                                },
+                            )
 
                     else:
                         raise SDJExtrasError(
@@ -606,32 +1564,37 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                         if _rel_input.create is None:
                             raise SDJExtrasError("create cannot be null")
                         for item in _rel_input.create:
-                            rel["after"].append({
-                                "operation": "create",
-                                "is_generic_relation": True,
-                                "fk_field_name": fk_field_name,
-                                "data_id": key,
-                                "rel_data_id": fk_field_name,
-                            })
-                            rabbit_hole(related_model, item, rel["after"][-1])
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "create",
+                                    is_generic_relation=True,
+                                    data_id=key,
+                                    rel_data_id=fk_field_name,
+                                ),
+                            )
+                            rabbit_hole(related_model, item, child, instances=instances)
 
-                            rel["after"][-1].get("data").update({ct_field_name: parent_ct})
+                            child.data.update({ct_field_name: parent_ct})
 
                     if _rel_input.assign is not UNSET:
                         if _rel_input.assign is None:
                             raise SDJExtrasError("assign cannot be null")
-                        rel["generic_assignments"] = rel.get("generic_assignments", [])
-                        rel["generic_assignments"].append({
-                            "model": related_model,
-                            "pks": [int(pk) for pk in _rel_input.assign],
-                            "parent_ct": parent_ct,
-                            "ct_field_name": ct_field_name,
-                            "fk_field_name": fk_field_name,
-                        })
+                        rel.push(
+                            "generic_assignments",
+                            {
+                                "data_id": key,
+                                "model": related_model,
+                                "pks": [int(pk) for pk in _rel_input.assign],
+                                "parent_ct": parent_ct,
+                                "ct_field_name": ct_field_name,
+                                "fk_field_name": fk_field_name,
+                            },
+                        )
 
                 # UPDATE
                 elif isinstance(_rel_input, CRUDManyToOneUpdateInput):
-                    parent_instance = model.objects.get(pk=int(_input.id))
+                    parent_instance = instances.get(model, _input.id)
                     parent_ct = ContentType.objects.get_for_model(model)
                     manager = getattr(parent_instance, key)
 
@@ -639,16 +1602,18 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                         if _rel_input.create is None:
                             raise SDJExtrasError("create cannot be null")
                         for item in _rel_input.create:
-                            rel["after"].append({
-                                "operation": "create",
-                                "is_generic_relation": True,
-                                "fk_field_name": fk_field_name,
-                                "data_id": key,
-                                "rel_data_id": fk_field_name,
-                            })
-                            rabbit_hole(related_model, item, rel["after"][-1])
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "create",
+                                    is_generic_relation=True,
+                                    data_id=key,
+                                    rel_data_id=fk_field_name,
+                                ),
+                            )
+                            rabbit_hole(related_model, item, child, instances=instances)
 
-                            rel["after"][-1].get("data").update({
+                            child.data.update({
                                 ct_field_name: parent_ct,
                                 fk_field_name: int(_input.id),
                             })
@@ -656,27 +1621,33 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                     if _rel_input.assign is not UNSET:
                         if _rel_input.assign is None:
                             raise SDJExtrasError("assign cannot be null")
-                        rel["generic_assignments"] = rel.get("generic_assignments", [])
-                        rel["generic_assignments"].append({
-                            "model": related_model,
-                            "pks": [int(pk) for pk in _rel_input.assign],
-                            "parent_ct": parent_ct,
-                            "ct_field_name": ct_field_name,
-                            "fk_field_name": fk_field_name,
-                        })
+                        rel.push(
+                            "generic_assignments",
+                            {
+                                "data_id": key,
+                                "model": related_model,
+                                "pks": [int(pk) for pk in _rel_input.assign],
+                                "parent_ct": parent_ct,
+                                "ct_field_name": ct_field_name,
+                                "fk_field_name": fk_field_name,
+                            },
+                        )
 
                     if _rel_input.update is not UNSET:
                         if _rel_input.update is None:
                             raise SDJExtrasError("update cannot be null")
                         for item in _rel_input.update:
-                            rel["after"].append({
-                                "operation": "update",
-                                "pk": item.id,
-                                "manager": manager,
-                                "data_id": key,
-                                "rel_data_id": fk_field_name,
-                            })
-                            rabbit_hole(related_model, item, rel["after"][-1])
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "update",
+                                    pk=item.id,
+                                    manager=manager,
+                                    data_id=key,
+                                    rel_data_id=fk_field_name,
+                                ),
+                            )
+                            rabbit_hole(related_model, item, child, instances=instances)
 
                     if _rel_input.remove is not UNSET:
                         if _rel_input.remove is None:
@@ -689,20 +1660,25 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                         ]
 
                         if len(del_pks) > 0:
-                            rel["deletions"].append({
-                                "model": related_model,
-                                "pks": del_pks,
-                            })
+                            rel.push(
+                                "deletions",
+                                {
+                                    "model": related_model,
+                                    "pks": del_pks,
+                                },
+                            )
 
                         if len(rem_pks) > 0:
-                            rel["generic_removals"] = rel.get("generic_removals", [])
-                            rel["generic_removals"].append({
-                                "model": related_model,
-                                "pks": rem_pks,
-                                "parent_ct": parent_ct,
-                                "ct_field_name": ct_field_name,
-                                "fk_field_name": fk_field_name,
-                            })
+                            rel.push(
+                                "generic_removals",
+                                {
+                                    "model": related_model,
+                                    "pks": rem_pks,
+                                    "parent_ct": parent_ct,
+                                    "ct_field_name": ct_field_name,
+                                    "fk_field_name": fk_field_name,
+                                },
+                            )
 
                 else:
                     raise SDJExtrasError(
@@ -710,9 +1686,9 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                         f"CRUDManyToOneCreateInput or CRUDManyToOneUpdateInput"
                     )
 
-            elif isinstance(val, (OneToOneField, OneToOneRel)):
-                _rel_input = _input.__dict__.get(key)  # noqa: RUF052
-                when = "after" if isinstance(val, OneToOneRel) else "before"
+            elif slot.kind in {ONE_TO_ONE, ONE_TO_ONE_REL}:
+                _rel_input = values[key]  # noqa: RUF052
+                when = "after" if slot.kind == ONE_TO_ONE_REL else "before"
                 if isinstance(_rel_input, CRUDOneToOneCreateInput):
                     if _rel_input.create is UNSET and _rel_input.assign is UNSET:
                         raise SDJExtrasError("Must create or assign")
@@ -721,33 +1697,33 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                             "Cannot create and assign at the same time",
                         )
                     if _rel_input.assign is not UNSET:
-                        rel.get("data").update(
+                        rel.data.update(
                             {
-                                key: val.related_model.objects.get(
-                                    pk=int(_rel_input.assign),  # pyright: ignore[reportArgumentType]
+                                key: instances.get(
+                                    val.related_model,
+                                    int(_rel_input.assign),  # pyright: ignore[reportArgumentType]
                                 ),
                             },
                         )
                     if _rel_input.create is not UNSET:
-                        rel[when].append(
-                            {
-                                "data_id": key,
-                                "operation": "create",
-                                "rel_data_id": val.remote_field.name,
-                            },
+                        child = rel.push(
+                            when, PlanNode("create", data_id=key, rel_data_id=slot.remote_name)
                         )
                         rabbit_hole(
-                            val.related_model,
-                            _input.__dict__.get(key).create,
-                            rel[when][-1],
+                            slot.related_model,
+                            _rel_input.create,
+                            child,
+                            instances=instances,
                         )
 
                 if isinstance(_rel_input, CRUDOneToOneUpdateInput):
-                    parent_instance = model.objects.get(pk=int(_input.id))
+                    parent_instance = instances.get(model, _input.id)
                     try:
                         existing_instance = getattr(parent_instance, key)
                     except val.related_model.DoesNotExist:
                         existing_instance = None
+                    if existing_instance is not None:
+                        instances.add(existing_instance)
 
                     if _rel_input.create is not UNSET and _rel_input.assign is not UNSET:
                         raise SDJExtrasError(
@@ -761,7 +1737,7 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                             "Updating an object is only supported without create/assign.",
                         )
                     if _rel_input.assign is not UNSET:
-                        if isinstance(val, OneToOneRel):
+                        if slot.kind == ONE_TO_ONE_REL:
                             if val.remote_field.null is False:
                                 if _rel_input.delete is not True and existing_instance is not None:
                                     raise SDJExtrasError(
@@ -772,40 +1748,43 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                                     )
                             else:  # noqa: PLR5501
                                 if _rel_input.delete is not True and existing_instance is not None:
-                                    rel["before"].append(
-                                        {
-                                            "operation": "skip",
-                                            "removals": [
+                                    rel.push(
+                                        "before",
+                                        PlanNode(
+                                            "skip",
+                                            removals=[
                                                 {
                                                     "model": val.related_model,
-                                                    "rel_data_id": (val.remote_field.name),
+                                                    "rel_data_id": slot.remote_name,
                                                     "pks": [existing_instance.pk],
                                                 },
                                             ],
-                                        },
+                                        ),
                                     )
 
                             if _rel_input.assign is not None:
-                                rel.get("data").update(
+                                rel.data.update(
                                     {
-                                        key: val.related_model.objects.get(
-                                            pk=_rel_input.assign,
+                                        key: instances.get(
+                                            val.related_model,
+                                            _rel_input.assign,
                                         ),
                                     },
                                 )
 
-                        elif isinstance(val, OneToOneField):
+                        elif slot.kind == ONE_TO_ONE:
                             if _rel_input.assign is None:
                                 if val.null is False:
                                     raise SDJExtrasError(
                                         "Cannot assign null to non nullable field",
                                     )
-                                rel.get("data").update({key: None})
+                                rel.data.update({key: None})
                             else:
-                                rel.get("data").update(
+                                rel.data.update(
                                     {
-                                        key: val.related_model.objects.get(
-                                            pk=_rel_input.assign,
+                                        key: instances.get(
+                                            val.related_model,
+                                            _rel_input.assign,
                                         ),
                                     },
                                 )
@@ -814,7 +1793,7 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                             raise SDJExtrasError(f"Invalid field type for {key}")
                     if _rel_input.create is not UNSET:
                         if (
-                            isinstance(val, OneToOneRel)
+                            slot.kind == ONE_TO_ONE_REL
                             and _rel_input.delete is not True
                             and existing_instance is not None
                         ):
@@ -825,49 +1804,44 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                                     f" replace the {key} ?",
                                 )
                             else:  # noqa: RET506
-                                rel["before"].append(
-                                    {
-                                        "operation": "skip",
-                                        "removals": [
+                                rel.push(
+                                    "before",
+                                    PlanNode(
+                                        "skip",
+                                        removals=[
                                             {
                                                 "model": val.related_model,
-                                                "rel_data_id": val.remote_field.name,
+                                                "rel_data_id": slot.remote_name,
                                                 "pks": [existing_instance.pk],
                                             },
                                         ],
-                                    },
+                                    ),
                                 )
 
-                        rel[when].append(
-                            {
-                                "data_id": key,
-                                "operation": "create",
-                                "rel_data_id": val.remote_field.name,
-                            },
+                        child = rel.push(
+                            when, PlanNode("create", data_id=key, rel_data_id=slot.remote_name)
                         )
                         rabbit_hole(
-                            val.related_model,
-                            _input.__dict__.get(key).create,
-                            rel[when][-1],
+                            slot.related_model,
+                            _rel_input.create,
+                            child,
+                            instances=instances,
                         )
                     if _rel_input.update is not UNSET:
                         if existing_instance is None:
                             raise SDJExtrasError("Cannot update non existing object")
                         _rel_input.update.id = existing_instance.pk  # pyright: ignore[reportOptionalMemberAccess]
-                        rel[when].append(
-                            {
-                                "data_id": key,
-                                "operation": "update",
-                                "pk": existing_instance.pk,
-                            },
+                        child = rel.push(
+                            when, PlanNode("update", data_id=key, pk=existing_instance.pk)
                         )
                         rabbit_hole(
-                            val.related_model,
-                            _input.__dict__.get(key).update,
-                            rel[when][-1],
+                            slot.related_model,
+                            _rel_input.update,
+                            child,
+                            instances=instances,
                         )
                     if _rel_input.delete is True and existing_instance is not None:
-                        if isinstance(val, OneToOneField):
+                        if slot.kind == ONE_TO_ONE:
                             if (
                                 val.remote_field.on_delete is models.CASCADE  # pyright: ignore[reportAttributeAccessIssue]
                                 and _rel_input.assign is UNSET
@@ -878,49 +1852,77 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                                     " set makes ZERO sense. Maybe delete the parent"
                                     " object instead ?",
                                 )
-                            rel["after"].append(
-                                {
-                                    "deletions": [
+                            rel.push(
+                                "after",
+                                PlanNode(
+                                    "skip",
+                                    deletions=[
                                         {
                                             "model": val.related_model,
                                             "pks": [existing_instance.pk],
                                         },
                                     ],
-                                    "operation": "skip",
-                                },
+                                ),
                             )
-                        elif isinstance(val, OneToOneRel):
-                            rel["before"].append(
-                                {
-                                    "deletions": [
+                        elif slot.kind == ONE_TO_ONE_REL:
+                            rel.push(
+                                "before",
+                                PlanNode(
+                                    "skip",
+                                    deletions=[
                                         {
                                             "model": val.related_model,
                                             "pks": [existing_instance.pk],
                                         },
                                     ],
-                                    "operation": "skip",
-                                },
+                                ),
                             )
 
-            elif isinstance(val, ForeignKey):
-                _rel_input = _input.__dict__.get(key)  # noqa: RUF052
+            elif slot.kind == FOREIGN_KEY:
+                _rel_input = values[key]  # noqa: RUF052
                 if isinstance(_rel_input, CRUDOneToManyCreateInput):
                     if _rel_input.create is not UNSET and _rel_input.assign is not UNSET:
                         raise SDJExtrasError(
                             "Cannot create and assign at the same time",
                         )
-                    if _rel_input.create is UNSET and _rel_input.assign is UNSET:
-                        raise SDJExtrasError("Must create or assign")
+                    if _rel_input.upsert is not UNSET and (
+                        _rel_input.create is not UNSET or _rel_input.assign is not UNSET
+                    ):
+                        raise SDJExtrasError("Cannot upsert and create or assign at the same time")
+                    if (
+                        _rel_input.create is UNSET
+                        and _rel_input.assign is UNSET
+                        and _rel_input.upsert is UNSET
+                    ):
+                        raise SDJExtrasError("Must create, assign or upsert")
                     if _rel_input.assign is not UNSET:
-                        rel.get("data").update(
-                            {key: val.related_model.objects.get(pk=_rel_input.assign)},
+                        rel.data.update(
+                            {key: instances.get(val.related_model, _rel_input.assign)},
                         )
                     if _rel_input.create is not UNSET:
-                        rel["before"].append({"data_id": key, "operation": "create"})
+                        child = rel.push("before", PlanNode("create", data_id=key))
                         rabbit_hole(
-                            val.related_model,
-                            _input.__dict__.get(key).create,
-                            rel["before"][-1],
+                            slot.related_model,
+                            _rel_input.create,
+                            child,
+                            instances=instances,
+                        )
+                    if _rel_input.upsert is not UNSET and _rel_input.upsert is not None:
+                        child = rel.push(
+                            "before",
+                            PlanNode(
+                                "upsert",
+                                data_id=key,
+                                upsert_fields=getattr(
+                                    type(_rel_input.upsert), "upsert_fields", None
+                                ),
+                            ),
+                        )
+                        rabbit_hole(
+                            slot.related_model,
+                            _rel_input.upsert,
+                            child,
+                            instances=instances,
                         )
 
                 elif isinstance(_rel_input, CRUDOneToManyUpdateInput):
@@ -929,11 +1931,17 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                             "You can either create a new object or assign an existing"
                             " one but not both at the same time",
                         )
+                    if _rel_input.upsert is not UNSET and (
+                        _rel_input.create is not UNSET or _rel_input.assign is not UNSET
+                    ):
+                        raise SDJExtrasError("Cannot upsert and create or assign at the same time")
                     if _rel_input.update is not UNSET and (
-                        _rel_input.assign is not UNSET or _rel_input.create is not UNSET
+                        _rel_input.assign is not UNSET
+                        or _rel_input.create is not UNSET
+                        or _rel_input.upsert is not UNSET
                     ):
                         raise SDJExtrasError(
-                            "Updating an object is only supported without create/assign.",
+                            "Updating an object is only supported without create/assign/upsert.",
                         )
                     if _rel_input.assign is not UNSET:
                         if _rel_input.assign is None:
@@ -941,42 +1949,66 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                                 raise SDJExtrasError(
                                     "Cannot assign null to non nullable field",
                                 )
-                            rel.get("data").update({key: None})
+                            rel.data.update({key: None})
                         else:
-                            rel.get("data").update(
+                            rel.data.update(
                                 {
-                                    key: val.related_model.objects.get(
-                                        pk=_rel_input.assign,
+                                    key: instances.get(
+                                        val.related_model,
+                                        _rel_input.assign,
                                     ),
                                 },
                             )
                     if _rel_input.create is not UNSET:
-                        rel["before"].append({"data_id": key, "operation": "create"})
+                        child = rel.push("before", PlanNode("create", data_id=key))
                         rabbit_hole(
-                            val.related_model,
-                            _input.__dict__.get(key).create,
-                            rel["before"][-1],
+                            slot.related_model,
+                            _rel_input.create,
+                            child,
+                            instances=instances,
+                        )
+                    upserted = None
+                    if _rel_input.upsert is not UNSET and _rel_input.upsert is not None:
+                        upserted = rel.push(
+                            "before",
+                            PlanNode(
+                                "upsert",
+                                data_id=key,
+                                upsert_fields=getattr(
+                                    type(_rel_input.upsert), "upsert_fields", None
+                                ),
+                            ),
+                        )
+                        rabbit_hole(
+                            slot.related_model,
+                            _rel_input.upsert,
+                            upserted,
+                            instances=instances,
                         )
                     if _rel_input.update is not UNSET:
                         rel_obj = getattr(
-                            val.model.objects.get(pk=int(_input.id)),
+                            instances.get(model, _input.id),
                             val.name,
                         )
                         if rel_obj is None:
                             raise SDJExtrasError(
                                 f"Cannot update non existing object for key {key}",
                             )
+                        instances.add(rel_obj)
                         _rel_input.update.id = rel_obj.pk  # pyright: ignore[reportOptionalMemberAccess]
-                        rel["before"].append(
-                            {"data_id": key, "operation": "update", "pk": rel_obj.pk},
-                        )
+                        child = rel.push("before", PlanNode("update", data_id=key, pk=rel_obj.pk))
                         rabbit_hole(
-                            val.related_model,
-                            _input.__dict__.get(key).update,
-                            rel["before"][-1],
+                            slot.related_model,
+                            _rel_input.update,
+                            child,
+                            instances=instances,
                         )
                     if _rel_input.delete is True:
-                        if _rel_input.assign is UNSET and _rel_input.create is UNSET:
+                        if (
+                            _rel_input.assign is UNSET
+                            and _rel_input.create is UNSET
+                            and _rel_input.upsert is UNSET
+                        ):
                             raise SDJExtrasError(
                                 "Cannot delete remote object without assigning or"
                                 " creating a new one. If the relationship is nullable"
@@ -988,87 +2020,160 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                                 " the parent update input had no id field provided.",
                             )
                         rel_obj = getattr(
-                            val.model.objects.get(pk=int(_input.id)),
+                            instances.get(model, _input.id),
                             val.name,
                         )
-                        rel["deletions"].append(
-                            {"model": val.related_model, "pks": [rel_obj.pk]},
+                        if rel_obj is None:
+                            raise SDJExtrasError(
+                                f"Cannot delete non existing object for key {key}",
+                            )
+                        # Unless the upsert matches the object it would replace
+                        rel.push(
+                            "deletions",
+                            {"model": val.related_model, "pks": [rel_obj.pk], "kept": upserted},
                         )
 
-            elif isinstance(val, ManyToOneRel):
-                _rel_input = _input.__dict__.get(key)  # noqa: RUF052
+            elif slot.kind == MANY_TO_ONE:
+                _rel_input = values[key]  # noqa: RUF052
                 if isinstance(_rel_input, CRUDManyToOneCreateInput):
-                    if _rel_input.create is UNSET and _rel_input.assign is UNSET:
-                        raise SDJExtrasError("Must create or assign or both")
+                    if (
+                        _rel_input.create is UNSET
+                        and _rel_input.assign is UNSET
+                        and _rel_input.upsert is UNSET
+                    ):
+                        raise SDJExtrasError("Must create, assign or upsert")
                     if _rel_input.assign is not UNSET:
-                        rel_objs = val.related_model.objects.filter(
-                            pk__in=[int(pk) for pk in _rel_input.assign],  # pyright: ignore[reportOptionalIterable]
-                        )
-                        if rel_objs.count() != len(_rel_input.assign):  # pyright: ignore[reportArgumentType]
-                            raise SDJExtrasError(
-                                f"Not all assigned objects found for {val.related_model.__name__}",
-                            )
-                        rel["assignments"].append(
-                            {"assignment_id": val.remote_field.name, "objs": rel_objs},
+                        rel.push(
+                            "assignments",
+                            {
+                                "assignment_id": slot.remote_name,
+                                "model": val.related_model,
+                                "pks": [
+                                    obj.pk
+                                    for obj in instances.get_many(
+                                        val.related_model,
+                                        _rel_input.assign,  # pyright: ignore[reportArgumentType]
+                                    )
+                                ],
+                                "data_id": key,
+                            },
                         )
                     if _rel_input.create is not UNSET:
-                        for item in _input.__dict__.get(key).create:
-                            rel["after"].append(
-                                {
-                                    "data_id": key,
-                                    "rel_data_id": val.remote_field.name,
-                                    "operation": "create",
-                                },
+                        for item in _rel_input.create:  # pyright: ignore[reportOptionalIterable]
+                            child = rel.push(
+                                "after",
+                                PlanNode("create", data_id=key, rel_data_id=slot.remote_name),
+                            )
+                            rabbit_hole(slot.related_model, item, child, instances=instances)
+                    if _rel_input.upsert is not UNSET:
+                        for item in _rel_input.upsert:  # pyright: ignore[reportOptionalIterable]
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "upsert",
+                                    data_id=key,
+                                    rel_data_id=slot.remote_name,
+                                    upsert_fields=getattr(type(item), "upsert_fields", None),
+                                ),
                             )
-                            rabbit_hole(val.related_model, item, rel["after"][-1])
+                            rabbit_hole(slot.related_model, item, child, instances=instances)
 
                 elif isinstance(_rel_input, CRUDManyToOneUpdateInput):
-                    if _rel_input.assign is not UNSET:
-                        rel_objs = val.related_model.objects.filter(
-                            pk__in=[int(pk) for pk in _rel_input.assign],  # pyright: ignore[reportOptionalIterable]
+                    if _rel_input.set is not UNSET:
+                        if _rel_input.assign is not UNSET or _rel_input.remove is not UNSET:
+                            raise SDJExtrasError("Cannot combine set with assign or remove")
+                        manager = getattr(
+                            instances.get(model, _input.id),
+                            slot.accessor,  # pyright: ignore[reportArgumentType]
                         )
-                        if rel_objs.count() != len(_rel_input.assign):  # pyright: ignore[reportArgumentType]
+                        added, removed = membership_diff(manager, _rel_input.set or [])
+                        if len(removed) > 0 and val.remote_field.null is not True:
                             raise SDJExtrasError(
-                                f"Not all assigned objects found for {val.related_model.__name__}",
+                                "Cannot remove remote objects from non nullable field"
+                                f" ( rel: {key} , model: {val.related_model.__name__})",
                             )
-                        rel["assignments"].append(
-                            {"assignment_id": val.remote_field.name, "objs": rel_objs},
-                        )
-                    if _rel_input.create is not UNSET:
-                        for item in _input.__dict__.get(key).create:
-                            rel["after"].append(
+                        if len(added) > 0:
+                            instances.get_many(val.related_model, added)
+                            rel.push(
+                                "assignments",
                                 {
+                                    "assignment_id": slot.remote_name,
+                                    "model": val.related_model,
+                                    "pks": added,
                                     "data_id": key,
-                                    "rel_data_id": val.remote_field.name,
-                                    "operation": "create",
                                 },
                             )
-                            rabbit_hole(val.related_model, item, rel["after"][-1])
-                    if _rel_input.update is not UNSET:
-                        for item in _input.__dict__.get(key).update:
-                            manager = getattr(
-                                val.model.objects.get(pk=int(_input.id)),  # pyright: ignore[reportAttributeAccessIssue]
-                                val.get_accessor_name(),  # pyright: ignore[reportArgumentType]
-                            )
-                            rel["after"].append(
+                        if len(removed) > 0:
+                            rel.push(
+                                "removals",
                                 {
-                                    "data_id": key,
-                                    "rel_data_id": val.remote_field.name,
-                                    "operation": "update",
-                                    "pk": item.id,
+                                    "model": val.related_model,
+                                    "rel_data_id": slot.remote_name,
+                                    "pks": removed,
                                     "manager": manager,
                                 },
                             )
-                            rabbit_hole(val.related_model, item, rel["after"][-1])
+                    if _rel_input.assign is not UNSET:
+                        rel.push(
+                            "assignments",
+                            {
+                                "assignment_id": slot.remote_name,
+                                "model": val.related_model,
+                                "pks": [
+                                    obj.pk
+                                    for obj in instances.get_many(
+                                        val.related_model,
+                                        _rel_input.assign,  # pyright: ignore[reportArgumentType]
+                                    )
+                                ],
+                                "data_id": key,
+                            },
+                        )
+                    if _rel_input.create is not UNSET:
+                        for item in _rel_input.create:  # pyright: ignore[reportOptionalIterable]
+                            child = rel.push(
+                                "after",
+                                PlanNode("create", data_id=key, rel_data_id=slot.remote_name),
+                            )
+                            rabbit_hole(slot.related_model, item, child, instances=instances)
+                    if _rel_input.upsert is not UNSET:
+                        for item in _rel_input.upsert:  # pyright: ignore[reportOptionalIterable]
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "upsert",
+                                    data_id=key,
+                                    rel_data_id=slot.remote_name,
+                                    upsert_fields=getattr(type(item), "upsert_fields", None),
+                                ),
+                            )
+                            rabbit_hole(slot.related_model, item, child, instances=instances)
+                    if _rel_input.update is not UNSET:
+                        manager = getattr(
+                            instances.get(model, _input.id),
+                            slot.accessor,  # pyright: ignore[reportArgumentType]
+                        )
+                        for item in _rel_input.update:  # pyright: ignore[reportOptionalIterable]
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "update",
+                                    data_id=key,
+                                    rel_data_id=slot.remote_name,
+                                    pk=item.id,
+                                    manager=manager,
+                                ),
+                            )
+                            rabbit_hole(slot.related_model, item, child, instances=instances)
                     if _rel_input.remove is not UNSET:
                         del_pks = [
                             int(item.id)
-                            for item in _input.__dict__.get(key).remove
+                            for item in _rel_input.remove  # pyright: ignore[reportOptionalIterable]
                             if item.delete is True
                         ]
                         rem_pks = [
                             int(item.id)
-                            for item in _input.__dict__.get(key).remove
+                            for item in _rel_input.remove  # pyright: ignore[reportOptionalIterable]
                             if item.delete is not True
                         ]
                         if len(rem_pks) > 0 and val.remote_field.null is not True:
@@ -1077,11 +2182,12 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                                 f" ( rel: {key} , model: {val.related_model.__name__})",
                             )
                         manager = getattr(
-                            val.model.objects.get(pk=int(_input.id)),  # pyright: ignore[reportAttributeAccessIssue]
-                            val.get_accessor_name(),  # pyright: ignore[reportArgumentType]
+                            instances.get(model, _input.id),
+                            slot.accessor,  # pyright: ignore[reportArgumentType]
                         )
                         if len(del_pks) > 0:
-                            rel["deletions"].append(
+                            rel.push(
+                                "deletions",
                                 {
                                     "model": val.related_model,
                                     "pks": del_pks,
@@ -1089,220 +2195,800 @@ def rabbit_hole(model, _input, rel, through_defaults=None):  # noqa: PLR0912, PL
                                 },
                             )
                         if len(rem_pks) > 0:
-                            rel["removals"].append(
+                            rel.push(
+                                "removals",
                                 {
                                     "model": val.related_model,
-                                    "rel_data_id": val.remote_field.name,
+                                    "rel_data_id": slot.remote_name,
                                     "pks": rem_pks,
                                     "manager": manager,
                                 },
                             )
 
-            elif isinstance(val, (ManyToManyField, ManyToManyRel)):
-                _rel_input = _input.__dict__.get(key)  # noqa: RUF052
+            elif slot.kind == MANY_TO_MANY:
+                _rel_input = values[key]  # noqa: RUF052
+                rel_name = slot.accessor
                 if isinstance(_rel_input, CRUDManyToManyCreateInput):
-                    if isinstance(val, ManyToManyField):
-                        rel_name = val.name
-                    elif isinstance(val, ManyToManyRel):
-                        rel_name = val.get_accessor_name()
-                    else:
-                        raise SDJExtrasError(
-                            f"Unable to determine manager for {val.__class__.__name__}",
-                        )
-                    if _rel_input.create is UNSET and _rel_input.assign is UNSET:
-                        raise SDJExtrasError("Must create or assign or both")
+                    if (
+                        _rel_input.create is UNSET
+                        and _rel_input.assign is UNSET
+                        and _rel_input.upsert is UNSET
+                    ):
+                        raise SDJExtrasError("Must create, assign or upsert")
                     if _rel_input.create is not UNSET:
                         for item in _rel_input.create:  # pyright: ignore[reportOptionalIterable]
-                            rel["after"].append(
-                                {
-                                    "data_id": key,
-                                    "operation": "create",
-                                    "accessor": rel_name,
-                                    "m2m": True,
-                                },
+                            child = rel.push(
+                                "after",
+                                PlanNode("create", data_id=key, accessor=rel_name, m2m=True),
+                            )
+                            rel.set_manager = True
+                            rabbit_hole(
+                                val.related_model,
+                                item.object_data,
+                                child,
+                                through_defaults=item.through_defaults,
+                                instances=instances,
                             )
-                            rel.update({"set_manager": True})
+                    if _rel_input.upsert is not UNSET:
+                        for item in _rel_input.upsert:  # pyright: ignore[reportOptionalIterable]
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "upsert",
+                                    data_id=key,
+                                    accessor=rel_name,
+                                    m2m=True,
+                                    upsert_fields=getattr(
+                                        type(item.object_data), "upsert_fields", None
+                                    ),
+                                ),
+                            )
+                            rel.set_manager = True
                             rabbit_hole(
                                 val.related_model,
                                 item.object_data,
-                                rel["after"][-1],
+                                child,
                                 through_defaults=item.through_defaults,
+                                instances=instances,
                             )
                     if _rel_input.assign is not UNSET:
                         for item in _rel_input.assign:  # pyright: ignore[reportOptionalIterable]
-                            rel["after"].append(
-                                {
-                                    "data_id": key,
-                                    "operation": "assign",
-                                    "accessor": rel_name,
-                                    "m2m": True,
-                                    "data": item,
-                                },
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "assign", data_id=key, accessor=rel_name, m2m=True, data=item
+                                ),
                             )
-                            rel.update({"set_manager": True})
+                            rel.set_manager = True
                             rabbit_hole(
                                 val.related_model,
                                 item.id,
-                                rel["after"][-1],
+                                child,
                                 through_defaults=item.through_defaults,
+                                instances=instances,
                             )
 
                 if isinstance(_rel_input, CRUDManyToManyUpdateInput):
-                    if isinstance(val, ManyToManyField):
-                        rel_name = val.name
-                    elif isinstance(val, ManyToManyRel):
-                        rel_name = val.get_accessor_name()
-                    else:
-                        raise SDJExtrasError(
-                            f"Unable to determine manager for {val.__class__.__name__}",
-                        )
-                    p_obj = val.model.objects.get(pk=int(_input.id))  # pyright: ignore[reportAttributeAccessIssue]
+                    p_obj = instances.get(model, _input.id)
                     manager = getattr(p_obj, rel_name)  # pyright: ignore[reportArgumentType]
+                    if _rel_input.set is not UNSET:
+                        if _rel_input.assign is not UNSET or _rel_input.remove is not UNSET:
+                            raise SDJExtrasError("Cannot combine set with assign or remove")
+                        added, removed = membership_diff(manager, _rel_input.set or [])
+                        if len(added) > 0:
+                            rel.push("links", {"manager": manager, "pks": added})
+                        if len(removed) > 0:
+                            rel.push("unlinks", {"manager": manager, "pks": removed})
                     if _rel_input.create is not UNSET:
                         for item in _rel_input.create:  # pyright: ignore[reportOptionalIterable]
-                            rel["after"].append(
-                                {
-                                    "data_id": key,
-                                    "operation": "create",
-                                    "accessor": rel_name,
-                                    "manager": manager,
-                                    "m2m": True,
-                                },
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "create",
+                                    data_id=key,
+                                    accessor=rel_name,
+                                    manager=manager,
+                                    m2m=True,
+                                ),
                             )
 
                             rabbit_hole(
                                 val.related_model,
                                 item.object_data,
-                                rel["after"][-1],
+                                child,
                                 through_defaults=item.through_defaults,
+                                instances=instances,
                             )
                     if _rel_input.assign is not UNSET:
                         for item in _rel_input.assign:  # pyright: ignore[reportOptionalIterable]
-                            rel["after"].append(
-                                {
-                                    "data_id": key,
-                                    "operation": "assign",
-                                    "accessor": rel_name,
-                                    "manager": manager,
-                                    "m2m": True,
-                                    "data": item,
-                                },
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "assign",
+                                    data_id=key,
+                                    accessor=rel_name,
+                                    manager=manager,
+                                    m2m=True,
+                                    data=item,
+                                ),
                             )
                             rabbit_hole(
                                 val.related_model,
                                 item.id,
-                                rel["after"][-1],
+                                child,
+                                through_defaults=item.through_defaults,
+                                instances=instances,
+                            )
+                    if _rel_input.upsert is not UNSET:
+                        for item in _rel_input.upsert:  # pyright: ignore[reportOptionalIterable]
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "upsert",
+                                    data_id=key,
+                                    accessor=rel_name,
+                                    manager=manager,
+                                    m2m=True,
+                                    upsert_fields=getattr(
+                                        type(item.object_data), "upsert_fields", None
+                                    ),
+                                ),
+                            )
+
+                            rabbit_hole(
+                                val.related_model,
+                                item.object_data,
+                                child,
                                 through_defaults=item.through_defaults,
+                                instances=instances,
                             )
                     if _rel_input.update is not UNSET:
                         for item in _rel_input.update:  # pyright: ignore[reportOptionalIterable]
-                            rel["after"].append(
-                                {
-                                    "data_id": key,
-                                    "operation": "update",
-                                    "accessor": rel_name,
-                                    "manager": manager,
-                                    "m2m": True,
-                                    "p_obj": p_obj,
-                                },
+                            child = rel.push(
+                                "after",
+                                PlanNode(
+                                    "update",
+                                    data_id=key,
+                                    accessor=rel_name,
+                                    manager=manager,
+                                    m2m=True,
+                                    owner=p_obj,
+                                ),
                             )
 
                             rabbit_hole(
                                 val.related_model,
                                 item.object_data,
-                                rel["after"][-1],
+                                child,
                                 through_defaults=item.through_defaults,
+                                instances=instances,
                             )
                     if _rel_input.remove is not UNSET:
                         for item in _rel_input.remove:  # pyright: ignore[reportOptionalIterable]
-                            rel["after"].append(
-                                {
-                                    "data_id": key,
-                                    "operation": "remove",
-                                    "accessor": rel_name,
-                                    "manager": manager,
-                                    "m2m": True,
-                                    "data": item.__dict__,
-                                },
+                            rel.push(
+                                "after",
+                                PlanNode(
+                                    "remove",
+                                    data_id=key,
+                                    accessor=rel_name,
+                                    manager=manager,
+                                    m2m=True,
+                                    data=item.__dict__,
+                                ),
                             )
 
             else:
-                rel["data"].update({key: _input.__dict__.get(key)})
+                rel.data[key] = values[key]
+
+
+def _one_of_target(one_of):
+    for field_name in one_of.__dataclass_fields__:
+        value = getattr(one_of, field_name)
+        if value is not None and value is not UNSET:
+            return one_of._model_mapping[field_name], value  # noqa: SLF001
+    return None, None
+
+
+def _collect_slot_targets(slot, _rel_input, stack, targets):  # noqa: PLR0912
+    create = getattr(_rel_input, "create", UNSET)
+    update = getattr(_rel_input, "update", UNSET)
+    assign = getattr(_rel_input, "assign", UNSET)
+    upsert = getattr(_rel_input, "upsert", UNSET)
+    set_ = getattr(_rel_input, "set", UNSET)
+
+    if slot.kind == GENERIC_FK:
+        for one_of in (create, update):
+            if one_of is not UNSET and one_of is not None:
+                target_model, target_data = _one_of_target(one_of)
+                if target_model is not None:
+                    stack.append((target_model, target_data))
+        return
+
+    related_model = slot.related_model
+    if slot.kind == MANY_TO_MANY:
+        for items in (create, update, upsert):
+            if items is not UNSET and items is not None:
+                stack.extend((related_model, item.object_data) for item in items)
+        if assign is not UNSET and assign is not None:
+            targets.setdefault(related_model, set()).update(item.id for item in assign)
+        if set_ is not UNSET and set_ is not None:
+            targets.setdefault(related_model, set()).update(set_)
+        return
+
+    for nested in (create, update, upsert):
+        if isinstance(nested, list):
+            stack.extend((related_model, item) for item in nested)
+        elif nested is not UNSET and nested is not None:
+            stack.append((related_model, nested))
+
+    # Generic relations assign through a single UPDATE that checks its own row count
+    if slot.kind == GENERIC_RELATION:
+        return
+    if set_ is not UNSET and set_ is not None:
+        targets.setdefault(related_model, set()).update(set_)
+    if assign is UNSET or assign is None:
+        return
+    if isinstance(assign, list):
+        targets.setdefault(related_model, set()).update(assign)
+    else:
+        targets.setdefault(related_model, set()).add(assign)
+
+
+def _collect_slot_references(slot, _rel_input, referenced):
+    if slot.kind == GENERIC_FK:
+        update = getattr(_rel_input, "update", UNSET)
+        if update is not UNSET and update is not None:
+            target_model, target_data = _one_of_target(update)
+            if target_model is not None:
+                _collect_input_id(target_model, target_data, referenced)
+        return
+
+    related_model = slot.related_model
+    for item in _input_items(getattr(_rel_input, "update", UNSET)):
+        _collect_input_id(
+            related_model, item.object_data if slot.kind == MANY_TO_MANY else item, referenced
+        )
+    for item in _input_items(getattr(_rel_input, "remove", UNSET)):
+        referenced.setdefault(related_model, set()).add(item.id)
+
+
+def _collect_input_id(model, item, referenced):
+    pk = getattr(item, "id", UNSET)
+    if pk is not UNSET and pk is not None:
+        referenced.setdefault(model, set()).add(pk)
+
+
+def collect_assign_targets(model, _input, targets=None, referenced=None):
+    """
+    Collect the pks of every existing object assigned anywhere in the input tree, by model.
+
+    With `referenced`, the pks of the objects the input tree updates or removes, the roots
+    included, are collected into it as well.
+    """
+    if targets is None:
+        targets = {}
+
+    inputs = _input if isinstance(_input, list) else [_input]
+    if referenced is not None:
+        for item in inputs:
+            _collect_input_id(model, item, referenced)
+    stack = [(model, item) for item in reversed(inputs)]
+    while stack:
+        node_model, node_input = stack.pop()
+        if not (
+            hasattr(node_input, "__strawberry_definition__")
+            and node_input.__strawberry_definition__.is_input is True
+        ):
+            continue
+
+        values = node_input.__dict__
+        for slot in get_plan_template(node_model, type(node_input)).slots_for(values):
+            _rel_input = values.get(slot.key, UNSET)  # noqa: RUF052
+            if isinstance(_rel_input, CRUDInput):
+                _collect_slot_targets(slot, _rel_input, stack, targets)
+                if referenced is not None:
+                    _collect_slot_references(slot, _rel_input, referenced)
+
+    return targets
+
+
+def _input_items(value):
+    if value is UNSET or value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+# Statements of each write to a relation, on top of the batched rows it writes: reverse
+# foreign key and generic assignments are one UPDATE, many to many links a SELECT and an
+# INSERT, forward relations are written along with the row of their parent.
+_ASSIGN_STATEMENTS = {
+    MANY_TO_ONE: 1,
+    GENERIC_RELATION: 1,
+    MANY_TO_MANY: 2,
+}
+
+
+class _CostCounter:
+    def __init__(self):
+        self.nodes = 0
+        self.depth = 0
+        self.statements = {}
+        # Rows batched by the plan: (kind, model, depth) -> count
+        self.groups = {}
+        # Statements merged per model: (kind, model)
+        self.tables = set()
+
+    def add(self, kind, count) -> None:
+        self.statements[kind] = self.statements.get(kind, 0) + count
+
+    def add_slot(self, slot, _rel_input, level, stack) -> None:
+        related_model = slot.related_model
+        for kind in ("create", "upsert", "update"):
+            items = _input_items(getattr(_rel_input, kind, UNSET))
+            for item in items:
+                if slot.kind == GENERIC_FK:
+                    target_model, target_data = _one_of_target(item)
+                elif slot.kind == MANY_TO_MANY:
+                    target_model, target_data = related_model, item.object_data
+                else:
+                    target_model, target_data = related_model, item
+                if target_model is None:
+                    continue
+                self.nodes += 1
+                key = kind, target_model, level + 1
+                self.groups[key] = self.groups.get(key, 0) + 1
+                stack.append((target_model, target_data, level + 1))
+            if items and slot.kind == MANY_TO_MANY and kind != "update":
+                self.add(kind, _ASSIGN_STATEMENTS[MANY_TO_MANY])
+
+        assign = _input_items(getattr(_rel_input, "assign", UNSET))
+        if assign:
+            self.nodes += len(assign)
+            self.add("assign", _ASSIGN_STATEMENTS.get(slot.kind, 0))
+            if slot.kind != GENERIC_FK:
+                # Assigned objects are loaded with one query per model up front
+                self.tables.add(("assign", related_model))
+
+        for item in _input_items(getattr(_rel_input, "remove", UNSET)):
+            self.nodes += 1
+            self.tables.add(("delete" if item.delete is True else "remove", related_model))
+
+        set_ = getattr(_rel_input, "set", UNSET)
+        if set_ is not UNSET:
+            self.nodes += len(set_ or [])
+            # The current members, then the added and the removed ones
+            self.add("set", 3)
+
+        if getattr(_rel_input, "delete", None) is True:
+            self.tables.add(("delete", related_model))
+
+    def cost(self) -> MutationCost:
+        for (kind, model, _), count in self.groups.items():
+            if kind == "update":
+                # The rows are loaded, then written with one bulk_update
+                self.add(kind, 2)
+            else:
+                self.add(kind, 1 if can_bulk_create(model) else count)
+        for kind, _ in self.tables:
+            self.add(kind, 1)
+        return MutationCost(nodes=self.nodes, depth=self.depth, statements=self.statements)
+
+
+def measure_input(model, _input) -> MutationCost:
+    """
+    Walk a mutation input once and predict what executing it costs, without any query.
+
+    Rows of a kind written to the same model at the same depth are batched together by
+    the plan, so they count as one statement when the model allows `bulk_create`.
+    Deletions and removals are merged per model. The prediction is an estimate of the
+    plan, meant to tell a handful of statements from thousands of them.
+    """
+    inputs = _input if isinstance(_input, list) else [_input]
+    counter = _CostCounter()
+    counter.nodes = len(inputs)
+    if inputs:
+        counter.add("root", len(inputs))
+
+    stack = [(model, item, 1) for item in inputs]
+    while stack:
+        node_model, node_input, level = stack.pop()
+        if not (
+            hasattr(node_input, "__strawberry_definition__")
+            and node_input.__strawberry_definition__.is_input is True
+        ):
+            continue
+
+        counter.depth = max(counter.depth, level)
+        values = node_input.__dict__
+        for slot in get_plan_template(node_model, type(node_input)).slots_for(values):
+            _rel_input = values.get(slot.key, UNSET)  # noqa: RUF052
+            if isinstance(_rel_input, CRUDInput):
+                counter.add_slot(slot, _rel_input, level, stack)
+
+    return counter.cost()
+
+
+def check_mutation_limits(cost, max_nodes=None, max_depth=None, max_statements=None) -> None:
+    """Raise `MutationLimitError` when `cost` exceeds any of the given limits."""
+    for limit, value, maximum in (
+        ("max_nodes", cost.nodes, max_nodes),
+        ("max_depth", cost.depth, max_depth),
+        ("max_statements", cost.total_statements, max_statements),
+    ):
+        if maximum is not None and value > maximum:
+            raise MutationLimitError(
+                f"Mutation input exceeds {limit}: {value} > {maximum}",
+                extensions={
+                    "code": "MUTATION_LIMIT_EXCEEDED",
+                    "limit": limit,
+                    "value": value,
+                    "maximum": maximum,
+                    "cost": cost._asdict(),
+                },
+            )
 
 
-# noinspection DuplicatedCode
-def perform_validation(_input, info):
-    if isinstance(_input, list):
-        for item in _input:
-            perform_validation(item, info)
+def raise_missing_targets(missing) -> None:
+    """Raise for the assigned objects `prefetch_assign_targets` did not find, if any."""
+    if missing:
+        details = "; ".join(
+            f"{target_model.__name__} ({', '.join(sorted(str(pk) for pk in pks))})"
+            for target_model, pks in missing.items()
+        )
+        raise SDJExtrasError(f"Assigned objects not found: {details}")
+
+
+def _prefetch_targets(model, _input, referenced):
+    # (model, pks to load, assigned pks that must exist) of one query each
+    references = {} if referenced else None
+    targets = collect_assign_targets(model, _input, referenced=references)
+    for target_model in {**targets, **(references or {})}:
+        assigned = targets.get(target_model, set())
+        pks = assigned.union(references.get(target_model, ())) if references else assigned
+        yield target_model, pks, assigned
+
+
+def _missing_assigned(target_model, assigned, not_found):
+    to_python = target_model._meta.pk.to_python  # noqa: SLF001
+    return not_found.intersection(to_python(pk) for pk in assigned)
+
+
+def prefetch_assign_targets(model, _input, instances, referenced=False, strict=True):
+    """
+    Load every assigned object of the input tree with one query per model.
+
+    With `referenced` the objects it updates or removes, its roots included, are loaded
+    along in the same queries so that input hooks and planning find them in `instances`.
+    Only missing assigned objects are an error, missing updated or removed ones fail where
+    they are written. Unless `strict` the missing assigned objects are returned by model
+    instead, for `raise_missing_targets` once the input has been checked.
+    """
+    missing = {}
+    for target_model, pks, assigned in _prefetch_targets(model, _input, referenced):
+        not_found = _missing_assigned(target_model, assigned, instances.load(target_model, pks))
+        if not_found:
+            missing[target_model] = not_found
+    if strict:
+        raise_missing_targets(missing)
+    return missing
+
+
+async def aprefetch_assign_targets(model, _input, instances, referenced=False, strict=True):
+    """Async version of `prefetch_assign_targets`, using the async ORM."""
+    missing = {}
+    for target_model, pks, assigned in _prefetch_targets(model, _input, referenced):
+        not_found = await instances.aload(target_model, pks)
+        not_found = _missing_assigned(target_model, assigned, not_found)
+        if not_found:
+            missing[target_model] = not_found
+    if strict:
+        raise_missing_targets(missing)
+    return missing
+
+
+def execute_mutation(  # noqa: PLR0913, PLR0917
+    model,
+    mutation_input,
+    next_,
+    source,
+    info,
+    argument_name="data",
+    instances=None,
+    savepoints=True,
+    created=False,
+    batch_size=None,
+):
+    """
+    Plan the nested relations of a mutation input and execute the plan around `next_`.
+
+    Planning and execution run back to back so that the async resolvers can run them in a
+    single thread hop. A list of inputs is planned as a whole: its roots are written by one
+    call to `next_` and their nested objects are batched across all of them.
+
+    With `created`, i.e. for create mutations, the relation caches of the created objects
+    are primed with what was written, see `prime_relation_caches`. `batch_size` bounds the
+    rows written or loaded by a single statement, see `kill_a_rabbit`.
+    """
+    if instances is None:
+        instances = InstanceCache(batch_size)
+
+    is_list = isinstance(mutation_input, list)
+    inputs = mutation_input if is_list else [mutation_input]
+    if not inputs:
+        return next_(source, info, **{argument_name: mutation_input})
+
+    with phase(info, "planning"):
+        if is_list:
+            # Update inputs load their root while planning, fetch all of them at once
+            pks = [pk for pk in (getattr(item, "id", UNSET) for item in inputs) if pk]
+            if pks:
+                instances.load(model, pks)
+
+        rels = []
+        for item in inputs:
+            rel = PlanNode()
+            rabbit_hole(model, item, rel, instances=instances)
+            for k, v in item.__dict__.copy().items():
+                if isinstance(v, CRUDInput):
+                    delattr(item, k)
+            rels.append(rel)
+
+    with phase(info, "execution"):
+        resolved = kill_a_rabbit(
+            rels if is_list else rels[0],
+            None,
+            False,
+            is_root=True,
+            next_=next_,
+            source=source,
+            info=info,
+            ni=mutation_input,
+            argument_name=argument_name,
+            instances=instances,
+            savepoints=savepoints,
+            batch_size=batch_size,
+        )
+    if created:
+        prime_relation_caches(rels, instances)
+    return resolved
 
-    if (
-        hasattr(_input, "__strawberry_definition__")
-        and _input.__strawberry_definition__.is_input is True  # pyright: ignore[reportAttributeAccessIssue]
-    ):
-        for v in _input.__dict__.values():
-            if isinstance(v, list):
-                for item in v:
-                    perform_validation(item, info)
-
-            if (
-                hasattr(v, "__strawberry_definition__")
-                and v.__strawberry_definition__.is_input is True  # pyright: ignore[reportAttributeAccessIssue]
-            ):
-                perform_validation(v, info)
 
-        if hasattr(_input, "validate") and callable(_input.validate):  # pyright: ignore[reportAttributeAccessIssue]
-            _input.validate(info)  # pyright: ignore[reportAttributeAccessIssue]
+# Profiling phase of each kind of input hooks
+_HOOK_PHASES = {"check_permissions": "permissions", "validate": "validation"}
 
-        for key, val in _input.__dict__.items():
-            if val is not None and val is not UNSET:
-                if hasattr(_input, f"validate_{to_camel_case(key)}") and callable(
-                    getattr(_input, f"validate_{to_camel_case(key)}")
-                ):
-                    getattr(_input, f"validate_{to_camel_case(key)}")(info, val)
-                    continue
 
-                if hasattr(_input, f"validate_{key}") and callable(
-                    getattr(_input, f"validate_{key}")
-                ):
-                    getattr(_input, f"validate_{key}")(info, val)
+def _call_hook(call, info) -> None:
+    if call.awaitable:
+        async_to_sync(call.method)(info, *call.args)
+    else:
+        call.method(info, *call.args)
+
+
+def _input_hook_calls(_input, kind, hooks, extra):
+    if hooks.hook is not None:
+        method = getattr(_input, hooks.hook)
+        yield HookCall(method, (), inspect.iscoroutinefunction(method))
+
+    fields = hooks.fields
+    if extra:
+        fields = (
+            *fields,
+            *((key, name) for key in extra if (name := input_hook(type(_input), kind, key))),
+        )
+
+    values = _input.__dict__
+    for key, name in fields:
+        value = values.get(key, UNSET)
+        if value is not None and value is not UNSET:
+            method = getattr(_input, name)
+            yield HookCall(method, (value,), inspect.iscoroutinefunction(method))
+
+
+def _active_input_hooks(_input, kinds):
+    definition = getattr(_input, "__strawberry_definition__", None)
+    if definition is None or getattr(definition, "is_input", False) is not True:
+        return None, ()
+
+    input_cls = type(_input)
+    active = [(kind, hooks) for kind in kinds if (hooks := get_input_hooks(input_cls, kind)).active]
+    if not active:
+        return None, ()
+
+    # Fields are the same for every kind
+    hooks = active[0][1]
+    values = _input.__dict__
+    # Attributes set on the input without being declared by its class
+    extra = (
+        () if hooks.declared.issuperset(values) else [k for k in values if k not in hooks.declared]
+    )
+    return active, extra
+
+
+def _flatten(values):
+    if isinstance(values, list):
+        for value in values:
+            yield from _flatten(value)
+    else:
+        yield values
+
+
+def _batch_hook_calls(entries, kind):
+    # One call per input class with all of its inputs in the list
+    groups = {}
+    for item, _, _ in entries:
+        groups.setdefault(type(item), []).append(item)
+    for input_cls, items in groups.items():
+        name = get_input_hooks(input_cls, kind).batch
+        if name is not None:
+            method = getattr(input_cls, name)
+            yield HookCall(method, (items,), inspect.iscoroutinefunction(method))
+
+
+def _collect_input_hook_calls(_input, kinds, calls):
+    # The calls of each kind go to `calls[kind]`, innermost inputs first
+    entries = []
+    for item in _flatten(_input):
+        active, extra = _active_input_hooks(item, kinds)
+        if active is None:
+            continue
+
+        entries.append((item, active, extra))
+        values = item.__dict__
+        for key in (*active[0][1].nested, *extra):
+            value = values.get(key)
+            if value is not None and value is not UNSET:
+                _collect_input_hook_calls(value, kinds, calls)
+
+        for kind, hooks in active:
+            calls[kind].extend(_input_hook_calls(item, kind, hooks, extra))
+
+    for kind in kinds:
+        calls[kind].extend(_batch_hook_calls(entries, kind))
+
+
+def run_input_hooks(_input, info, *kinds, timed=False):
+    """
+    Call the hooks of the given kinds, e.g. `check_permissions` and `validate`, of an input
+    tree, collected in a single walk.
+
+    The kinds run one after the other in the given order, every hook of a kind for the whole
+    tree before any hook of the next one: no validator runs before all permission checks
+    passed. Within a kind inputs are visited innermost first, each calling `<kind>(info)`,
+    then `<kind>_<key>(info, value)` for every key that is set, see `get_input_hooks`. Once
+    the inputs of a list, or a single input, are done the `<kind>_batch(info, items)` class
+    hook of their class is called once with all of them. Inputs without hooks anywhere below
+    them are skipped. With `timed` the hooks are attributed to their profiling phase.
+    Coroutine hooks are run to completion one at a time, async code should use
+    `arun_input_hooks` instead.
+    """
+    calls = {kind: [] for kind in kinds}
+    _collect_input_hook_calls(_input, kinds, calls)
+    for kind in kinds:
+        if calls[kind]:
+            with phase(info, _HOOK_PHASES.get(kind, kind)) if timed else nullcontext():
+                for call in calls[kind]:
+                    _call_hook(call, info)
+
+
+def _input_hook_levels(_input, kinds):
+    # The inputs with hooks of each depth, grouped by the list holding them
+    levels = []
+    groups = [_input]
+    while groups:
+        level = []
+        children = []
+        for group in groups:
+            entries = []
+            for item in _flatten(group):
+                active, extra = _active_input_hooks(item, kinds)
+                if active is None:
                     continue
 
+                entries.append((item, active, extra))
+                values = item.__dict__
+                for key in (*active[0][1].nested, *extra):
+                    value = values.get(key)
+                    if value is not None and value is not UNSET:
+                        children.append(value)
+
+            if entries:
+                level.append(entries)
+
+        if level:
+            levels.append(level)
+        groups = children
+
+    return levels
+
+
+def has_input_hooks(_input, *kinds) -> bool:
+    """Whether any input of the tree may have hooks of the given kinds to call."""
+    return any(_active_input_hooks(item, kinds)[0] is not None for item in _flatten(_input))
+
+
+def input_hook_steps(_input, *kinds) -> list[tuple[str, list[HookCall]]]:
+    """
+    Return the hook calls of the given kinds of an input tree as steps to run in order.
+
+    The kinds come one after the other in the given order, like in `run_input_hooks`. For
+    each kind a step holds its calls for all the inputs at the same depth, deepest inputs
+    first, followed by the step of the `<kind>_batch` hooks of the lists at that depth.
+    Calls of a step do not depend on each other, see `arun_hook_steps`.
+    """
+    levels = _input_hook_levels(_input, kinds)[::-1]
+    steps = []
+    for kind in kinds:
+        for level in levels:
+            calls = [
+                call
+                for entries in level
+                for item, active, extra in entries
+                for active_kind, hooks in active
+                if active_kind == kind
+                for call in _input_hook_calls(item, kind, hooks, extra)
+            ]
+            if calls:
+                steps.append((kind, calls))
+            calls = [call for entries in level for call in _batch_hook_calls(entries, kind)]
+            if calls:
+                steps.append((kind, calls))
+    return steps
+
+
+def run_hook_steps(steps, info, *, timed=False) -> None:
+    """Run the steps of `input_hook_steps` one call after the other."""
+    for kind, calls in steps:
+        with phase(info, _HOOK_PHASES.get(kind, kind)) if timed else nullcontext():
+            for call in calls:
+                _call_hook(call, info)
+
+
+async def arun_hook_steps(steps, info, *, timed=False, concurrency=None) -> None:
+    """
+    Run the steps of `input_hook_steps` from async code.
+
+    The coroutine hooks of a step are awaited concurrently, at most `concurrency` at a time
+    when it is set, alongside a single thread hop calling the step's sync hooks. Once all
+    calls of a step are done its first error is raised, those of sync hooks first.
+    """
+    limit = asyncio.Semaphore(concurrency) if concurrency else None
+
+    async def limited(awaitable):
+        if limit is None:
+            return await awaitable
+        async with limit:
+            return await awaitable
+
+    for kind, calls in steps:
+        async with aphase(info, _HOOK_PHASES.get(kind, kind)) if timed else nullcontext():
+            awaitables = [call.method(info, *call.args) for call in calls if call.awaitable]
+            sync_calls = [call for call in calls if not call.awaitable]
+            if sync_calls:
+                awaitables.insert(0, sync_to_async(run_hook_steps)([(kind, sync_calls)], info))
+            results = await asyncio.gather(
+                *(limited(awaitable) for awaitable in awaitables), return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
 
-# noinspection DuplicatedCode
-def check_permissions(_input, info):
-    if isinstance(_input, list):
-        for item in _input:
-            check_permissions(item, info)
 
-    if (
-        hasattr(_input, "__strawberry_definition__")
-        and _input.__strawberry_definition__.is_input is True  # pyright: ignore[reportAttributeAccessIssue]
-    ):
-        for v in _input.__dict__.values():
-            if isinstance(v, list):
-                for item in v:
-                    check_permissions(item, info)
-
-            if (
-                hasattr(v, "__strawberry_definition__")
-                and v.__strawberry_definition__.is_input is True  # pyright: ignore[reportAttributeAccessIssue]
-            ):
-                check_permissions(v, info)
+async def arun_input_hooks(_input, info, *kinds, timed=False, concurrency=None) -> None:
+    """
+    Async version of `run_input_hooks`, awaiting coroutine hooks, see `arun_hook_steps`.
 
-        if hasattr(_input, "check_permissions") and callable(_input.check_permissions):  # pyright: ignore[reportAttributeAccessIssue]
-            _input.check_permissions(info)  # pyright: ignore[reportAttributeAccessIssue]
+    Inputs without coroutine hooks are walked in a single thread hop.
+    """
+    steps = input_hook_steps(_input, *kinds)
+    if any(call.awaitable for _, calls in steps for call in calls):
+        await arun_hook_steps(steps, info, timed=timed, concurrency=concurrency)
+    elif steps:
+        await sync_to_async(run_hook_steps)(steps, info, timed=timed)
 
-        for key, val in _input.__dict__.items():
-            if val is not None and val is not UNSET:
-                if hasattr(_input, f"check_permissions_{to_camel_case(key)}") and callable(
-                    getattr(_input, f"check_permissions_{to_camel_case(key)}")
-                ):
-                    getattr(_input, f"check_permissions_{to_camel_case(key)}")(info, val)
-                    continue
 
-                if hasattr(_input, f"check_permissions_{key}") and callable(
-                    getattr(_input, f"check_permissions_{key}")
-                ):
-                    getattr(_input, f"check_permissions_{key}")(info, val)
-                    continue
+def perform_validation(_input, info):
+    run_input_hooks(_input, info, "validate")
+
+
+def check_permissions(_input, info):
+    run_input_hooks(_input, info, "check_permissions")
@@ -62,29 +62,32 @@ class CRUDOneToOneCreateInput(CRUDInput, Generic[T_CREATE]):
 
 @strawberry.input(
     name="__Many2OneCreateInput",
-    description="Used for ManyToOne relationships when creating an object. Allows to either create nested objects or assign existing objects to the newly created object.",
+    description="Used for ManyToOne relationships when creating an object. Allows to either create nested objects or assign existing objects to the newly created object. Objects can also be upserted, i.e. created or updated based on their unique fields.",
 )
 class CRUDManyToOneCreateInput(CRUDInput, Generic[T_CREATE]):
     create: list[T_CREATE] | None = UNSET
     assign: list[ID] | None = UNSET
+    upsert: list[T_CREATE] | None = UNSET
 
 
 @strawberry.input(
     name="__One2ManyCreateInput",
-    description="Used for OneToMany relationships when creating an object. Allows to either create nested objects or assign existing objects to the newly created object.",
+    description="Used for OneToMany relationships when creating an object. Allows to either create nested objects or assign existing objects to the newly created object. Objects can also be upserted, i.e. created or updated based on their unique fields.",
 )
 class CRUDOneToManyCreateInput(CRUDInput, Generic[T_CREATE, T_ASSIGN]):
     create: T_CREATE | None = UNSET
     assign: T_ASSIGN | None = UNSET
+    upsert: T_CREATE | None = UNSET
 
 
 @strawberry.input(
     name="__Many2ManyCreateInput",
-    description="Used for ManyToMany relationships when creating an object. Allows to either create nested objects or assign existing objects to the newly created object.",
+    description="Used for ManyToMany relationships when creating an object. Allows to either create nested objects or assign existing objects to the newly created object. Objects can also be upserted, i.e. created or updated based on their unique fields.",
 )
 class CRUDManyToManyCreateInput(CRUDInput, Generic[T_CREATE]):
     create: list[CRUDManyToManyItem[T_CREATE]] | None = UNSET
     assign: list[CRUDManyToManyID] | None = UNSET
+    upsert: list[CRUDManyToManyItem[T_CREATE]] | None = UNSET
 
 
 # UPDATE INPUTS
@@ -103,32 +106,37 @@ class CRUDOneToOneUpdateInput(CRUDInput, Generic[T_CREATE, T_UPDATE]):
 
 @strawberry.input(
     name="__One2ManyUpdateInput",
-    description="Used for OneToMany relationships when updating an object. Supports nested creation, assignment to object or null if the field is nullable, updates to the data of existing related objects and an optional delete flag to delete the previously assigned object in case of reassignment.",
+    description="Used for OneToMany relationships when updating an object. Supports nested creation, assignment to object or null if the field is nullable, updates to the data of existing related objects and an optional delete flag to delete the previously assigned object in case of reassignment. Objects can also be upserted, i.e. created or updated based on their unique fields.",
 )
 class CRUDOneToManyUpdateInput(CRUDInput, Generic[T_CREATE, T_ASSIGN, T_UPDATE]):
     create: T_CREATE | None = UNSET
     assign: T_ASSIGN | None = UNSET
     update: T_UPDATE | None = UNSET
+    upsert: T_CREATE | None = UNSET
     delete: bool | None = False
 
 
 @strawberry.input(
     name="__Many2OneUpdateInput",
-    description="Used for ManyToOne relationships when updating an object. Supports nested creation, assignment of objects, updates to the data of existing related objects (IDs must be provided by the Input) and removal of related with an optional delete flag to delete the previously assigned objects.",
+    description="Used for ManyToOne relationships when updating an object. Supports nested creation, assignment of objects, updates to the data of existing related objects (IDs must be provided by the Input) and removal of related with an optional delete flag to delete the previously assigned objects, or replacing the related objects with a given set. Objects can also be upserted, i.e. created or updated based on their unique fields.",
 )
 class CRUDManyToOneUpdateInput(CRUDInput, Generic[T_CREATE, T_UPDATE]):
     create: list[T_CREATE] | None = UNSET
     update: list[T_UPDATE] | None = UNSET
     assign: list[ID] | None = UNSET
     remove: list[CRUDRemoveInput] | None = UNSET
+    upsert: list[T_CREATE] | None = UNSET
+    set: list[ID] | None = UNSET
 
 
 @strawberry.input(
     name="__Many2ManyUpdateInput",
-    description="Used for ManyToMany relationships when updating an object. Supports nested creation, assignment of objects, updates to the data of existing related objects (IDs must be provided by the Input) and removal of related with an optional delete flag to delete the previously assigned objects.",
+    description="Used for ManyToMany relationships when updating an object. Supports nested creation, assignment of objects, updates to the data of existing related objects (IDs must be provided by the Input) and removal of related with an optional delete flag to delete the previously assigned objects, or replacing the related objects with a given set. Objects can also be upserted, i.e. created or updated based on their unique fields.",
 )
 class CRUDManyToManyUpdateInput(CRUDInput, Generic[T_CREATE, T_UPDATE]):
     create: list[CRUDManyToManyItem[T_CREATE]] | None = UNSET
     update: list[CRUDManyToManyItemUpdate[T_UPDATE]] | None = UNSET
     assign: list[CRUDManyToManyID] | None = UNSET
     remove: list[CRUDRemoveInput] | None = UNSET
+    upsert: list[CRUDManyToManyItem[T_CREATE]] | None = UNSET
+    set: list[ID] | None = UNSET
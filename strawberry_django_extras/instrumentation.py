@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from strawberry.extensions import SchemaExtension
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Callable, Iterator
+
+    from strawberry.types import ExecutionContext, Info
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("validation", "permissions", "hooks", "planning", "execution", "response")
+STATEMENTS = ("select", "insert", "update", "delete")
+
+# The profiles of the mutations of the operation being executed, by response key
+_profiles: ContextVar[dict[str, MutationProfile] | None] = ContextVar("profiles", default=None)
+# The profile and phase statements are counted against
+_current: ContextVar[tuple[MutationProfile, str] | None] = ContextVar("phase", default=None)
+# The connections counting statements for the outermost phase being timed
+_wrapped: ContextVar[list[Any] | None] = ContextVar("wrapped", default=None)
+# Guards the number of outermost phases counting the statements of each connection
+_wrapping = threading.Lock()
+
+
+class MutationProfile:
+    """Wall time and statements issued by one mutation field, per phase."""
+
+    __slots__ = ("field", "phases")
+
+    def __init__(self, field: str):
+        self.field = field
+        self.phases: dict[str, dict[str, float]] = {}
+
+    def entry(self, name: str) -> dict[str, float]:
+        entry = self.phases.get(name)
+        if entry is None:
+            entry = self.phases[name] = dict.fromkeys(("ms", *STATEMENTS, "other"), 0)
+        return entry
+
+    def as_dict(self) -> dict[str, Any]:
+        phases = {
+            name: {**self.phases[name], "ms": round(self.phases[name]["ms"], 3)}
+            for name in PHASES
+            if name in self.phases
+        }
+        total = dict.fromkeys(("ms", *STATEMENTS, "other"), 0)
+        for entry in phases.values():
+            for key, value in entry.items():
+                total[key] += value
+        total["ms"] = round(total["ms"], 3)
+        return {"field": self.field, "phases": phases, "total": total}
+
+
+def _count_statement(execute, sql, params, many, context):
+    current = _current.get()
+    if current is not None:
+        keyword = sql.lstrip().split(None, 1)[0].lower() if sql else ""
+        entry = current[0].entry(current[1])
+        entry[keyword if keyword in STATEMENTS else "other"] += 1
+    return execute(sql, params, many, context)
+
+
+def _wrap(connection, wrapped: list[Any]) -> None:
+    # Concurrent operations can share a connection, each of them holds on to the counter
+    if any(other is connection for other in wrapped):
+        return
+    with _wrapping:
+        count = getattr(connection, "_profiled_phases", 0)
+        if count == 0:
+            connection.execute_wrappers.append(_count_statement)
+        connection._profiled_phases = count + 1  # noqa: SLF001
+    wrapped.append(connection)
+
+
+def _unwrap(connection) -> None:
+    with _wrapping:
+        connection._profiled_phases -= 1  # noqa: SLF001
+        if connection._profiled_phases == 0:  # noqa: SLF001
+            connection.execute_wrappers.remove(_count_statement)
+
+
+def _instrument(connection, **kwargs) -> None:
+    # Connections opened while a phase is timed count its statements as well
+    wrapped = _wrapped.get()
+    if wrapped is not None:
+        _wrap(connection, wrapped)
+
+
+connection_created.connect(_instrument, dispatch_uid="strawberry_django_extras.instrumentation")
+
+
+def instrument_connections() -> None:
+    """
+    Count the statements of the connections of the calling thread while a phase is timed.
+
+    Connections are per thread, this is run at the start of every phase. The statement
+    counter is removed from a connection once the outermost phases of every operation using
+    it end, so nothing is left behind for queries made outside of profiled mutations.
+    """
+    wrapped = _wrapped.get()
+    if wrapped is not None:
+        for connection in connections.all(initialized_only=True):
+            _wrap(connection, wrapped)
+
+
+def profiling() -> bool:
+    """Whether the operation being executed is profiled by a `MutationProfiler`."""
+    return _profiles.get() is not None
+
+
+def _profile(info: Info) -> MutationProfile | None:
+    profiles = _profiles.get()
+    if profiles is None:
+        return None
+
+    path = info.path
+    while path.prev is not None:
+        path = path.prev
+    profile = profiles.get(path.key)
+    if profile is None:
+        profile = profiles[path.key] = MutationProfile(path.key)
+    return profile
+
+
+@contextmanager
+def _timed(profile: MutationProfile, name: str) -> Iterator[None]:
+    outer = _current.get()
+    wrapped = _wrapped.get()
+    wrapped_token = None
+    if wrapped is None:
+        wrapped = []
+        wrapped_token = _wrapped.set(wrapped)
+    instrument_connections()
+    token = _current.set((profile, name))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        _current.reset(token)
+        if wrapped_token is not None:
+            _wrapped.reset(wrapped_token)
+            for connection in wrapped:
+                _unwrap(connection)
+        profile.entry(name)["ms"] += elapsed
+        # Phases nest when extensions wrap each other, keep the times exclusive
+        if outer is not None and outer[0] is profile:
+            profile.entry(outer[1])["ms"] -= elapsed
+
+
+def phase(info: Info, name: str):
+    """
+    Attribute the time spent and the statements issued inside the block to a phase.
+
+    Does nothing unless the operation is executed with a `MutationProfiler`.
+    """
+    profile = _profile(info)
+    if profile is None:
+        return nullcontext()
+    return _timed(profile, name)
+
+
+@asynccontextmanager
+async def aphase(info: Info, name: str) -> AsyncIterator[None]:
+    """
+    Async version of `phase`, for blocks running queries through the async ORM.
+
+    The async ORM runs queries in another thread, its connections are instrumented as well.
+    """
+    profile = _profile(info)
+    if profile is None:
+        yield
+        return
+
+    with _timed(profile, name):
+        await sync_to_async(instrument_connections)()
+        yield
+
+
+class MutationProfiler(SchemaExtension):
+    """
+    Profile the mutations of an operation, phase by phase.
+
+    For each mutation field using the extensions of `field_extensions`, records the wall
+    time and the SELECT, INSERT, UPDATE and DELETE statements issued while validating,
+    checking permissions, running hooks, planning the nested writes, executing them and
+    loading the response.
+
+    `sink` is called with every profile once the operation completes. The profiles are added
+    to the response extensions under `mutationProfiles` when `expose` returns `True` for the
+    execution context, by default when `settings.DEBUG` is on.
+
+        schema = strawberry.Schema(
+            query=Query,
+            mutation=Mutation,
+            extensions=[
+                DjangoOptimizerExtension,
+                lambda: MutationProfiler(sink=statsd_sink),
+            ],
+        )
+    """
+
+    def __init__(
+        self,
+        *,
+        execution_context: ExecutionContext | None = None,
+        sink: Callable[[dict[str, Any]], Any] | None = None,
+        expose: Callable[[ExecutionContext], bool] | None = None,
+    ):
+        super().__init__(execution_context=execution_context)  # pyright: ignore[reportArgumentType]
+        self.sink = sink
+        self.expose = expose
+        self.profiles: list[dict[str, Any]] = []
+
+    def on_operation(self):
+        profiles: dict[str, MutationProfile] = {}
+        token = _profiles.set(profiles)
+        try:
+            yield
+        finally:
+            _profiles.reset(token)
+
+        operation = self.execution_context.operation_name
+        for profile in profiles.values():
+            self.profiles.append({"operation": operation, **profile.as_dict()})
+
+        if self.sink is not None:
+            for profile in self.profiles:
+                try:
+                    self.sink(profile)
+                except Exception:  # noqa: PERF203
+                    logger.exception("Mutation profile sink failed")
+
+    def exposed(self) -> bool:
+        if self.expose is not None:
+            return self.expose(self.execution_context)
+        return settings.DEBUG
+
+    def get_results(self) -> dict[str, Any]:
+        if not self.profiles or not self.exposed():
+            return {}
+        return {"mutationProfiles": self.profiles}
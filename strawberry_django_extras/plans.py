@@ -0,0 +1,505 @@
+from __future__ import annotations
+
+from dataclasses import KW_ONLY, dataclass
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
+from django.db import models
+from django.db.models.fields.related import (
+    ForeignKey,
+    ManyToManyField,
+    ManyToManyRel,
+    ManyToOneRel,
+    OneToOneField,
+    OneToOneRel,
+)
+from strawberry.types.base import StrawberryContainer
+from strawberry.types.lazy_type import LazyType
+from strawberry.utils.str_converters import to_camel_case
+from strawberry_django.utils.inspect import get_model_fields
+
+from .exceptions import SDJExtrasError
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+# Relation kinds a plan slot can dispatch on
+SCALAR = "scalar"
+GENERIC_FK = "generic_fk"
+GENERIC_RELATION = "generic_relation"
+ONE_TO_ONE = "one_to_one"
+ONE_TO_ONE_REL = "one_to_one_rel"
+FOREIGN_KEY = "foreign_key"
+MANY_TO_ONE = "many_to_one"
+MANY_TO_MANY = "many_to_many"
+
+
+class PlanSlot(NamedTuple):
+    key: str
+    kind: str
+    field: Any
+    related_model: Any = None
+    # Name of the manager / descriptor on the model for reverse and m2m relations
+    accessor: str | None = None
+    # Name of the field on the related model pointing back to this model
+    remote_name: str | None = None
+    ct_field: str | None = None
+    fk_field: str | None = None
+    is_one_to_one: bool = False
+
+
+class PlanTemplate(NamedTuple):
+    model: Any
+    slots: tuple[PlanSlot, ...]
+    declared: frozenset[str]
+
+    def slots_for(self, values: dict[str, Any]) -> Iterable[PlanSlot]:
+        # Inputs may carry attributes their class does not declare (e.g. an `id` that is
+        # set on nested update inputs while planning), those still need to be dispatched.
+        if self.declared.issuperset(values):
+            return self.slots
+        return tuple(slot for key, slot in _model_slots(self.model).items() if key in values)
+
+
+class InputHooks(NamedTuple):
+    """Where the hooks of one kind, e.g. `validate`, of an input class are, see `get_input_hooks`."""
+
+    # Name of the hook called with the whole input, if the class has it
+    hook: str | None
+    # Name of the class' hook called once with all the inputs of a list, if it has it
+    batch: str | None
+    # (key, name of the hook called with the key's value) of the declared fields having one
+    fields: tuple[tuple[str, str], ...]
+    # Declared fields that may hold inputs or lists of inputs
+    nested: tuple[str, ...]
+    declared: frozenset[str]
+    # Whether the class or any input it may hold has hooks, inactive inputs are skipped
+    active: bool
+
+
+class HookCall(NamedTuple):
+    """One call of an input hook, see `input_hook_steps`."""
+
+    # The bound hook, called with `info` followed by `args`
+    method: Any
+    args: tuple
+    # Whether the hook is a coroutine function
+    awaitable: bool
+
+
+class MutationCost(NamedTuple):
+    """What a mutation input is about to cost, measured by `measure_input` without a query."""
+
+    # Objects the input writes or refers to, the roots included
+    nodes: int
+    # Nesting depth of the input objects, 1 for roots without nested relations
+    depth: int
+    # Predicted statements of the batched plan per operation kind
+    statements: dict[str, int]
+
+    @property
+    def total_statements(self) -> int:
+        return sum(self.statements.values())
+
+
+_model_slot_registry: dict[Any, dict[str, PlanSlot]] = {}
+_plan_template_registry: dict[tuple[Any, type], PlanTemplate] = {}
+_input_hooks_registry: dict[tuple[type, str], InputHooks] = {}
+
+
+def _is_generic_one_to_one(related_model, ct_field_name: str, fk_field_name: str) -> bool:
+    for constraint in related_model._meta.unique_together:  # noqa: SLF001
+        if set(constraint) == {ct_field_name, fk_field_name}:
+            return True
+
+    for constraint in related_model._meta.constraints:  # noqa: SLF001
+        if isinstance(constraint, models.UniqueConstraint):  # noqa: SIM102
+            if set(constraint.fields) == {ct_field_name, fk_field_name}:
+                return True
+
+    return False
+
+
+def _build_slot(key: str, val) -> PlanSlot:  # noqa: PLR0911
+    if isinstance(val, GenericForeignKey):
+        return PlanSlot(key, GENERIC_FK, val, ct_field=val.ct_field, fk_field=val.fk_field)
+
+    if isinstance(val, GenericRelation):
+        ct_field_name = val.content_type_field_name
+        fk_field_name = val.object_id_field_name
+        return PlanSlot(
+            key,
+            GENERIC_RELATION,
+            val,
+            related_model=val.related_model,
+            ct_field=ct_field_name,
+            fk_field=fk_field_name,
+            is_one_to_one=_is_generic_one_to_one(val.related_model, ct_field_name, fk_field_name),
+        )
+
+    if isinstance(val, (OneToOneField, OneToOneRel)):
+        return PlanSlot(
+            key,
+            ONE_TO_ONE_REL if isinstance(val, OneToOneRel) else ONE_TO_ONE,
+            val,
+            related_model=val.related_model,
+            remote_name=val.remote_field.name,
+        )
+
+    if isinstance(val, ForeignKey):
+        return PlanSlot(key, FOREIGN_KEY, val, related_model=val.related_model)
+
+    if isinstance(val, ManyToOneRel):
+        return PlanSlot(
+            key,
+            MANY_TO_ONE,
+            val,
+            related_model=val.related_model,
+            accessor=val.get_accessor_name(),
+            remote_name=val.remote_field.name,
+        )
+
+    if isinstance(val, (ManyToManyField, ManyToManyRel)):
+        return PlanSlot(
+            key,
+            MANY_TO_MANY,
+            val,
+            related_model=val.related_model,
+            accessor=val.name if isinstance(val, ManyToManyField) else val.get_accessor_name(),
+        )
+
+    return PlanSlot(key, SCALAR, val)
+
+
+def _model_slots(model) -> dict[str, PlanSlot]:
+    slots = _model_slot_registry.get(model)
+    if slots is None:
+        slots = {key: _build_slot(key, val) for key, val in get_model_fields(model).items()}
+        _model_slot_registry[model] = slots
+    return slots
+
+
+def get_plan_template(model, input_cls: type) -> PlanTemplate:
+    """Return the compiled plan template for a (model, input class) pair."""
+    template = _plan_template_registry.get((model, input_cls))
+    if template is None:
+        declared = frozenset(getattr(input_cls, "__dataclass_fields__", ()))
+        template = PlanTemplate(
+            model=model,
+            slots=tuple(slot for key, slot in _model_slots(model).items() if key in declared),
+            declared=declared,
+        )
+        _plan_template_registry[model, input_cls] = template
+    return template
+
+
+@dataclass(slots=True, eq=False)
+class PlanNode:
+    """
+    One write of a mutation plan, built by `rabbit_hole` and run by `kill_a_rabbit`.
+
+    A plan has a node per object of the input, so nodes have slots instead of a `__dict__`
+    and their lists of dependent writes stay a shared empty tuple until something is pushed.
+    """
+
+    # "create", "update", "upsert", "assign", "remove" or "skip", None for the root
+    operation: str | None = None
+    _: KW_ONLY
+    model: Any = None
+    # The values to write, or the input item of "assign" and "remove" operations
+    data: Any = None
+    # Key of the relation on the parent the node was planned for
+    data_id: str | None = None
+    # Field of the node's model that points back to the parent
+    rel_data_id: str | None = None
+    pk: Any = None
+    manager: Any = None
+    accessor: str | None = None
+    m2m: bool = False
+    through_defaults: dict[str, Any] | None = None
+    upsert_fields: tuple[str, ...] | None = None
+    # Whether many to many children need the manager of the written object
+    set_manager: bool = False
+    # The object whose relation is written when it is not the parent's written object
+    owner: Any = None
+    # Generic foreign key targets: their content type and the fields to set on the parent
+    target_ct: Any = None
+    parent_ct_field: str | None = None
+    parent_fk_field: str | None = None
+    is_generic_relation: bool = False
+    # Nodes written before the node, because it refers to them, and after it
+    before: list[PlanNode] | tuple[()] = ()
+    after: list[PlanNode] | tuple[()] = ()
+    # Relation writes that are executed along with the node
+    assignments: list[dict[str, Any]] | tuple[()] = ()
+    removals: list[dict[str, Any]] | tuple[()] = ()
+    deletions: list[dict[str, Any]] | tuple[()] = ()
+    generic_assignments: list[dict[str, Any]] | tuple[()] = ()
+    generic_removals: list[dict[str, Any]] | tuple[()] = ()
+    links: list[dict[str, Any]] | tuple[()] = ()
+    unlinks: list[dict[str, Any]] | tuple[()] = ()
+    # The object written, once the node was executed
+    instance: Any = None
+
+    def push(self, name: str, item: Any) -> Any:
+        """Append `item` to the `name` list of the node and return it."""
+        items = getattr(self, name)
+        if not isinstance(items, list):
+            items = []
+            setattr(self, name, items)
+        items.append(item)
+        return item
+
+    @property
+    def is_leaf(self) -> bool:
+        return not (
+            self.before
+            or self.after
+            or self.assignments
+            or self.removals
+            or self.deletions
+            or self.generic_assignments
+            or self.generic_removals
+            or self.links
+            or self.unlinks
+        )
+
+
+def input_hook(input_cls: type, kind: str, key: str) -> str | None:
+    """Return the name of the `<kind>_<key>` hook of an input class, camel cased key first."""
+    if key == "batch":
+        # Reserved for the hook called with lists of inputs
+        return None
+    for name in (f"{kind}_{to_camel_case(key)}", f"{kind}_{key}"):
+        if callable(getattr(input_cls, name, None)):
+            return name
+    return None
+
+
+def _field_input_types(field) -> tuple[type, ...] | None:
+    """Return the input classes a field may hold, None when its type cannot be told."""
+    try:
+        type_ = field.type
+        while isinstance(type_, StrawberryContainer):
+            type_ = type_.of_type
+        if isinstance(type_, LazyType):
+            type_ = type_.resolve_type()
+    except Exception:  # noqa: BLE001
+        return None
+
+    definition = getattr(type_, "__strawberry_definition__", None)
+    if definition is not None and getattr(definition, "is_input", False) is True:
+        return (type_,)
+    # Scalars and enums, anything else, e.g. an unresolved type variable, may hold anything
+    if isinstance(type_, type) or definition is not None or callable(type_):
+        return ()
+    return None
+
+
+def _own_input_hooks(input_cls: type, kind: str) -> tuple[InputHooks, set[type] | None]:
+    fields = []
+    nested = []
+    children: set[type] | None = set()
+    for field in input_cls.__strawberry_definition__.fields:  # pyright: ignore[reportAttributeAccessIssue]
+        key = field.python_name
+        name = input_hook(input_cls, kind, key)
+        if name is not None:
+            fields.append((key, name))
+        types = _field_input_types(field)
+        if types is None or types:
+            nested.append(key)
+        if types is None:
+            children = None
+        elif children is not None:
+            children.update(types)
+
+    hook = kind if callable(getattr(input_cls, kind, None)) else None
+    batch = f"{kind}_batch"
+    prefix = f"{kind}_"
+    # Hooks for keys the class does not declare count as well
+    has_hooks = hook is not None or any(
+        name.startswith(prefix) and callable(getattr(input_cls, name, None))
+        for name in dir(input_cls)
+    )
+    hooks = InputHooks(
+        hook=hook,
+        batch=batch if callable(getattr(input_cls, batch, None)) else None,
+        fields=tuple(fields),
+        nested=tuple(nested),
+        declared=frozenset(getattr(input_cls, "__dataclass_fields__", ())),
+        active=has_hooks,
+    )
+    return hooks, children
+
+
+def get_input_hooks(input_cls: type, kind: str) -> InputHooks:
+    """
+    Return the hooks of `kind`, e.g. `validate` or `check_permissions`, of an input class.
+
+    Computed once per class: whether it has a `<kind>_batch` hook, which fields have a
+    `<kind>_<key>` hook, which may hold nested inputs and whether anything reachable from
+    the class has hooks at all.
+    """
+    hooks = _input_hooks_registry.get((input_cls, kind))
+    if hooks is None:
+        hooks, children = _own_input_hooks(input_cls, kind)
+        # Inputs are usually recursive, look for hooks in every class reachable from this one
+        active = hooks.active or children is None
+        seen = {input_cls}
+        stack = list(children or ())
+        while stack and not active:
+            other = stack.pop()
+            if other in seen:
+                continue
+            seen.add(other)
+            other_hooks, other_children = _own_input_hooks(other, kind)
+            active = other_hooks.active or other_children is None
+            stack.extend(other_children or ())
+
+        hooks = hooks._replace(active=active)
+        _input_hooks_registry[input_cls, kind] = hooks
+    return hooks
+
+
+def clear_plan_templates() -> None:
+    """
+    Drop every compiled plan template and input hook table, e.g. after models were
+    re-registered in tests.
+    """
+    _model_slot_registry.clear()
+    _plan_template_registry.clear()
+    _input_hooks_registry.clear()
+
+
+class InstanceCache:
+    """
+    Identity map of the model instances loaded while resolving a single mutation.
+
+    Planning and execution share one cache so that each row is fetched at most once,
+    no matter how many relation keys of the input refer to it. With a `batch_size` rows are
+    fetched at most that many at a time.
+    """
+
+    def __init__(self, batch_size: int | None = None):
+        self._instances: dict[tuple[Any, Any], models.Model] = {}
+        self.batch_size = batch_size
+
+    def _batches(self, pks: Iterable[Any]) -> Iterator[list[Any]]:
+        pks = list(pks)
+        size = self.batch_size or len(pks) or 1
+        for start in range(0, len(pks), size):
+            yield pks[start : start + size]
+
+    @staticmethod
+    def _key(model, pk) -> tuple[Any, Any]:
+        return model, model._meta.pk.to_python(pk)  # noqa: SLF001
+
+    def __contains__(self, item: tuple[Any, Any]) -> bool:
+        return self._key(*item) in self._instances
+
+    def peek(self, model, pk) -> models.Model | None:
+        return self._instances.get(self._key(model, pk))
+
+    def add(self, obj: models.Model, model=None) -> models.Model:
+        self._instances[self._key(model or type(obj), obj.pk)] = obj
+        return obj
+
+    def discard(self, model, pks: Iterable[Any]) -> None:
+        for pk in pks:
+            self._instances.pop(self._key(model, pk), None)
+
+    def get(self, model, pk) -> models.Model:
+        key = self._key(model, pk)
+        obj = self._instances.get(key)
+        if obj is None:
+            obj = model.objects.get(pk=key[1])
+            self._instances[key] = obj
+        return obj
+
+    def load(self, model, pks: Iterable[Any]) -> set[Any]:
+        """Bulk load the given rows that are not cached yet and return the pks that do not exist."""
+        wanted = {model._meta.pk.to_python(pk) for pk in pks}  # noqa: SLF001
+        missing = {pk for pk in wanted if (model, pk) not in self._instances}
+        for batch in self._batches(missing):
+            found = model.objects.in_bulk(batch)
+            for pk, obj in found.items():
+                self._instances[model, pk] = obj
+            missing.difference_update(found)
+        return missing
+
+    async def aload(self, model, pks: Iterable[Any]) -> set[Any]:
+        """Async version of `load()`."""
+        wanted = {model._meta.pk.to_python(pk) for pk in pks}  # noqa: SLF001
+        missing = {pk for pk in wanted if (model, pk) not in self._instances}
+        for batch in self._batches(missing):
+            found = await model.objects.ain_bulk(batch)
+            for pk, obj in found.items():
+                self._instances[model, pk] = obj
+            missing.difference_update(found)
+        return missing
+
+    def get_many(self, model, pks: Iterable[Any]) -> list[models.Model]:
+        pks = list(pks)
+        missing = self.load(model, pks)
+        if missing:
+            raise SDJExtrasError(f"Not all assigned objects found for {model.__name__}")
+        return [self._instances[self._key(model, pk)] for pk in pks]
+
+    def get_related(self, manager, pk) -> models.Model:
+        """Like `manager.get(pk=pk)`, served from the cache when membership can be verified."""
+        model = manager.model
+        key = self._key(model, pk)
+        obj = self._instances.get(key)
+        if obj is not None and _is_member(manager, obj):
+            return obj
+
+        obj = manager.get(pk=key[1])
+        self._instances[key] = obj
+        return obj
+
+    def get_existing(self, model, pks: Iterable[Any]) -> list[models.Model]:
+        """Like `get()` for many rows at once, raising `DoesNotExist` when any of them is missing."""
+        pks = list(pks)
+        if self.load(model, pks):
+            raise model.DoesNotExist(f"{model.__name__} matching query does not exist.")
+        return [self._instances[self._key(model, pk)] for pk in pks]
+
+    def get_many_related(self, manager, pks: Iterable[Any]) -> list[models.Model]:
+        """Like `get_related()` for many rows at once, with a single query for the unverified ones."""
+        model = manager.model
+        keys = [self._key(model, pk) for pk in pks]
+        unverified = set()
+        for key in keys:
+            obj = self._instances.get(key)
+            if obj is None or not _is_member(manager, obj):
+                unverified.add(key[1])
+
+        if unverified:
+            found = {}
+            for batch in self._batches(unverified):
+                found.update((obj.pk, obj) for obj in manager.filter(pk__in=batch))
+            if unverified.difference(found):
+                raise model.DoesNotExist(f"{model.__name__} matching query does not exist.")
+            for pk, obj in found.items():
+                self._instances[model, pk] = obj
+
+        return [self._instances[key] for key in keys]
+
+
+def _is_member(manager, obj) -> bool:
+    # Reverse foreign key managers
+    field = getattr(manager, "field", None)
+    instance = getattr(manager, "instance", None)
+    if field is not None and instance is not None and not hasattr(manager, "through"):
+        return getattr(obj, field.attname) == instance.pk
+
+    # Generic relation managers
+    if hasattr(manager, "content_type_field_name") and hasattr(manager, "pk_val"):
+        ct_field = manager.model._meta.get_field(manager.content_type_field_name)  # noqa: SLF001
+        return (
+            getattr(obj, ct_field.attname) == manager.content_type.pk
+            and getattr(obj, manager.object_id_field_name) == manager.pk_val
+        )
+
+    # Many to many membership cannot be known without hitting the through table
+    return False
@@ -0,0 +1,59 @@
+from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+
+
+class Author(models.Model):
+    name = models.CharField(max_length=100)
+
+
+class AuthorProfile(models.Model):
+    bio = models.CharField(max_length=200, blank=True, default="")
+    author = models.OneToOneField(
+        Author,
+        related_name="profile",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+
+
+class Tag(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+
+
+class Book(models.Model):
+    title = models.CharField(max_length=200)
+    author = models.ForeignKey(
+        Author,
+        related_name="books",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    tags = models.ManyToManyField(Tag, through="BookTag", related_name="books", blank=True)
+    comments = GenericRelation("Comment")
+
+
+class BookTag(models.Model):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    note = models.CharField(max_length=100, blank=True, default="")
+
+
+class Chapter(models.Model):
+    title = models.CharField(max_length=200)
+    number = models.IntegerField(default=0)
+    book = models.ForeignKey(Book, related_name="chapters", on_delete=models.CASCADE)
+
+
+class Comment(models.Model):
+    body = models.CharField(max_length=200)
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    object_id = models.PositiveIntegerField(null=True, blank=True)
+    content_object = GenericForeignKey("content_type", "object_id")
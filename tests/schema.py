@@ -4,15 +4,44 @@ import strawberry
 import strawberry_django
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
-from strawberry import relay
+from strawberry import ID, UNSET, auto, relay
 from strawberry.types.info import Info
+from strawberry_django import mutations
 from strawberry_django.auth.queries import get_current_user
 from strawberry_django.optimizer import (
     DjangoOptimizerExtension,
 )
 
+from strawberry_django_extras.field_extensions import (
+    mutation_cost,
+    mutation_hooks,
+    mutation_instances,
+    with_cud_relationships,
+    with_permissions,
+    with_validation,
+)
+from strawberry_django_extras.inputs import (
+    CRUDManyToManyCreateInput,
+    CRUDManyToManyUpdateInput,
+    CRUDManyToOneCreateInput,
+    CRUDManyToOneUpdateInput,
+    CRUDOneToManyCreateInput,
+    CRUDOneToManyUpdateInput,
+    CRUDOneToOneCreateInput,
+    CRUDOneToOneUpdateInput,
+)
+from strawberry_django_extras.instrumentation import MutationProfiler
+from tests import models
+
 UserModel = get_user_model()
 
+# Costs seen by the `pre` hook of `create_author_limited`
+measured_costs = []
+# Profiles received by the sink of the schema's `MutationProfiler`
+profiles = []
+# Hooks called on `CheckedTagInput`, in order
+checked = []
+
 
 @strawberry_django.type(UserModel)
 class UserType(relay.Node):
@@ -28,6 +57,177 @@ class UserType(relay.Node):
         return f"{root.first_name or ''} {root.last_name or ''}".strip()
 
 
+@strawberry_django.type(models.Tag)
+class TagType:
+    id: auto
+    name: auto
+
+
+@strawberry_django.type(models.Chapter)
+class ChapterType:
+    id: auto
+    title: auto
+    number: auto
+
+
+@strawberry_django.type(models.Comment)
+class CommentType:
+    id: auto
+    body: auto
+
+
+@strawberry_django.type(models.AuthorProfile)
+class AuthorProfileType:
+    id: auto
+    bio: auto
+
+
+@strawberry_django.type(models.Book)
+class BookType:
+    id: auto
+    title: auto
+    author: "AuthorType | None"
+    tags: list[TagType]
+    chapters: list[ChapterType]
+    comments: list[CommentType]
+
+
+@strawberry_django.filter_type(models.Book, lookups=True)
+class BookFilter:
+    title: auto
+
+
+@strawberry_django.order_type(models.Book)
+class BookOrder:
+    title: auto
+
+
+@strawberry_django.type(models.Author)
+class AuthorType:
+    id: auto
+    name: auto
+    profile: AuthorProfileType | None
+    books: list[BookType] = strawberry_django.field(filters=BookFilter, ordering=BookOrder)
+
+
+@strawberry_django.input(models.Tag)
+class TagInput:
+    name: auto
+
+
+@strawberry_django.input(models.Tag)
+class CheckedTagInput:
+    name: auto
+
+    def check_permissions_name(self, info, value):
+        checked.append(("permissions", value))
+
+    def validate_name(self, info, value):
+        checked.append(("validation", value))
+        if value == "forbidden":
+            msg = "Forbidden tag name"
+            raise ValueError(msg)
+
+
+@strawberry_django.partial(models.Tag)
+class TagPartial:
+    id: ID
+    name: auto
+
+
+@strawberry_django.input(models.Chapter)
+class ChapterInput:
+    title: auto
+    number: auto
+
+    upsert_fields = ("book", "number")
+
+
+@strawberry_django.partial(models.Chapter)
+class ChapterPartial:
+    id: ID
+    title: auto
+    number: auto
+
+
+@strawberry_django.input(models.Comment)
+class CommentInput:
+    body: auto
+
+
+@strawberry_django.partial(models.Comment)
+class CommentPartial:
+    id: ID
+    body: auto
+
+
+@strawberry_django.input(models.AuthorProfile)
+class AuthorProfileInput:
+    bio: auto
+
+
+@strawberry_django.partial(models.AuthorProfile)
+class AuthorProfilePartial:
+    id: ID | None
+    bio: auto
+
+
+@strawberry_django.input(models.Author)
+class AuthorInput:
+    name: auto
+    profile: CRUDOneToOneCreateInput[AuthorProfileInput] | None = UNSET
+    books: "CRUDManyToOneCreateInput[BookInput] | None" = UNSET
+
+    upsert_fields = ("name",)
+
+
+@strawberry_django.partial(models.Author)
+class AuthorPartial:
+    id: ID
+    name: auto
+    profile: CRUDOneToOneUpdateInput[AuthorProfileInput, AuthorProfilePartial] | None = UNSET
+    books: "CRUDManyToOneUpdateInput[BookInput, BookPartial] | None" = UNSET
+
+
+@strawberry_django.input(models.Book)
+class BookInput:
+    title: auto
+    author: CRUDOneToManyCreateInput[AuthorInput, ID] | None = UNSET
+    tags: CRUDManyToManyCreateInput[TagInput] | None = UNSET
+    chapters: CRUDManyToOneCreateInput[ChapterInput] | None = UNSET
+    comments: CRUDManyToOneCreateInput[CommentInput] | None = UNSET
+
+
+@strawberry_django.partial(models.Chapter)
+class CheckedChapterPartial:
+    id: ID
+    title: auto
+
+    def check_permissions(self, info):
+        checked.append(("chapter", mutation_instances().peek(models.Chapter, self.id)))
+
+
+@strawberry_django.partial(models.Book)
+class CheckedBookPartial:
+    id: ID
+    title: auto
+    chapters: CRUDManyToOneUpdateInput[ChapterInput, CheckedChapterPartial] | None = UNSET
+    tags: CRUDManyToManyUpdateInput[TagInput, TagPartial] | None = UNSET
+
+    def check_permissions(self, info):
+        checked.append(("book", mutation_instances().peek(models.Book, self.id)))
+
+
+@strawberry_django.partial(models.Book)
+class BookPartial:
+    id: ID
+    title: auto
+    author: CRUDOneToManyUpdateInput[AuthorInput, ID, AuthorPartial] | None = UNSET
+    tags: CRUDManyToManyUpdateInput[TagInput, TagPartial] | None = UNSET
+    chapters: CRUDManyToOneUpdateInput[ChapterInput, ChapterPartial] | None = UNSET
+    comments: CRUDManyToOneUpdateInput[CommentInput, CommentPartial] | None = UNSET
+
+
 @strawberry.type
 class Query:
     """All available queries for this schema."""
@@ -45,10 +245,81 @@ class Query:
 class Mutation:
     """All available mutations for this schema."""
 
+    create_author: AuthorType = mutations.create(
+        AuthorInput,
+        extensions=[with_cud_relationships()],
+    )
+    update_author: AuthorType = mutations.update(
+        AuthorPartial,
+        extensions=[with_cud_relationships()],
+    )
+    create_book: BookType = mutations.create(
+        BookInput,
+        extensions=[with_cud_relationships()],
+    )
+    update_book: BookType = mutations.update(
+        BookPartial,
+        extensions=[with_cud_relationships()],
+    )
+    create_authors: list[AuthorType] = mutations.create(
+        list[AuthorInput],
+        extensions=[with_cud_relationships()],
+    )
+    update_books: list[BookType] = mutations.update(
+        list[BookPartial],
+        extensions=[with_cud_relationships()],
+    )
+    create_author_limited: AuthorType = mutations.create(
+        AuthorInput,
+        extensions=[
+            mutation_hooks(pre=lambda info, data: measured_costs.append(mutation_cost())),
+            with_cud_relationships(max_nodes=8, max_depth=2),
+        ],
+    )
+    create_author_profiled: AuthorType = mutations.create(
+        AuthorInput,
+        extensions=[
+            with_validation(),
+            with_permissions(),
+            mutation_hooks(pre=lambda info, data: models.Author.objects.count()),
+            with_cud_relationships(),
+        ],
+    )
+    update_book_bulk: BookType = mutations.update(
+        BookPartial,
+        extensions=[with_cud_relationships(bulk="always")],
+    )
+    update_book_batched: BookType = mutations.update(
+        BookPartial,
+        extensions=[with_cud_relationships(batch_size=2)],
+    )
+    create_tag_checked: TagType = mutations.create(
+        CheckedTagInput,
+        extensions=[with_validation(), with_permissions(), with_cud_relationships()],
+    )
+    create_tag_checked_outside: TagType = mutations.create(
+        CheckedTagInput,
+        extensions=[with_cud_relationships(), with_permissions(), with_validation()],
+    )
+    create_tag_checked_alone: TagType = mutations.create(
+        CheckedTagInput,
+        extensions=[with_validation(), with_permissions()],
+    )
+    update_book_checked: BookType = mutations.update(
+        CheckedBookPartial,
+        extensions=[with_permissions(), with_cud_relationships()],
+    )
+    update_book_without_savepoints: BookType = mutations.update(
+        BookPartial,
+        extensions=[with_cud_relationships(savepoints=False)],
+    )
+
 
 schema = strawberry.Schema(
     query=Query,
+    mutation=Mutation,
     extensions=[
         DjangoOptimizerExtension,
+        lambda: MutationProfiler(sink=profiles.append),
     ],
 )
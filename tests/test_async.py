@@ -0,0 +1,231 @@
+import asyncio
+import importlib.util
+from unittest import mock
+
+import pytest
+import strawberry
+import strawberry_django
+from strawberry import ID, UNSET, auto
+from strawberry_django import mutations
+from strawberry_django.optimizer import DjangoOptimizerExtension
+
+from strawberry_django_extras import field_extensions
+from strawberry_django_extras.inputs import CRUDManyToManyUpdateInput, CRUDManyToOneUpdateInput
+from strawberry_django_extras.instrumentation import MutationProfiler
+from tests import models
+from tests.schema import BookType, ChapterInput, Query, TagInput, TagPartial, TagType
+
+
+def _async_extensions():
+    # The extensions define `resolve` or `resolve_async` depending on the context their
+    # module is imported in, this copy is imported as if served by ASGI
+    spec = importlib.util.spec_from_file_location(
+        "strawberry_django_extras._async_field_extensions", field_extensions.__file__
+    )
+    assert spec is not None
+    assert spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch("strawberry_django_extras.decorators.is_async", return_value=True):
+        spec.loader.exec_module(module)
+    return module
+
+
+extensions = _async_extensions()
+# Hooks called by the mutations of this schema, in order
+calls = []
+profiles = []
+# Events the pre hooks of `create_tag_paced` wait for, by tag name
+paced: dict[str, asyncio.Event] = {}
+
+
+@strawberry_django.input(models.Tag)
+class AsyncTagInput:
+    name: auto
+
+    async def check_permissions_name(self, info, value):
+        calls.append(("permissions", value))
+
+    def validate_name(self, info, value):
+        calls.append(("validation", value))
+        if value == "forbidden":
+            msg = "Forbidden tag name"
+            raise ValueError(msg)
+
+
+@strawberry_django.partial(models.Chapter)
+class AsyncChapterPartial:
+    id: ID
+    title: auto
+
+    async def check_permissions(self, info):
+        calls.append(("chapter", extensions.mutation_instances().peek(models.Chapter, self.id)))
+
+
+@strawberry_django.partial(models.Book)
+class AsyncBookPartial:
+    id: ID
+    title: auto
+    chapters: CRUDManyToOneUpdateInput[ChapterInput, AsyncChapterPartial] | None = UNSET
+    tags: CRUDManyToManyUpdateInput[TagInput, TagPartial] | None = UNSET
+
+    def check_permissions(self, info):
+        calls.append(("book", extensions.mutation_instances().peek(models.Book, self.id)))
+
+
+async def _pre(info, data):
+    calls.append(("pre", data.name))
+
+
+async def _paced(info, data):
+    await models.Tag.objects.acount()
+    paced[f"{data.name} started"].set()
+    await paced[f"{data.name} resumed"].wait()
+    await models.Tag.objects.acount()
+
+
+@strawberry.type
+class Mutation:
+    create_tag: TagType = mutations.create(
+        AsyncTagInput,
+        extensions=[
+            extensions.with_validation(),
+            extensions.with_permissions(),
+            extensions.with_cud_relationships(),
+        ],
+    )
+    create_tag_alone: TagType = mutations.create(
+        AsyncTagInput,
+        extensions=[extensions.with_validation(), extensions.with_permissions()],
+    )
+    create_tag_hooked: TagType = mutations.create(
+        TagInput,
+        extensions=[
+            extensions.mutation_hooks(
+                pre_async=_pre, post=lambda info, data, tag: calls.append(("post", tag.pk))
+            ),
+            extensions.with_cud_relationships(),
+        ],
+    )
+    create_tag_paced: TagType = mutations.create(
+        TagInput,
+        extensions=[extensions.mutation_hooks(pre_async=_paced)],
+    )
+    update_book: BookType = mutations.update(
+        AsyncBookPartial,
+        extensions=[extensions.with_permissions(), extensions.with_cud_relationships()],
+    )
+
+
+schema = strawberry.Schema(
+    query=Query,
+    mutation=Mutation,
+    extensions=[DjangoOptimizerExtension, lambda: MutationProfiler(sink=profiles.append)],
+)
+
+
+@pytest.fixture(autouse=True)
+def _clear() -> None:
+    calls.clear()
+    profiles.clear()
+
+
+CREATE_TAG = """
+    mutation CreateTag($data: AsyncTagInput!) {
+        createTag(data: $data) { name }
+    }
+"""
+
+
+@pytest.mark.django_db(transaction=True)
+async def test_checks_stacked_inside_of_relationships_resolve() -> None:
+    result = await schema.execute(CREATE_TAG, {"data": {"name": "kept"}})
+
+    assert result.errors is None
+    assert result.data == {"createTag": {"name": "kept"}}
+    assert calls == [("permissions", "kept"), ("validation", "kept")]
+    assert await models.Tag.objects.filter(name="kept").aexists()
+    (profile,) = profiles
+    assert profile["phases"]["execution"]["insert"] == 1
+
+
+@pytest.mark.django_db(transaction=True)
+async def test_failed_checks_roll_back_async_mutations() -> None:
+    result = await schema.execute(CREATE_TAG, {"data": {"name": "forbidden"}})
+
+    assert result.errors is not None
+    assert "Forbidden tag name" in result.errors[0].message
+    assert not await models.Tag.objects.aexists()
+
+
+@pytest.mark.django_db(transaction=True)
+async def test_checks_resolve_without_relationships() -> None:
+    result = await schema.execute('mutation { createTagAlone(data: { name: "alone" }) { name } }')
+
+    assert result.errors is None
+    assert calls == [("permissions", "alone"), ("validation", "alone")]
+    assert await models.Tag.objects.filter(name="alone").aexists()
+
+
+@pytest.mark.django_db(transaction=True)
+async def test_mutation_hooks_stacked_inside_of_relationships_resolve() -> None:
+    result = await schema.execute(
+        'mutation { createTagHooked(data: { name: "hooked" }) { id name } }'
+    )
+
+    assert result.errors is None
+    assert result.data is not None
+    tag = await models.Tag.objects.aget(name="hooked")
+    assert result.data["createTagHooked"]["id"] == str(tag.pk)
+    assert calls == [("pre", "hooked"), ("post", tag.pk)]
+
+
+@pytest.mark.django_db(transaction=True)
+async def test_checks_get_the_preloaded_instances() -> None:
+    book = await models.Book.objects.acreate(title="Dune")
+    chapter = await models.Chapter.objects.acreate(book=book, title="Prologue", number=1)
+
+    result = await schema.execute(
+        """
+        mutation UpdateBook($data: AsyncBookPartial!) {
+            updateBook(data: $data) { title chapters { title } }
+        }
+        """,
+        {
+            "data": {
+                "id": str(book.pk),
+                "title": "Dune Messiah",
+                "chapters": {"update": [{"id": str(chapter.pk), "title": "Opening"}]},
+            }
+        },
+    )
+
+    assert result.errors is None
+    assert result.data == {
+        "updateBook": {"title": "Dune Messiah", "chapters": [{"title": "Opening"}]}
+    }
+    # Nested inputs are checked first
+    assert calls == [("chapter", chapter), ("book", book)]
+
+
+@pytest.mark.django_db(transaction=True)
+async def test_concurrent_mutations_count_their_own_statements() -> None:
+    paced.update(
+        {
+            f"{name} {step}": asyncio.Event()
+            for name in ("first", "second")
+            for step in ("started", "resumed")
+        }
+    )
+    query = "mutation CreateTag($name: String!) { createTagPaced(data: { name: $name }) { id } }"
+    first = asyncio.ensure_future(schema.execute(query, {"name": "first"}))
+    await paced["first started"].wait()
+    second = asyncio.ensure_future(schema.execute(query, {"name": "second"}))
+    await paced["second started"].wait()
+
+    # The first mutation is done while the second one still counts its statements
+    paced["first resumed"].set()
+    assert (await first).errors is None
+    paced["second resumed"].set()
+    assert (await second).errors is None
+
+    assert [profile["phases"]["hooks"]["select"] for profile in profiles] == [2, 2]
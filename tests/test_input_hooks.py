@@ -0,0 +1,377 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import TYPE_CHECKING
+
+import pytest
+import strawberry
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from strawberry import UNSET
+
+from strawberry_django_extras import field_extensions
+from strawberry_django_extras.functions import (
+    arun_input_hooks,
+    check_permissions,
+    input_hook_steps,
+    perform_validation,
+    run_input_hooks,
+)
+from strawberry_django_extras.plans import get_input_hooks
+from tests import models, schema
+from tests.schema import AuthorInput
+
+if TYPE_CHECKING:
+    from tests.utils import GraphQLTestClient
+
+calls = []
+
+
+@strawberry.input
+class PageInput:
+    number: int
+    footnote: str | None = UNSET
+
+    def validate(self, info):
+        calls.append(("page", self.number))
+
+    def validate_footnote(self, info, value):
+        calls.append(("footnote", value))
+
+
+@strawberry.input
+class ManuscriptInput:
+    title: str
+    page_count: int | None = UNSET
+    pages: list[PageInput] | None = UNSET
+    cover: PageInput | None = UNSET
+
+    def validate_pageCount(self, info, value):  # noqa: N802
+        calls.append(("camel", value))
+
+    def validate_page_count(self, info, value):
+        calls.append(("snake", value))
+
+    def check_permissions_title(self, info, value):
+        calls.append(("title", value))
+
+
+@strawberry.input
+class ShelfInput:
+    manuscripts: list[ManuscriptInput]
+
+
+@strawberry.input
+class LabelInput:
+    text: str
+
+
+@strawberry.input
+class OwnedInput:
+    id: int
+
+    def check_permissions(self, info):
+        calls.append(("owned", self.id))
+
+    @classmethod
+    def check_permissions_batch(cls, info, items):
+        calls.append(("owned batch", [item.id for item in items]))
+
+
+@strawberry.input
+class LibraryInput:
+    books: list[OwnedInput]
+    archive: OwnedInput | None = UNSET
+
+    @classmethod
+    async def validate_batch(cls, info, items):
+        calls.append(("library batch", len(items)))
+
+
+class Gauge:
+    """Count the coroutine hooks awaited at the same time."""
+
+    running = 0
+    peak = 0
+
+    @classmethod
+    async def enter(cls) -> None:
+        cls.running += 1
+        cls.peak = max(cls.peak, cls.running)
+        await asyncio.sleep(0.01)
+        cls.running -= 1
+
+
+@strawberry.input
+class RemoteNoteInput:
+    text: str
+
+    async def validate_text(self, info, value):
+        await Gauge.enter()
+        calls.append(("remote", value))
+        if value == "spam":
+            msg = "Spam"
+            raise ValueError(msg)
+
+    def validate(self, info):
+        calls.append(("local", self.text, threading.get_ident()))
+
+
+@strawberry.input
+class NotebookInput:
+    title: str
+    notes: list[RemoteNoteInput]
+
+    async def validate_title(self, info, value):
+        calls.append(("title", value))
+
+
+def test_hooks_run_innermost_first_and_only_for_set_keys() -> None:
+    calls.clear()
+    perform_validation(
+        ManuscriptInput(
+            title="Draft",
+            page_count=2,
+            pages=[PageInput(number=1, footnote="ibid."), PageInput(number=2)],
+        ),
+        None,
+    )
+
+    # The camel cased hook wins over the snake cased one
+    assert calls == [("page", 1), ("footnote", "ibid."), ("page", 2), ("camel", 2)]
+
+
+def test_hooks_of_each_kind_are_separate() -> None:
+    calls.clear()
+    check_permissions([ManuscriptInput(title="Draft", cover=PageInput(number=1))], None)
+
+    assert calls == [("title", "Draft")]
+
+
+def test_input_hooks_are_computed_once_per_class() -> None:
+    hooks = get_input_hooks(ManuscriptInput, "validate")
+
+    assert get_input_hooks(ManuscriptInput, "validate") is hooks
+    assert hooks.hook is None
+    assert hooks.fields == (("page_count", "validate_pageCount"),)
+    assert hooks.nested == ("pages", "cover")
+    assert hooks.active
+    # Active through the hooks of the manuscripts it holds
+    assert get_input_hooks(ShelfInput, "validate").active
+    assert not get_input_hooks(ShelfInput, "check_permissions").hook
+
+
+def test_inputs_without_hooks_are_skipped() -> None:
+    assert not get_input_hooks(LabelInput, "validate").active
+    # Nothing reachable from the schema's inputs has hooks
+    assert not get_input_hooks(AuthorInput, "validate").active
+    assert not get_input_hooks(AuthorInput, "check_permissions").active
+
+
+def test_kinds_run_in_a_single_walk() -> None:
+    calls.clear()
+    run_input_hooks(
+        ManuscriptInput(title="Draft", page_count=1, cover=PageInput(number=1)),
+        None,
+        "check_permissions",
+        "validate",
+    )
+
+    # Every hook of a kind for the whole tree before the next kind, nested inputs first
+    assert calls == [("title", "Draft"), ("page", 1), ("camel", 1)]
+
+
+@strawberry.input
+class GuardedInput:
+    cover: PageInput
+
+    def check_permissions(self, info):
+        calls.append(("guard", None))
+        msg = "Denied"
+        raise PermissionError(msg)
+
+
+def test_denied_permissions_stop_nested_validators() -> None:
+    guarded = GuardedInput(cover=PageInput(number=1))
+
+    calls.clear()
+    with pytest.raises(PermissionError, match="Denied"):
+        run_input_hooks(guarded, None, "check_permissions", "validate")
+    assert calls == [("guard", None)]
+
+    calls.clear()
+    with pytest.raises(PermissionError, match="Denied"):
+        asyncio.run(arun_input_hooks(guarded, None, "check_permissions", "validate"))
+    assert calls == [("guard", None)]
+
+
+@pytest.mark.parametrize(
+    "field", ["createTagChecked", "createTagCheckedOutside", "createTagCheckedAlone"]
+)
+@pytest.mark.django_db
+def test_checks_run_once_whatever_the_stacking_order(
+    graphql_client: GraphQLTestClient, field: str
+) -> None:
+    schema.checked.clear()
+    schema.profiles.clear()
+    graphql_client.query(
+        f"""
+        mutation CreateTag($data: CheckedTagInput!) {{
+            {field}(data: $data) {{ name }}
+        }}
+        """,
+        {"data": {"name": "fantasy"}},
+    )
+
+    assert schema.checked == [("permissions", "fantasy"), ("validation", "fantasy")]
+    # The claim on the checks only lasts for the resolve
+    assert field_extensions._checked.get() is None  # noqa: SLF001
+    assert models.Tag.objects.filter(name="fantasy").exists()
+    (profile,) = schema.profiles
+    assert {"permissions", "validation"} <= set(profile["phases"])
+
+
+@pytest.mark.django_db
+def test_failed_checks_prevent_writes(graphql_client: GraphQLTestClient) -> None:
+    schema.checked.clear()
+    response = graphql_client.query(
+        """
+        mutation CreateTag($data: CheckedTagInput!) {
+            createTagCheckedOutside(data: $data) { name }
+        }
+        """,
+        {"data": {"name": "forbidden"}},
+        assert_no_errors=False,
+    )
+
+    assert response.errors is not None
+    assert response.errors[0]["message"] == "Forbidden tag name"
+    assert schema.checked == [("permissions", "forbidden"), ("validation", "forbidden")]
+    assert not models.Tag.objects.exists()
+
+
+def test_hook_steps_group_inputs_by_depth() -> None:
+    steps = input_hook_steps(
+        NotebookInput(title="Field notes", notes=[RemoteNoteInput(text="a")]), "validate"
+    )
+
+    assert [(kind, [call.args for call in step]) for kind, step in steps] == [
+        ("validate", [(), ("a",)]),
+        ("validate", [("Field notes",)]),
+    ]
+    assert [[call.awaitable for call in step] for _, step in steps] == [[False, True], [True]]
+
+
+@pytest.mark.parametrize(("concurrency", "peak"), [(None, 4), (2, 2)])
+def test_coroutine_hooks_are_awaited_concurrently(concurrency: int | None, peak: int) -> None:
+    calls.clear()
+    Gauge.peak = 0
+    notebook = NotebookInput(
+        title="Field notes", notes=[RemoteNoteInput(text=str(i)) for i in range(4)]
+    )
+    asyncio.run(arun_input_hooks(notebook, None, "validate", concurrency=concurrency))
+
+    assert Gauge.peak == peak
+    # The sync hooks of a depth share a single thread hop
+    threads = {call[2] for call in calls if call[0] == "local"}
+    assert len(threads) == 1
+    assert threading.get_ident() not in threads
+    # Deeper inputs are done before their parent
+    assert calls[-1] == ("title", "Field notes")
+    assert len(calls) == 9
+
+
+def test_failing_coroutine_hooks_stop_the_walk() -> None:
+    calls.clear()
+    notebook = NotebookInput(title="Field notes", notes=[RemoteNoteInput(text="spam")])
+
+    with pytest.raises(ValueError, match="Spam"):
+        asyncio.run(arun_input_hooks(notebook, None, "validate"))
+    assert ("title", "Field notes") not in calls
+
+
+def test_coroutine_hooks_run_in_sync_walks() -> None:
+    calls.clear()
+    run_input_hooks(NotebookInput(title="Field notes", notes=[]), None, "validate")
+
+    assert calls == [("title", "Field notes")]
+
+
+def test_batch_hooks_are_called_once_per_list() -> None:
+    calls.clear()
+    check_permissions(
+        LibraryInput(books=[OwnedInput(id=1), OwnedInput(id=2)], archive=OwnedInput(id=3)),
+        None,
+    )
+
+    # After the hooks of the items, single inputs get a list of their own
+    assert calls == [
+        ("owned", 1),
+        ("owned", 2),
+        ("owned batch", [1, 2]),
+        ("owned", 3),
+        ("owned batch", [3]),
+    ]
+    assert get_input_hooks(OwnedInput, "check_permissions").batch == "check_permissions_batch"
+    assert get_input_hooks(OwnedInput, "validate").batch is None
+
+
+def test_batch_hooks_have_steps_of_their_own() -> None:
+    calls.clear()
+    libraries = [LibraryInput(books=[OwnedInput(id=1)]), LibraryInput(books=[OwnedInput(id=2)])]
+    steps = input_hook_steps(libraries, "check_permissions", "validate")
+
+    assert [(kind, len(step)) for kind, step in steps] == [
+        ("check_permissions", 2),
+        ("check_permissions", 2),
+        ("validate", 1),
+    ]
+
+    asyncio.run(arun_input_hooks(libraries, None, "check_permissions", "validate"))
+
+    assert calls == [
+        ("owned", 1),
+        ("owned", 2),
+        ("owned batch", [1]),
+        ("owned batch", [2]),
+        ("library batch", 2),
+    ]
+
+
+@pytest.mark.django_db
+def test_hooks_and_planning_share_preloaded_instances(graphql_client: GraphQLTestClient) -> None:
+    book = models.Book.objects.create(title="Earthsea")
+    chapters = [models.Chapter.objects.create(title=str(i), book=book) for i in range(2)]
+    tag = models.Tag.objects.create(name="fantasy")
+    schema.checked.clear()
+
+    with CaptureQueriesContext(connection) as ctx:
+        graphql_client.query(
+            """
+            mutation UpdateBook($data: CheckedBookPartial!) {
+                updateBookChecked(data: $data) { title chapters { title } tags { name } }
+            }
+            """,
+            {
+                "data": {
+                    "id": book.pk,
+                    "title": "A Wizard of Earthsea",
+                    "chapters": {
+                        "update": [{"id": c.pk, "title": f"Chapter {c.pk}"} for c in chapters]
+                    },
+                    "tags": {"assign": [{"id": tag.pk}]},
+                }
+            },
+        )
+
+    # The hooks find what they check without a query of their own
+    assert schema.checked == [("chapter", chapters[0]), ("chapter", chapters[1]), ("book", book)]
+    selects = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+    # Loaded once up front for hooks and planning, by strawberry_django's update, then by the
+    # response
+    assert sum('FROM "tests_book"' in sql for sql in selects) == 3
+    # Loaded once up front, then by the response
+    assert sum('FROM "tests_chapter"' in sql for sql in selects) == 2
+    assert sum('FROM "tests_tag"' in sql for sql in selects) == 2
+    assert models.Chapter.objects.filter(title__startswith="Chapter").count() == 2
@@ -0,0 +1,1734 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, models
+from django.db.models.signals import m2m_changed, post_save
+from django.test.utils import CaptureQueriesContext
+
+from strawberry_django_extras import field_extensions, functions, instrumentation, plans
+from strawberry_django_extras.exceptions import SDJExtrasError
+from strawberry_django_extras.field_extensions import mutation_cost, with_cud_relationships
+from strawberry_django_extras.functions import (
+    PendingWrites,
+    aprefetch_assign_targets,
+    kill_a_rabbit,
+    measure_input,
+    plan_waves,
+    rabbit_hole,
+    upsert_fields,
+)
+from strawberry_django_extras.inputs import (
+    CRUDManyToManyCreateInput,
+    CRUDManyToManyID,
+    CRUDManyToOneCreateInput,
+    CRUDOneToManyCreateInput,
+)
+from strawberry_django_extras.plans import InstanceCache, PlanNode
+from tests import schema
+from tests.models import Author, AuthorProfile, Book, BookTag, Chapter, Comment, Tag
+from tests.schema import AuthorInput, BookInput, ChapterInput
+
+if TYPE_CHECKING:
+    from tests.utils import GraphQLTestClient
+
+
+CREATE_AUTHOR = """
+    mutation CreateAuthor($data: AuthorInput!) {
+        createAuthor(data: $data) {
+            id
+            name
+            profile { bio }
+            books {
+                title
+                tags { name }
+                chapters { title number }
+                comments { body }
+            }
+        }
+    }
+"""
+
+UPDATE_AUTHOR = """
+    mutation UpdateAuthor($data: AuthorPartial!) {
+        updateAuthor(data: $data) {
+            id
+            name
+            profile { bio }
+            books { id title }
+        }
+    }
+"""
+
+CREATE_BOOK = """
+    mutation CreateBook($data: BookInput!) {
+        createBook(data: $data) {
+            id
+            title
+            author { id name }
+            tags { id name }
+            chapters { id title }
+        }
+    }
+"""
+
+UPDATE_BOOK = """
+    mutation UpdateBook($data: BookPartial!) {
+        updateBook(data: $data) {
+            id
+            title
+            author { id name }
+            tags { id name }
+            chapters { id title number }
+            comments { id body }
+        }
+    }
+"""
+
+CREATE_AUTHORS = """
+    mutation CreateAuthors($data: [AuthorInput!]!) {
+        createAuthors(data: $data) {
+            id
+            name
+            profile { bio }
+            books {
+                title
+                chapters { title number }
+            }
+        }
+    }
+"""
+
+UPDATE_BOOKS = """
+    mutation UpdateBooks($data: [BookPartial!]!) {
+        updateBooks(data: $data) {
+            id
+            title
+            author { id name }
+            chapters { id title number }
+        }
+    }
+"""
+
+
+@pytest.fixture
+def book() -> Book:
+    author = Author.objects.create(name="Tolkien")
+    book = Book.objects.create(title="The Hobbit", author=author)
+    Chapter.objects.create(book=book, title="An Unexpected Party", number=1)
+    Chapter.objects.create(book=book, title="Roast Mutton", number=2)
+    for name in ("fantasy", "classic"):
+        BookTag.objects.create(book=book, tag=Tag.objects.create(name=name))
+    Comment.objects.create(content_object=book, body="Great")
+    return book
+
+
+def test_plan_template_is_compiled_once() -> None:
+    template = plans.get_plan_template(Book, BookInput)
+
+    assert plans.get_plan_template(Book, BookInput) is template
+    kinds = {slot.key: slot.kind for slot in template.slots}
+    assert kinds == {
+        "title": plans.SCALAR,
+        "author": plans.FOREIGN_KEY,
+        "tags": plans.MANY_TO_MANY,
+        "chapters": plans.MANY_TO_ONE,
+        "comments": plans.GENERIC_RELATION,
+    }
+    chapters = next(slot for slot in template.slots if slot.key == "chapters")
+    assert chapters.accessor == "chapters"
+    assert chapters.remote_name == "book"
+
+
+@pytest.mark.django_db
+def test_create_with_nested_relations(graphql_client: GraphQLTestClient) -> None:
+    existing = Tag.objects.create(name="existing")
+    response = graphql_client.query(
+        CREATE_AUTHOR,
+        {
+            "data": {
+                "name": "Le Guin",
+                "profile": {"create": {"bio": "Writer"}},
+                "books": {
+                    "create": [
+                        {
+                            "title": "Earthsea",
+                            "chapters": {
+                                "create": [
+                                    {"title": "Warriors in the Mist", "number": 1},
+                                    {"title": "The Shadow", "number": 2},
+                                ]
+                            },
+                            "tags": {
+                                "create": [
+                                    {
+                                        "objectData": {"name": "magic"},
+                                        "throughDefaults": {"note": "n"},
+                                    }
+                                ],
+                                "assign": [{"id": str(existing.pk)}],
+                            },
+                            "comments": {"create": [{"body": "Lovely"}]},
+                        },
+                        {"title": "The Dispossessed"},
+                    ]
+                },
+            }
+        },
+    )
+
+    assert response.data is not None
+    data = response.data["createAuthor"]
+    assert data["name"] == "Le Guin"
+    assert data["profile"] == {"bio": "Writer"}
+    books = {b["title"]: b for b in data["books"]}
+    assert set(books) == {"Earthsea", "The Dispossessed"}
+    assert sorted(c["number"] for c in books["Earthsea"]["chapters"]) == [1, 2]
+    assert sorted(t["name"] for t in books["Earthsea"]["tags"]) == ["existing", "magic"]
+    assert books["Earthsea"]["comments"] == [{"body": "Lovely"}]
+
+    earthsea = Book.objects.get(title="Earthsea")
+    assert BookTag.objects.get(book=earthsea, tag__name="magic").note == "n"
+    assert Comment.objects.get(body="Lovely").content_object == earthsea
+
+
+@pytest.mark.django_db
+def test_create_with_forward_relations(graphql_client: GraphQLTestClient) -> None:
+    author = Author.objects.create(name="Herbert")
+    response = graphql_client.query(
+        CREATE_BOOK,
+        {"data": {"title": "Dune", "author": {"assign": str(author.pk)}}},
+    )
+    assert response.data is not None
+    assert response.data["createBook"]["author"] == {"id": str(author.pk), "name": "Herbert"}
+
+    response = graphql_client.query(
+        CREATE_BOOK,
+        {"data": {"title": "Solaris", "author": {"create": {"name": "Lem"}}}},
+    )
+    assert response.data is not None
+    assert response.data["createBook"]["author"]["name"] == "Lem"
+    assert Book.objects.get(title="Solaris").author.name == "Lem"  # pyright: ignore[reportOptionalMemberAccess]
+
+
+@pytest.mark.django_db
+def test_create_with_missing_assign_target(graphql_client: GraphQLTestClient) -> None:
+    response = graphql_client.query(
+        CREATE_BOOK,
+        {"data": {"title": "Dune", "tags": {"assign": [{"id": "999"}]}}},
+        assert_no_errors=False,
+    )
+    assert response.errors is not None
+    assert not Book.objects.filter(title="Dune").exists()
+
+
+@pytest.mark.django_db
+def test_update_reverse_fk(graphql_client: GraphQLTestClient, book: Book) -> None:
+    first, second = book.chapters.order_by("number")
+    response = graphql_client.query(
+        UPDATE_BOOK,
+        {
+            "data": {
+                "id": str(book.pk),
+                "title": "The Hobbit, or There and Back Again",
+                "chapters": {
+                    "create": [{"title": "Over Hill", "number": 4}],
+                    "update": [{"id": str(first.pk), "title": "A Long-expected Party"}],
+                    "remove": [{"id": str(second.pk), "delete": True}],
+                },
+            }
+        },
+    )
+    assert response.data is not None
+    data = response.data["updateBook"]
+    assert data["title"] == "The Hobbit, or There and Back Again"
+    assert sorted(c["title"] for c in data["chapters"]) == ["A Long-expected Party", "Over Hill"]
+    assert not Chapter.objects.filter(pk=second.pk).exists()
+
+
+@pytest.mark.django_db
+def test_update_reverse_fk_assign_and_remove(graphql_client: GraphQLTestClient, book: Book) -> None:
+    author = book.author
+    assert author is not None
+    other = Book.objects.create(title="Silmarillion")
+    response = graphql_client.query(
+        UPDATE_AUTHOR,
+        {
+            "data": {
+                "id": str(author.pk),
+                "books": {
+                    "assign": [str(other.pk)],
+                    "remove": [{"id": str(book.pk)}],
+                },
+            }
+        },
+    )
+    assert response.data is not None
+    assert [b["title"] for b in response.data["updateAuthor"]["books"]] == ["Silmarillion"]
+    book.refresh_from_db()
+    assert book.author is None
+
+
+@pytest.mark.django_db
+def test_update_many_to_many(graphql_client: GraphQLTestClient, book: Book) -> None:
+    fantasy = Tag.objects.get(name="fantasy")
+    classic = Tag.objects.get(name="classic")
+    extra = Tag.objects.create(name="extra")
+    response = graphql_client.query(
+        UPDATE_BOOK,
+        {
+            "data": {
+                "id": str(book.pk),
+                "tags": {
+                    "create": [{"objectData": {"name": "new"}}],
+                    "assign": [{"id": str(extra.pk), "throughDefaults": {"note": "x"}}],
+                    "update": [
+                        {
+                            "objectData": {"id": str(fantasy.pk), "name": "high fantasy"},
+                            "throughDefaults": {"note": "updated"},
+                        }
+                    ],
+                    "remove": [{"id": str(classic.pk), "delete": True}],
+                },
+            }
+        },
+    )
+    assert response.data is not None
+    names = sorted(t["name"] for t in response.data["updateBook"]["tags"])
+    assert names == ["extra", "high fantasy", "new"]
+    assert BookTag.objects.get(book=book, tag=extra).note == "x"
+    assert BookTag.objects.get(book=book, tag=fantasy).note == "updated"
+    assert not Tag.objects.filter(pk=classic.pk).exists()
+
+
+@pytest.mark.django_db
+def test_update_generic_relation(graphql_client: GraphQLTestClient, book: Book) -> None:
+    comment = Comment.objects.get(body="Great")
+    loose = Comment.objects.create(body="Loose")
+    response = graphql_client.query(
+        UPDATE_BOOK,
+        {
+            "data": {
+                "id": str(book.pk),
+                "comments": {
+                    "create": [{"body": "Fine"}],
+                    "assign": [str(loose.pk)],
+                    "update": [{"id": str(comment.pk), "body": "Greater"}],
+                },
+            }
+        },
+    )
+    assert response.data is not None
+    bodies = sorted(c["body"] for c in response.data["updateBook"]["comments"])
+    assert bodies == ["Fine", "Greater", "Loose"]
+
+    response = graphql_client.query(
+        UPDATE_BOOK,
+        {
+            "data": {
+                "id": str(book.pk),
+                "comments": {
+                    "remove": [{"id": str(loose.pk)}, {"id": str(comment.pk), "delete": True}]
+                },
+            }
+        },
+    )
+    assert response.data is not None
+    assert [c["body"] for c in response.data["updateBook"]["comments"]] == ["Fine"]
+    loose.refresh_from_db()
+    assert loose.content_type is None
+    assert not Comment.objects.filter(pk=comment.pk).exists()
+    assert Comment.objects.get(body="Fine").content_type == ContentType.objects.get_for_model(Book)
+
+
+@pytest.mark.django_db
+def test_update_one_to_one(graphql_client: GraphQLTestClient) -> None:
+    author = Author.objects.create(name="Pratchett")
+    profile = AuthorProfile.objects.create(author=author, bio="old")
+    response = graphql_client.query(
+        UPDATE_AUTHOR,
+        {"data": {"id": str(author.pk), "profile": {"update": {"bio": "new"}}}},
+    )
+    assert response.data is not None
+    assert response.data["updateAuthor"]["profile"] == {"bio": "new"}
+
+    response = graphql_client.query(
+        UPDATE_AUTHOR,
+        {"data": {"id": str(author.pk), "profile": {"create": {"bio": "fresh"}, "delete": True}}},
+    )
+    assert response.data is not None
+    assert response.data["updateAuthor"]["profile"] == {"bio": "fresh"}
+    assert not AuthorProfile.objects.filter(pk=profile.pk).exists()
+
+
+@pytest.mark.django_db
+def test_update_forward_fk(graphql_client: GraphQLTestClient, book: Book) -> None:
+    response = graphql_client.query(
+        UPDATE_BOOK,
+        {
+            "data": {
+                "id": str(book.pk),
+                "author": {"update": {"id": str(book.author_id), "name": "J.R.R. Tolkien"}},  # pyright: ignore[reportAttributeAccessIssue]
+            }
+        },
+    )
+    assert response.data is not None
+    assert response.data["updateBook"]["author"]["name"] == "J.R.R. Tolkien"
+
+    response = graphql_client.query(
+        UPDATE_BOOK,
+        {"data": {"id": str(book.pk), "author": {"assign": None}}},
+    )
+    assert response.data is not None
+    assert response.data["updateBook"]["author"] is None
+
+
+@pytest.mark.django_db
+def test_instance_cache_loads_each_row_once(book: Book, django_assert_num_queries) -> None:
+    instances = InstanceCache()
+    with django_assert_num_queries(1):
+        assert instances.get(Book, str(book.pk)) is instances.get(Book, book.pk)
+
+    chapter = book.chapters.first()
+    assert chapter is not None
+    instances.add(chapter)
+    with django_assert_num_queries(0):
+        assert instances.get_related(book.chapters, chapter.pk) is chapter
+
+    other = Chapter.objects.create(book=Book.objects.create(title="Other"), title="x")
+    instances.add(other)
+    with pytest.raises(Chapter.DoesNotExist):
+        instances.get_related(book.chapters, other.pk)
+
+
+@pytest.mark.django_db
+def test_update_loads_parent_once(graphql_client: GraphQLTestClient, book: Book) -> None:
+    first, second = book.chapters.order_by("number")
+    with CaptureQueriesContext(connection) as ctx:
+        graphql_client.query(
+            UPDATE_BOOK,
+            {
+                "data": {
+                    "id": str(book.pk),
+                    "tags": {"assign": [{"id": str(Tag.objects.create(name="new").pk)}]},
+                    "comments": {"create": [{"body": "Fine"}]},
+                    "chapters": {
+                        "update": [
+                            {"id": str(first.pk), "title": "One"},
+                            {"id": str(second.pk), "title": "Two"},
+                        ],
+                        "remove": [{"id": str(second.pk), "delete": True}],
+                    },
+                }
+            },
+        )
+
+    parent_selects = [
+        q["sql"]
+        for q in ctx.captured_queries
+        if q["sql"].startswith('SELECT "tests_book"') and '"tests_book"."id" =' in q["sql"]
+    ]
+    # One load by strawberry_django's update resolver, one shared by the nested planner and
+    # the optimized refetch of the response
+    assert len(parent_selects) == 3
+
+
+@pytest.mark.django_db
+def test_assign_targets_are_loaded_in_bulk(graphql_client: GraphQLTestClient) -> None:
+    tags = [Tag.objects.create(name=f"tag-{i}") for i in range(20)]
+    author = Author.objects.create(name="Banks")
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            CREATE_BOOK,
+            {
+                "data": {
+                    "title": "Excession",
+                    "author": {"assign": str(author.pk)},
+                    "tags": {"assign": [{"id": str(tag.pk)} for tag in tags]},
+                }
+            },
+        )
+    assert response.data is not None
+    assert len(response.data["createBook"]["tags"]) == 20
+
+    tag_selects = [
+        q["sql"]
+        for q in ctx.captured_queries
+        if q["sql"].startswith('SELECT "tests_tag"') and '"tests_tag"."id" IN' in q["sql"]
+    ]
+    assert len(tag_selects) == 1
+
+
+@pytest.mark.django_db
+def test_missing_assign_targets_are_reported_together(graphql_client: GraphQLTestClient) -> None:
+    tag = Tag.objects.create(name="kept")
+    response = graphql_client.query(
+        CREATE_BOOK,
+        {
+            "data": {
+                "title": "Dune",
+                "author": {"assign": "404"},
+                "tags": {"assign": [{"id": str(tag.pk)}, {"id": "998"}, {"id": "999"}]},
+            }
+        },
+        assert_no_errors=False,
+    )
+    assert response.errors is not None
+    message = response.errors[0]["message"]
+    assert "Author (404)" in message
+    assert "Tag (998, 999)" in message
+    assert not Book.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+async def test_assign_targets_are_prefetched_natively_in_async() -> None:
+    tag = await Tag.objects.acreate(name="kept")
+    author = await Author.objects.acreate(name="Banks")
+    data = BookInput(
+        title="Excession",
+        author=CRUDOneToManyCreateInput(assign=str(author.pk)),
+        tags=CRUDManyToManyCreateInput(assign=[CRUDManyToManyID(id=str(tag.pk))]),
+    )
+
+    instances = InstanceCache()
+    await aprefetch_assign_targets(Book, data, instances)
+    assert instances.peek(Author, author.pk) is not None
+    assert instances.peek(Tag, tag.pk) is not None
+    assert await instances.aload(Tag, [tag.pk, 999]) == {999}
+
+    data.tags = CRUDManyToManyCreateInput(assign=[CRUDManyToManyID(id="999")])
+    with pytest.raises(SDJExtrasError, match=r"Tag \(999\)"):
+        await aprefetch_assign_targets(Book, data, InstanceCache())
+
+
+def _inserts(ctx: CaptureQueriesContext, table: str) -> int:
+    return sum(1 for q in ctx.captured_queries if q["sql"].startswith(f'INSERT INTO "{table}"'))
+
+
+@pytest.mark.django_db
+def test_sibling_creates_are_bulk_inserted(graphql_client: GraphQLTestClient, book: Book) -> None:
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            UPDATE_BOOK,
+            {
+                "data": {
+                    "id": str(book.pk),
+                    "chapters": {
+                        "create": [{"title": f"Chapter {i}", "number": i} for i in range(3, 13)]
+                    },
+                    "comments": {"create": [{"body": f"Comment {i}"} for i in range(5)]},
+                }
+            },
+        )
+    assert response.data is not None
+    assert len(response.data["updateBook"]["chapters"]) == 12
+    assert len(response.data["updateBook"]["comments"]) == 6
+    assert _inserts(ctx, "tests_chapter") == 1
+    assert _inserts(ctx, "tests_comment") == 1
+    assert book.comments.filter(body="Comment 4").exists()
+
+
+@pytest.mark.django_db
+def test_sibling_creates_with_save_receivers_are_not_bulk_inserted(
+    graphql_client: GraphQLTestClient, book: Book
+) -> None:
+    saved = []
+
+    def receiver(sender, instance, **kwargs):
+        saved.append(instance.title)
+
+    post_save.connect(receiver, sender=Chapter)
+    try:
+        with CaptureQueriesContext(connection) as ctx:
+            graphql_client.query(
+                UPDATE_BOOK,
+                {
+                    "data": {
+                        "id": str(book.pk),
+                        "chapters": {"create": [{"title": "Three"}, {"title": "Four"}]},
+                    }
+                },
+            )
+    finally:
+        post_save.disconnect(receiver, sender=Chapter)
+
+    assert saved == ["Three", "Four"]
+    assert _inserts(ctx, "tests_chapter") == 2
+
+
+@pytest.mark.django_db
+def test_many_to_many_links_are_batched(graphql_client: GraphQLTestClient) -> None:
+    tags = [Tag.objects.create(name=f"tag-{i}") for i in range(6)]
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            CREATE_BOOK,
+            {
+                "data": {
+                    "title": "Excession",
+                    "tags": {
+                        "create": [{"objectData": {"name": f"new-{i}"}} for i in range(4)],
+                        "assign": [
+                            {"id": str(tag.pk), "throughDefaults": {"note": f"note-{i % 2}"}}
+                            for i, tag in enumerate(tags)
+                        ],
+                    },
+                }
+            },
+        )
+    assert response.data is not None
+    assert len(response.data["createBook"]["tags"]) == 10
+
+    assert _inserts(ctx, "tests_tag") == 1
+    assert _inserts(ctx, "tests_booktag") == 2
+    book = Book.objects.get(title="Excession")
+    assert BookTag.objects.get(book=book, tag=tags[3]).note == "note-1"
+    assert BookTag.objects.filter(book=book, note="").count() == 4
+    assert not [
+        q for q in ctx.captured_queries if 'FROM "tests_tag"' in q["sql"] and "LIMIT 21" in q["sql"]
+    ]
+
+
+@pytest.mark.django_db
+def test_many_to_many_assign_with_receivers_uses_add(
+    graphql_client: GraphQLTestClient, book: Book
+) -> None:
+    actions = []
+
+    def receiver(sender, action, pk_set, **kwargs):
+        if action == "post_add":
+            actions.append(sorted(pk_set))
+
+    tags = [Tag.objects.create(name=f"tag-{i}") for i in range(4)]
+    m2m_changed.connect(receiver, sender=BookTag)
+    try:
+        graphql_client.query(
+            UPDATE_BOOK,
+            {
+                "data": {
+                    "id": str(book.pk),
+                    "tags": {
+                        "assign": [
+                            {"id": str(tag.pk), "throughDefaults": {"note": f"note-{i % 2}"}}
+                            for i, tag in enumerate(tags)
+                        ]
+                    },
+                }
+            },
+        )
+    finally:
+        m2m_changed.disconnect(receiver, sender=BookTag)
+
+    assert sorted(actions) == [[tags[0].pk, tags[2].pk], [tags[1].pk, tags[3].pk]]
+    assert BookTag.objects.get(book=book, tag=tags[1]).note == "note-1"
+
+
+def _updates(ctx: CaptureQueriesContext, table: str) -> int:
+    return sum(1 for q in ctx.captured_queries if q["sql"].startswith(f'UPDATE "{table}"'))
+
+
+@pytest.mark.django_db
+def test_sibling_updates_only_write_changed_rows(
+    graphql_client: GraphQLTestClient, book: Book
+) -> None:
+    for number in range(3, 6):
+        Chapter.objects.create(book=book, title=f"Chapter {number}", number=number)
+    chapters = list(book.chapters.order_by("number"))
+
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            UPDATE_BOOK,
+            {
+                "data": {
+                    "id": str(book.pk),
+                    "chapters": {
+                        "update": [
+                            # Resent unchanged
+                            {"id": str(chapters[0].pk), "title": chapters[0].title, "number": 1},
+                            {"id": str(chapters[1].pk), "title": "Trolls"},
+                            {"id": str(chapters[2].pk), "title": "A Short Rest"},
+                            {"id": str(chapters[3].pk), "number": 30},
+                            {"id": str(chapters[4].pk), "title": chapters[4].title},
+                        ]
+                    },
+                }
+            },
+        )
+    assert response.data is not None
+    assert _updates(ctx, "tests_chapter") == 2
+    assert [(c.title, c.number) for c in book.chapters.order_by("pk")] == [
+        ("An Unexpected Party", 1),
+        ("Trolls", 2),
+        ("A Short Rest", 3),
+        ("Chapter 4", 30),
+        ("Chapter 5", 5),
+    ]
+
+
+@pytest.mark.django_db
+def test_many_to_many_updates_are_batched(graphql_client: GraphQLTestClient, book: Book) -> None:
+    fantasy = Tag.objects.get(name="fantasy")
+    classic = Tag.objects.get(name="classic")
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            UPDATE_BOOK,
+            {
+                "data": {
+                    "id": str(book.pk),
+                    "tags": {
+                        "update": [
+                            {
+                                "objectData": {"id": str(fantasy.pk), "name": "high fantasy"},
+                                "throughDefaults": {"note": "first"},
+                            },
+                            {
+                                "objectData": {"id": str(classic.pk), "name": "classics"},
+                                "throughDefaults": {"note": "second"},
+                            },
+                        ]
+                    },
+                }
+            },
+        )
+    assert response.data is not None
+    assert _updates(ctx, "tests_tag") == 1
+    assert _updates(ctx, "tests_booktag") == 1
+    assert sorted(Tag.objects.values_list("name", flat=True)) == ["classics", "high fantasy"]
+    assert BookTag.objects.get(book=book, tag=classic).note == "second"
+
+
+@pytest.mark.django_db
+def test_updates_with_save_receivers_use_update_fields(
+    graphql_client: GraphQLTestClient, book: Book
+) -> None:
+    update_fields = []
+
+    def receiver(sender, instance, **kwargs):
+        update_fields.append(kwargs["update_fields"])
+
+    chapter = book.chapters.get(number=1)
+    post_save.connect(receiver, sender=Chapter)
+    try:
+        graphql_client.query(
+            UPDATE_BOOK,
+            {
+                "data": {
+                    "id": str(book.pk),
+                    "chapters": {
+                        "update": [{"id": str(chapter.pk), "title": "Renamed", "number": 1}]
+                    },
+                }
+            },
+        )
+    finally:
+        post_save.disconnect(receiver, sender=Chapter)
+
+    assert update_fields == [frozenset({"title"})]
+
+
+def _deletes(ctx: CaptureQueriesContext, table: str) -> int:
+    return sum(1 for q in ctx.captured_queries if q["sql"].startswith(f'DELETE FROM "{table}"'))
+
+
+@pytest.mark.django_db
+def test_removals_are_coalesced_across_the_tree(graphql_client: GraphQLTestClient) -> None:
+    author = Author.objects.create(name="Pratchett")
+    books = [Book.objects.create(title=f"Discworld {i}", author=author) for i in range(2)]
+    tags = [Tag.objects.create(name=f"tag-{i}") for i in range(2)]
+    for book in books:
+        for number in range(2):
+            Chapter.objects.create(book=book, title=f"{book.title}/{number}", number=number)
+        for tag in tags:
+            BookTag.objects.create(book=book, tag=tag)
+        Comment.objects.create(content_object=book, body=book.title)
+
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            UPDATE_AUTHOR,
+            {
+                "data": {
+                    "id": str(author.pk),
+                    "books": {
+                        "update": [
+                            {
+                                "id": str(book.pk),
+                                "chapters": {
+                                    "remove": [
+                                        {"id": str(book.chapters.get(number=0).pk), "delete": True}
+                                    ]
+                                },
+                                "tags": {"remove": [{"id": str(tags[0].pk)}]},
+                                "comments": {"remove": [{"id": str(book.comments.get().pk)}]},
+                            }
+                            for book in books
+                        ]
+                    },
+                }
+            },
+        )
+    assert response.data is not None
+    assert _deletes(ctx, "tests_chapter") == 1
+    assert _deletes(ctx, "tests_booktag") == 1
+    assert _updates(ctx, "tests_comment") == 1
+    assert list(Chapter.objects.values_list("number", flat=True)) == [1, 1]
+    assert list(BookTag.objects.values_list("tag", flat=True)) == [tags[1].pk] * 2
+    assert not Comment.objects.filter(object_id__isnull=False).exists()
+
+
+@pytest.mark.django_db
+def test_generic_removals_are_checked_in_aggregate(
+    graphql_client: GraphQLTestClient, book: Book
+) -> None:
+    other = Comment.objects.create(content_object=Book.objects.create(title="Other"), body="x")
+    response = graphql_client.query(
+        UPDATE_BOOK,
+        {
+            "data": {
+                "id": str(book.pk),
+                "comments": {
+                    "remove": [{"id": str(book.comments.get().pk)}, {"id": str(other.pk)}]
+                },
+            }
+        },
+        assert_no_errors=False,
+    )
+    assert response.errors is not None
+    assert response.errors[0]["message"] == "Some targets were not attached to this parent"
+    assert book.comments.count() == 1
+
+
+@pytest.mark.django_db
+def test_pending_deletions_respect_parameter_limits(book: Book) -> None:
+    Chapter.objects.bulk_create(
+        [Chapter(book=book, title=str(number), number=number) for number in range(1200)]
+    )
+    pending = PendingWrites()
+    pending.delete(Chapter, Chapter.objects.values_list("pk", flat=True))
+    with CaptureQueriesContext(connection) as ctx:
+        pending.flush(InstanceCache())
+    assert not Chapter.objects.exists()
+    assert _deletes(ctx, "tests_chapter") == 3
+
+
+UPDATE_BOOK_WITHOUT_SAVEPOINTS = """
+    mutation UpdateBook($data: BookPartial!) {
+        updateBookWithoutSavepoints(data: $data) {
+            id
+            chapters { id title }
+        }
+    }
+"""
+
+
+def _savepoints(ctx: CaptureQueriesContext) -> int:
+    return sum(1 for q in ctx.captured_queries if q["sql"].startswith("SAVEPOINT"))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    ("query", "nested_savepoints"),
+    [(UPDATE_BOOK, True), (UPDATE_BOOK_WITHOUT_SAVEPOINTS, False)],
+)
+def test_nested_savepoints(
+    graphql_client: GraphQLTestClient, book: Book, query: str, nested_savepoints: bool
+) -> None:
+    chapter = book.chapters.get(number=1)
+    variables = {
+        "data": {
+            "id": str(book.pk),
+            "chapters": {"update": [{"id": str(chapter.pk), "title": "Renamed"}]},
+            "comments": {"create": [{"body": "Nested"}]},
+        }
+    }
+    with CaptureQueriesContext(connection) as bare:
+        graphql_client.query(query, {"data": {"id": str(book.pk)}})
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(query, variables)
+    assert response.data is not None
+    assert book.chapters.filter(title="Renamed").exists()
+    assert (_savepoints(ctx) > _savepoints(bare)) is nested_savepoints
+
+
+@pytest.mark.django_db
+def test_failure_without_savepoints_rolls_back_everything(
+    graphql_client: GraphQLTestClient, book: Book
+) -> None:
+    response = graphql_client.query(
+        UPDATE_BOOK_WITHOUT_SAVEPOINTS,
+        {
+            "data": {
+                "id": str(book.pk),
+                "title": "Changed",
+                "chapters": {
+                    "create": [{"title": "New"}],
+                    "update": [{"id": "404", "title": "Missing"}],
+                },
+            }
+        },
+        assert_no_errors=False,
+    )
+    assert response.errors is not None
+    book.refresh_from_db()
+    assert book.title == "The Hobbit"
+    assert not book.chapters.filter(title="New").exists()
+
+
+def test_plan_waves_respect_dependencies() -> None:
+    nested_before = PlanNode("create")
+    before = PlanNode("create", before=[nested_before])
+    independent = PlanNode("create")
+    nested_after = PlanNode("create")
+    after = PlanNode("create", after=[nested_after])
+    root = PlanNode(before=[before, independent], after=[after])
+
+    waves = [[node for node, _, _ in wave] for wave in plan_waves(root)]
+    assert waves == [[nested_before, independent], [before], [root], [after], [nested_after]]
+    parents = {
+        id(node): (parent, is_before)
+        for wave in plan_waves(root)
+        for node, parent, is_before in wave
+    }
+    assert parents[id(before)] == (root, True)
+    assert parents[id(nested_after)] == (after, False)
+
+
+@pytest.mark.django_db
+def test_creates_are_batched_across_parents(graphql_client: GraphQLTestClient) -> None:
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            CREATE_AUTHOR,
+            {
+                "data": {
+                    "name": "Le Guin",
+                    "books": {
+                        "create": [
+                            {
+                                "title": f"Earthsea {i}",
+                                "chapters": {
+                                    "create": [{"title": f"{i}.{n}", "number": n} for n in range(3)]
+                                },
+                                "comments": {"create": [{"body": f"On {i}"}]},
+                            }
+                            for i in range(4)
+                        ]
+                    },
+                }
+            },
+        )
+    assert response.data is not None
+    books = response.data["createAuthor"]["books"]
+    assert [len(book["chapters"]) for book in books] == [3, 3, 3, 3]
+    assert [book["comments"][0]["body"] for book in books] == [f"On {i}" for i in range(4)]
+    assert _inserts(ctx, "tests_book") == 1
+    assert _inserts(ctx, "tests_chapter") == 1
+    assert _inserts(ctx, "tests_comment") == 1
+
+
+@pytest.mark.django_db
+def test_list_of_roots_is_planned_together(graphql_client: GraphQLTestClient) -> None:
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            CREATE_AUTHORS,
+            {
+                "data": [
+                    {
+                        "name": f"Author {i}",
+                        "profile": {"create": {"bio": f"Bio {i}"}},
+                        "books": {
+                            "create": [
+                                {
+                                    "title": f"Book {i}.{j}",
+                                    "chapters": {"create": [{"title": "One", "number": 1}]},
+                                }
+                                for j in range(2)
+                            ]
+                        },
+                    }
+                    for i in range(3)
+                ]
+            },
+        )
+    assert response.data is not None
+    authors = response.data["createAuthors"]
+    assert [author["name"] for author in authors] == ["Author 0", "Author 1", "Author 2"]
+    assert [author["profile"]["bio"] for author in authors] == ["Bio 0", "Bio 1", "Bio 2"]
+    assert [book["title"] for book in authors[2]["books"]] == ["Book 2.0", "Book 2.1"]
+    assert Chapter.objects.count() == 6
+    assert _inserts(ctx, "tests_authorprofile") == 1
+    assert _inserts(ctx, "tests_book") == 1
+    assert _inserts(ctx, "tests_chapter") == 1
+
+
+@pytest.mark.django_db
+def test_list_of_updates_is_planned_together(graphql_client: GraphQLTestClient, book: Book) -> None:
+    other = Book.objects.create(title="Dune")
+    first, second = book.chapters.order_by("number")
+    response = graphql_client.query(
+        UPDATE_BOOKS,
+        {
+            "data": [
+                {
+                    "id": str(book.pk),
+                    "chapters": {
+                        "update": [{"id": str(first.pk), "title": "One"}],
+                        "remove": [{"id": str(second.pk), "delete": True}],
+                    },
+                },
+                {
+                    "id": str(other.pk),
+                    "title": "Dune Messiah",
+                    "author": {"create": {"name": "Herbert"}},
+                    "chapters": {"create": [{"title": "Book I", "number": 1}]},
+                },
+            ]
+        },
+    )
+    assert response.data is not None
+    updated, messiah = response.data["updateBooks"]
+    assert [chapter["title"] for chapter in updated["chapters"]] == ["One"]
+    assert messiah["title"] == "Dune Messiah"
+    assert messiah["author"]["name"] == "Herbert"
+    assert [chapter["title"] for chapter in messiah["chapters"]] == ["Book I"]
+    assert not Chapter.objects.filter(pk=second.pk).exists()
+
+
+def test_plan_waves_write_roots_together() -> None:
+    author = PlanNode("create")
+    first = PlanNode(before=[author])
+    second = PlanNode(after=[PlanNode("create")])
+
+    waves = plan_waves([first, second])
+
+    assert [[node for node, _, _ in wave] for wave in waves] == [
+        [author],
+        [first, second],
+        [second.after[0]],
+    ]
+
+
+def test_plan_nodes_of_leaves_allocate_no_lists() -> None:
+    rel = PlanNode()
+    rabbit_hole(
+        Book,
+        BookInput(
+            title="Dune",
+            chapters=CRUDManyToOneCreateInput(create=[ChapterInput(title="One", number=1)]),
+        ),
+        rel,
+    )
+
+    (chapter,) = rel.after
+    assert chapter.data == {"title": "One", "number": 1}
+    assert chapter.rel_data_id == "book"
+    assert chapter.is_leaf
+    assert chapter.before == chapter.removals == ()
+    assert not hasattr(chapter, "__dict__")
+
+
+@pytest.mark.django_db
+def test_upsert_many_to_many_on_unique_field(graphql_client: GraphQLTestClient) -> None:
+    existing = Tag.objects.create(name="fantasy")
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            CREATE_BOOK,
+            {
+                "data": {
+                    "title": "Earthsea",
+                    "tags": {
+                        "upsert": [
+                            {"objectData": {"name": "fantasy"}},
+                            {"objectData": {"name": "classic"}},
+                            {"objectData": {"name": "classic"}},
+                        ]
+                    },
+                }
+            },
+        )
+    assert response.data is not None
+    tags = {tag["name"]: tag["id"] for tag in response.data["createBook"]["tags"]}
+    assert tags.keys() == {"fantasy", "classic"}
+    assert tags["fantasy"] == str(existing.pk)
+    assert Tag.objects.count() == 2
+    assert _inserts(ctx, "tests_tag") == 1
+
+
+@pytest.mark.django_db
+def test_upsert_reverse_fk_selects_then_writes(
+    graphql_client: GraphQLTestClient, book: Book
+) -> None:
+    first, second = book.chapters.order_by("number")
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            UPDATE_BOOK,
+            {
+                "data": {
+                    "id": str(book.pk),
+                    "chapters": {
+                        "upsert": [
+                            {"title": "A Long-expected Party", "number": 1},
+                            {"title": "Roast Mutton", "number": 2},
+                            {"title": "A Short Rest", "number": 3},
+                        ]
+                    },
+                }
+            },
+        )
+    assert response.data is not None
+    chapters = response.data["updateBook"]["chapters"]
+    assert [(chapter["title"], chapter["number"]) for chapter in chapters] == [
+        ("A Long-expected Party", 1),
+        ("Roast Mutton", 2),
+        ("A Short Rest", 3),
+    ]
+    assert chapters[0]["id"] == str(first.pk)
+    assert chapters[1]["id"] == str(second.pk)
+    assert _inserts(ctx, "tests_chapter") == 1
+    assert _updates(ctx, "tests_chapter") == 1
+
+
+@pytest.mark.django_db
+def test_upsert_forward_fk(graphql_client: GraphQLTestClient) -> None:
+    author = Author.objects.create(name="Herbert")
+    for title in ("Dune", "Dune Messiah"):
+        response = graphql_client.query(
+            CREATE_BOOK,
+            {"data": {"title": title, "author": {"upsert": {"name": "Herbert"}}}},
+        )
+        assert response.data is not None
+        assert response.data["createBook"]["author"]["id"] == str(author.pk)
+
+    response = graphql_client.query(
+        CREATE_BOOK,
+        {"data": {"title": "Foundation", "author": {"upsert": {"name": "Asimov"}}}},
+    )
+    assert response.data is not None
+    assert Author.objects.filter(name="Asimov").exists()
+    assert Author.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_upsert_matching_the_current_forward_fk_is_not_deleted(
+    graphql_client: GraphQLTestClient, book: Book
+) -> None:
+    author = book.author
+    response = graphql_client.query(
+        UPDATE_BOOK,
+        {"data": {"id": str(book.pk), "author": {"upsert": {"name": "Tolkien"}, "delete": True}}},
+    )
+    assert response.data is not None
+    assert response.data["updateBook"]["author"] == {"id": str(author.pk), "name": "Tolkien"}
+    assert Author.objects.filter(pk=author.pk).exists()
+
+    response = graphql_client.query(
+        UPDATE_BOOK,
+        {"data": {"id": str(book.pk), "author": {"upsert": {"name": "Lewis"}, "delete": True}}},
+    )
+    assert response.data is not None
+    assert response.data["updateBook"]["author"]["name"] == "Lewis"
+    assert not Author.objects.filter(pk=author.pk).exists()
+
+
+@pytest.mark.django_db
+def test_deleting_a_missing_forward_fk_is_rejected(graphql_client: GraphQLTestClient) -> None:
+    book = Book.objects.create(title="Anonymous")
+    response = graphql_client.query(
+        UPDATE_BOOK,
+        {"data": {"id": str(book.pk), "author": {"upsert": {"name": "Lewis"}, "delete": True}}},
+        assert_no_errors=False,
+    )
+    assert response.errors is not None
+    assert "Cannot delete non existing object" in response.errors[0]["message"]
+    assert not Author.objects.exists()
+
+
+@pytest.mark.django_db
+def test_upsert_selects_then_writes_before_django_5(
+    graphql_client: GraphQLTestClient, monkeypatch
+) -> None:
+    # Older versions leave the primary keys of `update_conflicts` bulk creates unset
+    monkeypatch.setattr(functions.django, "VERSION", (4, 2, 0, "final", 0))
+    existing = Tag.objects.create(name="fantasy")
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            CREATE_BOOK,
+            {
+                "data": {
+                    "title": "Earthsea",
+                    "tags": {
+                        "upsert": [
+                            {"objectData": {"name": "fantasy"}},
+                            {"objectData": {"name": "classic"}},
+                        ]
+                    },
+                }
+            },
+        )
+    assert response.data is not None
+    tags = {tag["name"]: tag["id"] for tag in response.data["createBook"]["tags"]}
+    assert tags["fantasy"] == str(existing.pk)
+    assert tags["classic"] == str(Tag.objects.get(name="classic").pk)
+    assert not any("ON CONFLICT" in query["sql"] for query in ctx.captured_queries)
+
+
+def test_upsert_requires_unique_fields() -> None:
+    assert upsert_fields(PlanNode("upsert", model=Tag, data={"name": "x"})) == ("name",)
+    declared = PlanNode("upsert", model=Chapter, data={}, upsert_fields=("book", "number"))
+    assert upsert_fields(declared) == ("book", "number")
+    with pytest.raises(SDJExtrasError, match="upsert_fields"):
+        upsert_fields(PlanNode("upsert", model=Chapter, data={"title": "x"}))
+
+
+@pytest.mark.django_db
+def test_set_many_to_many_applies_the_difference(
+    graphql_client: GraphQLTestClient, book: Book
+) -> None:
+    kept = Tag.objects.create(name="kept")
+    dropped = [Tag.objects.create(name=f"old-{i}") for i in range(200)]
+    added = [Tag.objects.create(name=f"new-{i}") for i in range(200)]
+    book.tags.add(kept, *dropped)
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            UPDATE_BOOK,
+            {"data": {"id": str(book.pk), "tags": {"set": [str(t.pk) for t in [kept, *added]]}}},
+        )
+    assert response.data is not None
+    assert {tag["name"] for tag in response.data["updateBook"]["tags"]} == {
+        "kept",
+        *(tag.name for tag in added),
+    }
+    assert _inserts(ctx, "tests_booktag") == 1
+    assert _deletes(ctx, "tests_booktag") == 1
+
+
+@pytest.mark.django_db
+def test_set_reverse_fk_applies_the_difference(graphql_client: GraphQLTestClient) -> None:
+    author = Author.objects.create(name="Pratchett")
+    kept, dropped = (Book.objects.create(title=t, author=author) for t in ("Mort", "Eric"))
+    moved = Book.objects.create(title="Sourcery", author=Author.objects.create(name="Other"))
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            UPDATE_AUTHOR,
+            {"data": {"id": str(author.pk), "books": {"set": [str(kept.pk), str(moved.pk)]}}},
+        )
+    assert response.data is not None
+    assert {book["title"] for book in response.data["updateAuthor"]["books"]} == {
+        "Mort",
+        "Sourcery",
+    }
+    dropped.refresh_from_db()
+    assert dropped.author is None
+    assert _updates(ctx, "tests_book") == 2
+
+
+@pytest.mark.django_db
+def test_set_cannot_be_combined_with_assign(graphql_client: GraphQLTestClient, book: Book) -> None:
+    tag = Tag.objects.create(name="new")
+    response = graphql_client.query(
+        UPDATE_BOOK,
+        {
+            "data": {
+                "id": str(book.pk),
+                "tags": {"set": [str(tag.pk)], "assign": [{"id": str(tag.pk)}]},
+            }
+        },
+        assert_no_errors=False,
+    )
+    assert response.errors is not None
+    assert "Cannot combine set with assign or remove" in response.errors[0]["message"]
+
+
+@pytest.mark.django_db
+def test_response_is_resolved_through_the_optimizer(graphql_client: GraphQLTestClient) -> None:
+    def create(count: int) -> int:
+        with CaptureQueriesContext(connection) as ctx:
+            response = graphql_client.query(
+                CREATE_AUTHOR,
+                {
+                    "data": {
+                        "name": f"Author of {count}",
+                        "books": {
+                            "create": [
+                                {
+                                    "title": f"Book {i}",
+                                    "chapters": {"create": [{"title": "One", "number": 1}]},
+                                }
+                                for i in range(count)
+                            ]
+                        },
+                    }
+                },
+            )
+        assert response.data is not None
+        assert len(response.data["createAuthor"]["books"]) == count
+        return len(ctx.captured_queries)
+
+    assert create(2) == create(8)
+
+
+def _selects_after_writes(ctx: CaptureQueriesContext) -> list[str]:
+    queries = [q["sql"] for q in ctx.captured_queries]
+    last_write = max(i for i, sql in enumerate(queries) if sql.startswith("INSERT"))
+    return [sql for sql in queries[last_write:] if sql.startswith("SELECT")]
+
+
+@pytest.mark.django_db
+def test_created_objects_are_resolved_from_memory(graphql_client: GraphQLTestClient) -> None:
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            CREATE_AUTHOR,
+            {
+                "data": {
+                    "name": "Le Guin",
+                    "profile": {"create": {"bio": "Portland"}},
+                    "books": {
+                        "create": [
+                            {
+                                "title": f"Earthsea {i}",
+                                "tags": {"create": [{"objectData": {"name": f"tag-{i}"}}]},
+                                "chapters": {"create": [{"title": "One", "number": 1}]},
+                                "comments": {"create": [{"body": "Great"}]},
+                            }
+                            for i in range(3)
+                        ]
+                    },
+                }
+            },
+        )
+    assert response.data is not None
+    author = response.data["createAuthor"]
+    assert author["profile"] == {"bio": "Portland"}
+    assert [book["tags"] for book in author["books"]] == [[{"name": f"tag-{i}"}] for i in range(3)]
+    assert all(book["chapters"] == [{"title": "One", "number": 1}] for book in author["books"])
+    assert all(book["comments"] == [{"body": "Great"}] for book in author["books"])
+    assert _selects_after_writes(ctx) == []
+
+
+@pytest.mark.django_db
+def test_relations_not_written_are_prefetched(graphql_client: GraphQLTestClient) -> None:
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            CREATE_AUTHOR,
+            {
+                "data": {
+                    "name": "Banks",
+                    "books": {"create": [{"title": f"Culture {i}"} for i in range(4)]},
+                }
+            },
+        )
+    assert response.data is not None
+    books = response.data["createAuthor"]["books"]
+    assert [book["title"] for book in books] == [f"Culture {i}" for i in range(4)]
+    assert all(book["tags"] == [] and book["chapters"] == [] for book in books)
+
+    # The profile, and the tags, chapters and comments of all the books at once
+    assert len(_selects_after_writes(ctx)) == 4
+
+
+@pytest.mark.parametrize(
+    ("selection", "expected"),
+    [
+        ('books(filters: {title: {exact: "Keep"}}) { title }', {"books": ["Keep"]}),
+        ("books(ordering: [{title: ASC}]) { title }", {"books": ["Drop", "Keep"]}),
+        (
+            (
+                'kept: books(filters: {title: {exact: "Keep"}}) { title } '
+                "ordered: books(ordering: [{title: ASC}]) { title }"
+            ),
+            {"kept": ["Keep"], "ordered": ["Drop", "Keep"]},
+        ),
+    ],
+)
+@pytest.mark.django_db
+def test_created_relations_keep_the_filters_and_ordering_of_their_field(
+    graphql_client: GraphQLTestClient, selection: str, expected: dict[str, list[str]]
+) -> None:
+    response = graphql_client.query(
+        f"""
+        mutation CreateAuthor($data: AuthorInput!) {{
+            createAuthor(data: $data) {{ {selection} }}
+        }}
+        """,
+        {"data": {"name": "Banks", "books": {"create": [{"title": "Keep"}, {"title": "Drop"}]}}},
+    )
+
+    assert response.data is not None
+    author = response.data["createAuthor"]
+    assert {key: [book["title"] for book in books] for key, books in author.items()} == expected
+
+
+CREATE_AUTHOR_LIMITED = """
+    mutation CreateAuthorLimited($data: AuthorInput!) {
+        createAuthorLimited(data: $data) {
+            name
+            books { title }
+        }
+    }
+"""
+
+
+@pytest.mark.django_db
+def test_measure_input_predicts_batched_statements() -> None:
+    tag = Tag.objects.create(name="classic")
+    data = AuthorInput(
+        name="Le Guin",
+        books=CRUDManyToOneCreateInput(
+            create=[
+                BookInput(
+                    title=f"Earthsea {i}",
+                    chapters=CRUDManyToOneCreateInput(
+                        create=[
+                            ChapterInput(title="One", number=1),
+                            ChapterInput(title="Two", number=2),
+                        ]
+                    ),
+                    tags=CRUDManyToManyCreateInput(assign=[CRUDManyToManyID(id=str(tag.pk))]),
+                )
+                for i in range(3)
+            ]
+        ),
+    )
+
+    with CaptureQueriesContext(connection) as ctx:
+        cost = measure_input(Author, data)
+
+    assert ctx.captured_queries == []
+    assert cost.nodes == 13
+    assert cost.depth == 3
+    # One insert for all the books and one for all the chapters, the tags are linked per book
+    # and loaded with one query
+    assert cost.statements == {"root": 1, "create": 2, "assign": 7}
+    assert cost.total_statements == 10
+
+
+@pytest.mark.django_db
+def test_mutation_limits_reject_before_any_query(graphql_client: GraphQLTestClient) -> None:
+    data = {
+        "name": "Le Guin",
+        "books": {"create": [{"title": f"Earthsea {i}"} for i in range(8)]},
+    }
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            CREATE_AUTHOR_LIMITED, {"data": data}, assert_no_errors=False
+        )
+
+    assert response.errors is not None
+    error = response.errors[0]
+    assert error["message"] == "Mutation input exceeds max_nodes: 9 > 8"
+    assert error["extensions"]["code"] == "MUTATION_LIMIT_EXCEEDED"
+    assert error["extensions"]["cost"]["nodes"] == 9
+    assert not [q for q in ctx.captured_queries if "tests_" in q["sql"]]
+    assert not Author.objects.exists()
+
+
+@pytest.mark.django_db
+def test_mutation_limits_reject_deep_inputs(graphql_client: GraphQLTestClient) -> None:
+    data = {
+        "name": "Le Guin",
+        "books": {
+            "create": [
+                {"title": "Earthsea", "chapters": {"create": [{"title": "One", "number": 1}]}}
+            ]
+        },
+    }
+    response = graphql_client.query(CREATE_AUTHOR_LIMITED, {"data": data}, assert_no_errors=False)
+
+    assert response.errors is not None
+    assert response.errors[0]["extensions"]["limit"] == "max_depth"
+    assert not Book.objects.exists()
+
+
+@pytest.mark.django_db
+def test_mutation_cost_is_exposed_to_hooks(graphql_client: GraphQLTestClient) -> None:
+    schema.measured_costs.clear()
+    response = graphql_client.query(
+        CREATE_AUTHOR_LIMITED,
+        {"data": {"name": "Le Guin", "books": {"create": [{"title": "Earthsea"}]}}},
+    )
+
+    assert response.data is not None
+    assert response.data["createAuthorLimited"]["books"] == [{"title": "Earthsea"}]
+    (cost,) = schema.measured_costs
+    assert (cost.nodes, cost.depth) == (2, 2)
+
+
+@pytest.mark.django_db
+def test_mutation_cost_is_measured_on_demand(
+    graphql_client: GraphQLTestClient, monkeypatch
+) -> None:
+    measured = []
+    measure_input = field_extensions.measure_input
+    monkeypatch.setattr(
+        field_extensions,
+        "measure_input",
+        lambda model, data: measured.append(model) or measure_input(model, data),
+    )
+    data = {"name": "Le Guin", "books": {"create": [{"title": "Earthsea"}]}}
+
+    # Neither limits nor hooks read the cost
+    graphql_client.query(CREATE_AUTHOR_PROFILED, {"data": data})
+    assert measured == []
+
+    # The limits and the hook share one measurement, forgotten once resolved
+    graphql_client.query(CREATE_AUTHOR_LIMITED, {"data": {**data, "name": "Banks"}})
+    assert measured == [Author]
+    assert mutation_cost() is None
+
+
+CREATE_AUTHOR_PROFILED = """
+    mutation CreateAuthorProfiled($data: AuthorInput!) {
+        createAuthorProfiled(data: $data) {
+            name
+            books { title chapters { title } }
+        }
+    }
+"""
+
+
+@pytest.mark.django_db
+def test_mutation_profiles_count_statements_per_phase(graphql_client: GraphQLTestClient) -> None:
+    schema.profiles.clear()
+    response = graphql_client.query(
+        CREATE_AUTHOR_PROFILED,
+        {
+            "data": {
+                "name": "Le Guin",
+                "books": {
+                    "create": [
+                        {
+                            "title": "Earthsea",
+                            "chapters": {"create": [{"title": "Warriors", "number": 1}]},
+                        }
+                    ]
+                },
+            }
+        },
+    )
+
+    # Not exposed unless DEBUG is on
+    assert response.extensions is None
+    (profile,) = schema.profiles
+    assert profile["operation"] == "CreateAuthorProfiled"
+    assert profile["field"] == "createAuthorProfiled"
+    phases = profile["phases"]
+    # The schema's inputs have no hooks to validate or check permissions with
+    assert list(phases) == ["hooks", "planning", "execution", "response"]
+    # The `pre` hook counts the authors
+    assert phases["hooks"]["select"] == 1
+    assert phases["execution"]["insert"] == 3
+    # Created objects are resolved from what was written
+    assert phases["response"]["select"] == 0
+    assert profile["total"]["insert"] == 3
+    assert profile["total"]["select"] == 1
+    assert all(entry["ms"] >= 0 for entry in phases.values())
+
+
+@pytest.mark.django_db
+def test_mutation_profiles_are_exposed_in_debug(
+    graphql_client: GraphQLTestClient, settings
+) -> None:
+    settings.DEBUG = True
+    author = Author.objects.create(name="Le Guin")
+    Book.objects.create(title="Earthsea", author=author)
+
+    response = graphql_client.query(
+        UPDATE_AUTHOR,
+        {"data": {"id": author.pk, "name": "Ursula K. Le Guin"}},
+    )
+
+    assert response.extensions is not None
+    (profile,) = response.extensions["mutationProfiles"]
+    assert profile["field"] == "updateAuthor"
+    # The author is loaded and updated by the mutation, then refetched with its books
+    assert profile["phases"]["execution"]["select"] == 1
+    assert profile["phases"]["execution"]["update"] == 1
+    assert profile["phases"]["response"]["select"] == 2
+
+
+@pytest.mark.django_db
+def test_queries_outside_of_mutations_are_not_profiled(graphql_client: GraphQLTestClient) -> None:
+    schema.profiles.clear()
+    graphql_client.query("query { me { id } }")
+    Author.objects.create(name="Le Guin")
+
+    assert schema.profiles == []
+
+
+@pytest.mark.django_db
+def test_statements_are_only_counted_while_profiling(graphql_client: GraphQLTestClient) -> None:
+    author = Author.objects.create(name="Le Guin")
+    graphql_client.query(UPDATE_AUTHOR, {"data": {"id": author.pk, "name": "Ursula K. Le Guin"}})
+
+    assert instrumentation._count_statement not in connection.execute_wrappers  # noqa: SLF001
+
+
+UPDATE_BOOK_BATCHED = """
+    mutation UpdateBookBatched($data: BookPartial!) {
+        updateBookBatched(data: $data) {
+            id
+            chapters { title }
+            tags { name }
+            comments { body }
+        }
+    }
+"""
+
+
+@pytest.mark.django_db
+def test_batch_size_bounds_the_rows_of_each_statement(
+    graphql_client: GraphQLTestClient, book: Book
+) -> None:
+    other = Book.objects.create(title="Other")
+    moved = [Chapter.objects.create(book=other, title=f"Moved {i}", number=i) for i in range(5)]
+    tags = [Tag.objects.create(name=f"tag {i}") for i in range(5)]
+    loose = [Comment.objects.create(body=f"Loose {i}") for i in range(5)]
+
+    with CaptureQueriesContext(connection) as ctx:
+        response = graphql_client.query(
+            UPDATE_BOOK_BATCHED,
+            {
+                "data": {
+                    "id": str(book.pk),
+                    "chapters": {
+                        "create": [{"title": f"New {i}", "number": 10 + i} for i in range(5)],
+                        "assign": [str(chapter.pk) for chapter in moved],
+                    },
+                    "tags": {"assign": [{"id": str(tag.pk)} for tag in tags]},
+                    "comments": {"assign": [str(comment.pk) for comment in loose]},
+                }
+            },
+        )
+
+    assert response.data is not None
+    data = response.data["updateBookBatched"]
+    assert len(data["chapters"]) == 12
+    assert len(data["tags"]) == 7
+    assert len(data["comments"]) == 6
+    # 5 rows in chunks of 2
+    assert _inserts(ctx, "tests_chapter") == 3
+    assert _updates(ctx, "tests_chapter") == 3
+    assert _inserts(ctx, "tests_booktag") == 3
+    assert _updates(ctx, "tests_comment") == 3
+
+
+@pytest.mark.django_db
+def test_executed_nodes_release_their_values(book: Book) -> None:
+    data = BookInput(
+        title="Dune",
+        chapters=CRUDManyToOneCreateInput(create=[ChapterInput(title="Dune", number=1)]),
+    )
+    rel = PlanNode()
+    rabbit_hole(Book, data, rel, instances=InstanceCache())
+    (chapter,) = rel.after
+
+    kill_a_rabbit(
+        rel,
+        None,
+        False,
+        is_root=True,
+        next_=lambda source, info, data: Book.objects.create(title=data.title),
+        ni=data,
+        batch_size=1,
+    )
+
+    assert chapter.instance.book == rel.instance
+    assert chapter.data is None
+    assert rel.data is None
+
+
+@pytest.fixture
+def chapter_overrides(monkeypatch):
+    """Record the `save()` and `delete()` calls of chapters, overriding both methods."""
+    calls = []
+
+    def save(self, *args, **kwargs):
+        calls.append(("save", self.title))
+        return models.Model.save(self, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        calls.append(("delete", self.title))
+        return models.Model.delete(self, *args, **kwargs)
+
+    functions._overrides.cache_clear()  # noqa: SLF001
+    monkeypatch.setattr(Chapter, "save", save, raising=False)
+    monkeypatch.setattr(Chapter, "delete", delete, raising=False)
+    yield calls
+    monkeypatch.undo()
+    functions._overrides.cache_clear()  # noqa: SLF001
+
+
+@pytest.mark.django_db
+def test_save_and_delete_overrides_are_called_in_auto_mode(
+    graphql_client: GraphQLTestClient, book: Book, chapter_overrides: list
+) -> None:
+    first, second = book.chapters.order_by("number")
+    with CaptureQueriesContext(connection) as ctx:
+        graphql_client.query(
+            UPDATE_BOOK,
+            {
+                "data": {
+                    "id": str(book.pk),
+                    "chapters": {
+                        "create": [{"title": "Three"}, {"title": "Four"}],
+                        "update": [{"id": str(first.pk), "title": "Renamed"}],
+                        "remove": [{"id": str(second.pk), "delete": True}],
+                    },
+                }
+            },
+        )
+
+    assert sorted(chapter_overrides) == [
+        ("delete", "Roast Mutton"),
+        ("save", "Four"),
+        ("save", "Renamed"),
+        ("save", "Three"),
+    ]
+    assert _inserts(ctx, "tests_chapter") == 2
+    assert list(book.chapters.values_list("title", flat=True).order_by("title")) == [
+        "Four",
+        "Renamed",
+        "Three",
+    ]
+
+
+@pytest.mark.django_db
+def test_bulk_always_skips_receivers_and_overrides(
+    graphql_client: GraphQLTestClient, book: Book, chapter_overrides: list
+) -> None:
+    saved = []
+
+    def receiver(sender, instance, **kwargs):
+        saved.append(instance.title)
+
+    post_save.connect(receiver, sender=Chapter)
+    try:
+        with CaptureQueriesContext(connection) as ctx:
+            graphql_client.query(
+                """
+                mutation UpdateBookBulk($data: BookPartial!) {
+                    updateBookBulk(data: $data) { id }
+                }
+                """,
+                {
+                    "data": {
+                        "id": str(book.pk),
+                        "chapters": {"create": [{"title": "Three"}, {"title": "Four"}]},
+                    }
+                },
+            )
+    finally:
+        post_save.disconnect(receiver, sender=Chapter)
+
+    assert saved == []
+    assert chapter_overrides == []
+    assert _inserts(ctx, "tests_chapter") == 1
+
+
+def test_bulk_modes() -> None:
+    assert functions.can_bulk_create(Chapter)
+    with functions.bulk_mode("never"):
+        assert not functions.can_bulk_create(Chapter)
+        assert not functions.can_bulk_save(Chapter)
+        assert not functions.can_bulk_delete(Chapter)
+    with pytest.raises(SDJExtrasError, match="Unknown bulk mode"):
+        with_cud_relationships(bulk="sometimes")